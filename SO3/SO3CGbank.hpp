@@ -15,6 +15,7 @@
 #include "SO3group.hpp"
 #include "SO3type.hpp"
 #include "SO3CGindex.hpp"
+#include "SO3CGsparse.hpp"
 
 namespace GElib{
 
@@ -25,6 +26,7 @@ namespace GElib{
 
     unordered_map<SO3CGindex,FTENSOR> coeffsf;
     unordered_map<SO3CGindex,FTENSOR> coeffsf_gpu;
+    unordered_map<SO3CGindex,SO3CGsparse> sparsef;
 
     template<typename TYPE>
     cnine::TensorView<TYPE>& get(const int l1, const int l2, const int l, const int dev=0){
@@ -49,6 +51,19 @@ namespace GElib{
       return *(new cnine::TensorView<TYPE>());
     }
 
+    template<typename TYPE>
+    const SO3CGsparse& get_sparse(const int l1, const int l2, const int l){
+      SO3CGindex ix(l1,l2,l);
+      if constexpr(std::is_same<TYPE,float>::value){
+	auto it=sparsef.find(ix);
+	if(it!=sparsef.end()) return it->second;
+	sparsef.emplace(ix,SO3CGsparse(l1,l2,l,get<float>(l1,l2,l)));
+	return sparsef.at(ix);
+      }
+      GELIB_ERROR("Currenly only single precision CG matrices supported.");
+      return *(new SO3CGsparse(l1,l2,l,FTENSOR({2*l1+1,2*l2+1},0,0)));
+    }
+
   private:
     
     FTENSOR CGmatrix(const int l1, const int l2, const int l){
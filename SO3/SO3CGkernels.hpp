@@ -0,0 +1,199 @@
+// This file is part of GElib, a C++/CUDA library for group
+// equivariant tensor operations.
+//
+// Copyright (c) 2024, Imre Risi Kondor
+//
+// This Source Code Form is subject to the terms of the Mozilla
+// Public License v. 2.0. If a copy of the MPL was not distributed
+// with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+#ifndef _SO3CGkernels
+#define _SO3CGkernels
+
+#include "GElib_base.hpp"
+
+
+namespace GElib{
+
+
+  // Inner loops of the CPU CG-product kernels. Each function processes a single (m1,m2) pair,
+  // i.e., one row of x, one row of y and one row of r, as a batched outer product over the
+  // channel block. Complex numbers are handled as interleaved (re,im) pairs of TYPE so that
+  // the innermost loops over channels are plain multiply-adds that the compiler can vectorize.
+  // All strides are in units of TYPE, i.e., twice the complex strides.
+
+  template<typename TYPE>
+  class SO3CGkernels{
+  public:
+
+
+    // r(offs+n1*N2+n2) += c*x(n1)*y(n2)
+    static void add_outer(TYPE* r, const int rs, const TYPE* x, const int xs, const TYPE* y, const int ys,
+      const TYPE c, const int N1, const int N2){
+      for(int n1=0; n1<N1; n1++){
+	const TYPE ar=c*x[n1*xs];
+	const TYPE ai=c*x[n1*xs+1];
+	TYPE* rp=r+n1*N2*rs;
+	if(rs==2 && ys==2){
+	  for(int n2=0; n2<2*N2; n2+=2){
+	    const TYPE yr=y[n2];
+	    const TYPE yi=y[n2+1];
+	    rp[n2]+=ar*yr-ai*yi;
+	    rp[n2+1]+=ar*yi+ai*yr;
+	  }
+	}else{
+	  for(int n2=0; n2<N2; n2++){
+	    const TYPE yr=y[n2*ys];
+	    const TYPE yi=y[n2*ys+1];
+	    rp[n2*rs]+=ar*yr-ai*yi;
+	    rp[n2*rs+1]+=ar*yi+ai*yr;
+	  }
+	}
+      }
+    }
+
+
+    // x(n1) += c * sum_n2 r(offs+n1*N2+n2)*conj(y(n2))
+    static void add_outer_back0(TYPE* x, const int xs, const TYPE* r, const int rs, const TYPE* y, const int ys,
+      const TYPE c, const int N1, const int N2){
+      for(int n1=0; n1<N1; n1++){
+	const TYPE* rp=r+n1*N2*rs;
+	TYPE tr=0;
+	TYPE ti=0;
+	if(rs==2 && ys==2){
+	  for(int n2=0; n2<2*N2; n2+=2){
+	    const TYPE yr=y[n2];
+	    const TYPE yi=y[n2+1];
+	    tr+=rp[n2]*yr+rp[n2+1]*yi;
+	    ti+=rp[n2+1]*yr-rp[n2]*yi;
+	  }
+	}else{
+	  for(int n2=0; n2<N2; n2++){
+	    const TYPE yr=y[n2*ys];
+	    const TYPE yi=y[n2*ys+1];
+	    tr+=rp[n2*rs]*yr+rp[n2*rs+1]*yi;
+	    ti+=rp[n2*rs+1]*yr-rp[n2*rs]*yi;
+	  }
+	}
+	x[n1*xs]+=c*tr;
+	x[n1*xs+1]+=c*ti;
+      }
+    }
+
+
+    // y(n2) += c * sum_n1 r(offs+n1*N2+n2)*conj(x(n1))
+    static void add_outer_back1(TYPE* y, const int ys, const TYPE* r, const int rs, const TYPE* x, const int xs,
+      const TYPE c, const int N1, const int N2){
+      for(int n1=0; n1<N1; n1++){
+	const TYPE ar=c*x[n1*xs];
+	const TYPE ai=-c*x[n1*xs+1];
+	const TYPE* rp=r+n1*N2*rs;
+	if(rs==2 && ys==2){
+	  for(int n2=0; n2<2*N2; n2+=2){
+	    const TYPE gr=rp[n2];
+	    const TYPE gi=rp[n2+1];
+	    y[n2]+=ar*gr-ai*gi;
+	    y[n2+1]+=ar*gi+ai*gr;
+	  }
+	}else{
+	  for(int n2=0; n2<N2; n2++){
+	    const TYPE gr=rp[n2*rs];
+	    const TYPE gi=rp[n2*rs+1];
+	    y[n2*ys]+=ar*gr-ai*gi;
+	    y[n2*ys+1]+=ar*gi+ai*gr;
+	  }
+	}
+      }
+    }
+
+
+    // Both of the above at once, reading each element of r only once:
+    // xg(n1) += c * sum_n2 r(offs+n1*N2+n2)*conj(y(n2)) and yg(n2) += c * sum_n1 r(offs+n1*N2+n2)*conj(x(n1))
+    static void add_outer_back01(TYPE* xg, const int xgs, TYPE* yg, const int ygs, const TYPE* r, const int rs,
+      const TYPE* x, const int xs, const TYPE* y, const int ys, const TYPE c, const int N1, const int N2){
+      for(int n1=0; n1<N1; n1++){
+	const TYPE ar=c*x[n1*xs];
+	const TYPE ai=-c*x[n1*xs+1];
+	const TYPE* rp=r+n1*N2*rs;
+	TYPE tr=0;
+	TYPE ti=0;
+	if(rs==2 && ys==2 && ygs==2){
+	  for(int n2=0; n2<2*N2; n2+=2){
+	    const TYPE gr=rp[n2];
+	    const TYPE gi=rp[n2+1];
+	    const TYPE yr=y[n2];
+	    const TYPE yi=y[n2+1];
+	    tr+=gr*yr+gi*yi;
+	    ti+=gi*yr-gr*yi;
+	    yg[n2]+=ar*gr-ai*gi;
+	    yg[n2+1]+=ar*gi+ai*gr;
+	  }
+	}else{
+	  for(int n2=0; n2<N2; n2++){
+	    const TYPE gr=rp[n2*rs];
+	    const TYPE gi=rp[n2*rs+1];
+	    const TYPE yr=y[n2*ys];
+	    const TYPE yi=y[n2*ys+1];
+	    tr+=gr*yr+gi*yi;
+	    ti+=gi*yr-gr*yi;
+	    yg[n2*ygs]+=ar*gr-ai*gi;
+	    yg[n2*ygs+1]+=ar*gi+ai*gr;
+	  }
+	}
+	xg[n1*xgs]+=c*tr;
+	xg[n1*xgs+1]+=c*ti;
+      }
+    }
+
+
+    // r(offs+n) += c*x(n)*y(n)
+    static void add_diag(TYPE* r, const int rs, const TYPE* x, const int xs, const TYPE* y, const int ys,
+      const TYPE c, const int N){
+      for(int n=0; n<N; n++){
+	const TYPE ar=c*x[n*xs];
+	const TYPE ai=c*x[n*xs+1];
+	const TYPE yr=y[n*ys];
+	const TYPE yi=y[n*ys+1];
+	r[n*rs]+=ar*yr-ai*yi;
+	r[n*rs+1]+=ar*yi+ai*yr;
+      }
+    }
+
+
+    // x(n) += c*r(offs+n)*conj(y(n)), used for both the back0 and back1 passes
+    static void add_diag_back(TYPE* x, const int xs, const TYPE* r, const int rs, const TYPE* y, const int ys,
+      const TYPE c, const int N){
+      for(int n=0; n<N; n++){
+	const TYPE gr=c*r[n*rs];
+	const TYPE gi=c*r[n*rs+1];
+	const TYPE yr=y[n*ys];
+	const TYPE yi=y[n*ys+1];
+	x[n*xs]+=gr*yr+gi*yi;
+	x[n*xs+1]+=gi*yr-gr*yi;
+      }
+    }
+
+
+    // xg(n) += c*r(offs+n)*conj(y(n)) and yg(n) += c*r(offs+n)*conj(x(n)), reading r only once
+    static void add_diag_back01(TYPE* xg, const int xgs, TYPE* yg, const int ygs, const TYPE* r, const int rs,
+      const TYPE* x, const int xs, const TYPE* y, const int ys, const TYPE c, const int N){
+      for(int n=0; n<N; n++){
+	const TYPE gr=c*r[n*rs];
+	const TYPE gi=c*r[n*rs+1];
+	const TYPE xr=x[n*xs];
+	const TYPE xi=x[n*xs+1];
+	const TYPE yr=y[n*ys];
+	const TYPE yi=y[n*ys+1];
+	xg[n*xgs]+=gr*yr+gi*yi;
+	xg[n*xgs+1]+=gi*yr-gr*yi;
+	yg[n*ygs]+=gr*xr+gi*xi;
+	yg[n*ygs+1]+=gi*xr-gr*xi;
+      }
+    }
+
+  };
+
+}
+
+#endif
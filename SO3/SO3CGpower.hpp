@@ -0,0 +1,388 @@
+// This file is part of GElib, a C++/CUDA library for group
+// equivariant tensor operations.
+//
+// Copyright (c) 2025, Imre Risi Kondor
+//
+// This Source Code Form is subject to the terms of the Mozilla
+// Public License v. 2.0. If a copy of the MPL was not distributed
+// with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+#ifndef _GElibSO3CGpower
+#define _GElibSO3CGpower
+
+#include "GElib_base.hpp"
+#include "SO3part.hpp"
+#include "SO3type.hpp"
+
+
+namespace GElib{
+
+
+  // Precomputed plan for the symmetric power of order nu of SO3vecs of a given type, i.e., the iterated
+  // CG-product (((x*x)*x)...*x) in which every factor is taken from the same channel of x, as in the
+  // body order nu features of ACE/MACE type models.
+  //
+  // A path is a sorted sequence of input irreps l_1<=...<=l_nu together with a chain of intermediate irreps
+  // L_2,...,L_nu=l. The generalized coupling coefficients of a path,
+  //   U[m_1,...,m_nu,M]=sum_{M_2,...,M_{nu-1}} C(l_1,l_2,L_2)[m_1,m_2,M_2] C(L_2,l_3,L_3)[M_2,m_3,M_3] ...
+  // are contracted from the sparse CG coefficients in SO3_CGbank once, when the plan is constructed. Since
+  // the factors of each term commute, index tuples that are permutations of each other are merged into a
+  // single monomial of the (stacked) rows of x, and each distinct monomial is evaluated once and scattered
+  // to every path and every component M that it contributes to. Paths whose coefficients cancel out
+  // after symmetrization (such as l*l->l' with l' odd) are dropped.
+  //
+  // Every part of x must have the same number of channels n, and part l of the result has n channels
+  // for each path ending in l, in the order the paths are listed by get_paths().
+
+  class SO3CGpower{
+  public:
+
+    typedef complex<float> TYPE;
+    typedef SO3part<float> GPART;
+    typedef cnine::TensorView<TYPE> TENSOR;
+
+    struct Path{
+      vector<int> ls;
+      vector<int> Ls;
+      int offs=0;
+    };
+
+    SO3type tau_x;
+    SO3type tau;
+    int nu;
+    int maxl;
+    int nc=0;
+
+    vector<Path> paths;
+
+
+  private:
+
+    struct Target{
+      int l;
+      int m;
+      int offs;
+      float c;
+    };
+
+    vector<int> in_ls;
+    vector<int> in_offs;
+    vector<int> out_ls;
+    int nrows=0;
+
+    // the monomials: rows[i*nu..(i+1)*nu) are the stacked rows of the factors of monomial i,
+    // and [tptr[i],tptr[i+1]) is the range of its targets
+    vector<int> rows;
+    vector<int> tptr;
+    vector<int> tpart;
+    vector<int> tm;
+    vector<int> toffs;
+    vector<float> tc;
+
+
+  public: // ---- Constructors ------------------------------------------------------------------------------
+
+
+    SO3CGpower(const SO3type& _tau_x, const int _nu, const int _maxl=-1):
+      tau_x(_tau_x),
+      nu(_nu),
+      maxl(_maxl){
+
+      if(nu<1) GELIB_ERROR("the order of a symmetric power must be at least 1.");
+      if(tau_x.parts.size()==0) GELIB_ERROR("cannot take the symmetric power of an empty type.");
+      nc=tau_x.parts.begin()->second;
+      for(auto& p:tau_x.parts){
+	if(p.second!=nc)
+	  GELIB_ERROR("the symmetric power requires all parts to have the same number of channels, but the type is "+tau_x.str()+".");
+	in_ls.push_back(p.first);
+	in_offs.push_back(nrows);
+	nrows+=2*p.first+1;
+      }
+
+      map<int,int> count;
+      map<vector<int>,vector<Target> > monomials;
+
+      // partial couplings (m_1,...,m_k,M)->U
+      std::function<void(Path&, const int, const map<vector<int>,float>&)> extend=
+	[&](Path& path, const int L, const map<vector<int>,float>& U){
+	if(path.ls.size()==nu){
+	  if(maxl<0 || L<=maxl) add_path(path,L,U,count,monomials);
+	  return;
+	}
+	for(int i=std::lower_bound(in_ls.begin(),in_ls.end(),path.ls.back())-in_ls.begin(); i<in_ls.size(); i++){
+	  const int l=in_ls[i];
+	  for(int L2=std::abs(L-l); L2<=L+l; L2++){
+	    auto& C=GPART::CGcoeffs(L,l,L2);
+	    map<vector<int>,float> V;
+	    for(auto& t:U){
+	      vector<int> key(t.first);
+	      const int M=key.back();
+	      key.push_back(0);
+	      for(int j=0; j<C.size(); j++){
+		if(C.m1[j]!=M) continue;
+		key[key.size()-2]=C.m2[j];
+		key.back()=C.m[j];
+		V[key]+=t.second*C.c[j];
+	      }
+	    }
+	    path.ls.push_back(l);
+	    path.Ls.push_back(L2);
+	    extend(path,L2,V);
+	    path.ls.pop_back();
+	    path.Ls.pop_back();
+	  }
+	}
+      };
+
+      for(auto l:in_ls){
+	Path path;
+	path.ls.push_back(l);
+	map<vector<int>,float> U;
+	for(int m=0; m<2*l+1; m++)
+	  U[{m,m}]=1;
+	extend(path,l,U);
+      }
+
+      for(auto& p:count){
+	tau.parts[p.first]=p.second*nc;
+	out_ls.push_back(p.first);
+      }
+      map<int,int> out_ix;
+      for(int i=0; i<out_ls.size(); i++)
+	out_ix[out_ls[i]]=i;
+
+      tptr.push_back(0);
+      for(auto& p:monomials){
+	rows.insert(rows.end(),p.first.begin(),p.first.end());
+	for(auto& t:p.second){
+	  tpart.push_back(out_ix[t.l]);
+	  tm.push_back(t.m);
+	  toffs.push_back(t.offs);
+	  tc.push_back(t.c);
+	}
+	tptr.push_back(tc.size());
+      }
+    }
+
+
+  private:
+
+    // Symmetrize the coefficients of a completed path and, if they do not all vanish, register the path
+    // and add its terms to the monomials
+    void add_path(Path& path, const int l, const map<vector<int>,float>& U,
+      map<int,int>& count, map<vector<int>,vector<Target> >& monomials){
+
+      map<vector<int>,float> S;
+      for(auto& t:U){
+	vector<int> key(nu+1);
+	for(int j=0; j<nu; j++)
+	  key[j]=in_offs[std::lower_bound(in_ls.begin(),in_ls.end(),path.ls[j])-in_ls.begin()]+t.first[j];
+	std::sort(key.begin(),key.begin()+nu);
+	key[nu]=t.first[nu];
+	S[key]+=t.second;
+      }
+
+      bool nonzero=false;
+      for(auto& s:S)
+	if(std::abs(s.second)>tolerance) nonzero=true;
+      if(!nonzero) return;
+
+      path.offs=(count[l]++)*nc;
+      paths.push_back(path);
+      for(auto& s:S){
+	if(std::abs(s.second)<=tolerance) continue;
+	monomials[vector<int>(s.first.begin(),s.first.begin()+nu)].push_back({l,s.first[nu],path.offs,s.second});
+      }
+    }
+
+    static constexpr float tolerance=1e-5;
+
+
+  public: // ---- Access -------------------------------------------------------------------------------------
+
+
+    SO3type get_tau() const{
+      return tau;
+    }
+
+    int npaths() const{
+      return paths.size();
+    }
+
+    int nmonomials() const{
+      return tptr.size()-1;
+    }
+
+    // The (l_1,...,l_nu) and (L_2,...,L_nu) sequences of each path, in order
+    vector<pair<vector<int>,vector<int> > > get_paths() const{
+      vector<pair<vector<int>,vector<int> > > R;
+      for(auto& p:paths)
+	R.push_back(make_pair(p.ls,p.Ls));
+      return R;
+    }
+
+
+  public: // ---- Execution ----------------------------------------------------------------------------------
+
+
+    template<typename GVEC>
+    GVEC operator()(const GVEC& x) const{
+      GVEC R(x.getb(),x.gdims(),tau,0,x.get_dev());
+      add(R,x);
+      return R;
+    }
+
+    template<typename GVEC>
+    void add(const GVEC& r, const GVEC& x) const{
+      vector<TENSOR> _r, _x;
+      views(_r,_x,r,x);
+      for_each_task(_x[0].dims[0],[&](const int c, const int a, const int e){
+	  add_kernel(_r,_x,c,a,e);});
+    }
+
+    // xg+=the gradient of the symmetric power with respect to x, given the gradient g of the output
+    template<typename GVEC>
+    void add_back(const GVEC& xg, const GVEC& g, const GVEC& x) const{
+      vector<TENSOR> _g, _x, _xg;
+      views(_g,_x,g,x);
+      for(auto l:in_ls){
+	_xg.push_back(GPART::cell_rows(xg.part(l)));
+	if(_xg.back().dims!=_x[_xg.size()-1].dims)
+	  GELIB_ERROR("the gradient "+xg.part(l).dims.str()+" does not match the input "+x.part(l).dims.str());
+      }
+      for_each_task(_x[0].dims[0],[&](const int c, const int a, const int e){
+	  add_back_kernel(_xg,_g,_x,c,a,e);});
+    }
+
+
+  private:
+
+    template<typename GVEC>
+    void views(vector<TENSOR>& _r, vector<TENSOR>& _x, const GVEC& r, const GVEC& x) const{
+      if(x.get_tau().parts!=tau_x.parts || r.get_tau().parts!=tau.parts)
+	GELIB_ERROR("the types of the arguments do not match the types that this symmetric power was constructed for");
+      if(r.get_dev()>0 || x.get_dev()>0)
+	GELIB_ERROR("the symmetric power is only implemented on the CPU");
+      for(auto l:in_ls) _x.push_back(GPART::cell_rows(x.part(l)));
+      for(auto l:out_ls) _r.push_back(GPART::cell_rows(r.part(l)));
+      for(auto& p:_r)
+	if(p.dims[0]!=_x[0].dims[0])
+	  GELIB_ERROR("the batch and grid dimensions of the output do not match those of the input");
+    }
+
+    // Each task is a tile of the channels of one cell, so that different tasks write to disjoint
+    // parts of the output in both the forward and the backward pass
+    void for_each_task(const int ncells, const std::function<void(const int, const int, const int)>& lambda) const{
+      const int ntiles=std::max(1,std::min(nc,(get_nthreads()+ncells-1)/ncells));
+      const int tile=(nc+ntiles-1)/ntiles;
+      parallel_for(ncells*ntiles,[&](const int k){
+	  const int a=(k%ntiles)*tile;
+	  if(a<nc) lambda(k/ntiles,a,std::min(nc,a+tile));});
+    }
+
+    // Pointers to channel a of each of the stacked rows of cell c of x
+    void row_pointers(vector<TYPE*>& xrow, vector<int>& xs, const vector<TENSOR>& x, const int c, const int a) const{
+      for(auto& p:x)
+	for(int m=0; m<p.dims[1]; m++){
+	  xrow.push_back(p.mem()+c*p.strides[0]+m*p.strides[1]+a*p.strides[2]);
+	  xs.push_back(p.strides[2]);
+	}
+    }
+
+    // r[l][M,offs+u]+=c*x[row_1,u]*...*x[row_nu,u] for the channels u in [a,e) of cell c
+    void add_kernel(const vector<TENSOR>& r, const vector<TENSOR>& x, const int c, const int a, const int e) const{
+      const int n=e-a;
+      vector<TYPE*> xrow;
+      vector<int> xs;
+      row_pointers(xrow,xs,x,c,a);
+      vector<TYPE> P(n);
+      for(int i=0; i<tptr.size()-1; i++){
+	const int* row=&rows[i*nu];
+	for(int u=0; u<n; u++) P[u]=xrow[row[0]][u*xs[row[0]]];
+	for(int j=1; j<nu; j++){
+	  const TYPE* xp=xrow[row[j]];
+	  const int s=xs[row[j]];
+	  for(int u=0; u<n; u++) P[u]*=xp[u*s];
+	}
+	for(int t=tptr[i]; t<tptr[i+1]; t++){
+	  auto& R=r[tpart[t]];
+	  TYPE* rp=R.mem()+c*R.strides[0]+tm[t]*R.strides[1]+(toffs[t]+a)*R.strides[2];
+	  const int s=R.strides[2];
+	  const float cc=tc[t];
+	  for(int u=0; u<n; u++) rp[u*s]+=cc*P[u];
+	}
+      }
+    }
+
+    // xg[row_j,u]+=G[u]*conj(prod_{i!=j} x[row_i,u]), where G[u] is the sum of c*g[l][M,offs+u] over
+    // the targets of the monomial
+    void add_back_kernel(const vector<TENSOR>& xg, const vector<TENSOR>& g, const vector<TENSOR>& x,
+      const int c, const int a, const int e) const{
+      const int n=e-a;
+      vector<TYPE*> xrow, xgrow;
+      vector<int> xs, xgs;
+      row_pointers(xrow,xs,x,c,a);
+      row_pointers(xgrow,xgs,xg,c,a);
+      vector<TYPE> G(n), Q(n);
+      for(int i=0; i<tptr.size()-1; i++){
+	const int* row=&rows[i*nu];
+	for(int u=0; u<n; u++) G[u]=0;
+	for(int t=tptr[i]; t<tptr[i+1]; t++){
+	  auto& R=g[tpart[t]];
+	  const TYPE* gp=R.mem()+c*R.strides[0]+tm[t]*R.strides[1]+(toffs[t]+a)*R.strides[2];
+	  const int s=R.strides[2];
+	  const float cc=tc[t];
+	  for(int u=0; u<n; u++) G[u]+=cc*gp[u*s];
+	}
+	for(int j=0; j<nu; j++){
+	  for(int u=0; u<n; u++) Q[u]=G[u];
+	  for(int k=0; k<nu; k++){
+	    if(k==j) continue;
+	    const TYPE* xp=xrow[row[k]];
+	    const int s=xs[row[k]];
+	    for(int u=0; u<n; u++) Q[u]*=std::conj(xp[u*s]);
+	  }
+	  TYPE* xp=xgrow[row[j]];
+	  const int s=xgs[row[j]];
+	  for(int u=0; u<n; u++) xp[u*s]+=Q[u];
+	}
+      }
+    }
+
+
+  public: // ---- I/O ----------------------------------------------------------------------------------------
+
+
+    string classname() const{
+      return "GElib::SO3CGpower";
+    }
+
+    string repr() const{
+      ostringstream oss;
+      oss<<"<SO3CGpower "<<tau_x.str()<<"^"<<nu<<" -> "<<tau.str();
+      oss<<" paths="<<npaths()<<" monomials="<<nmonomials()<<">";
+      return oss.str();
+    }
+
+    string str(const string indent="") const{
+      ostringstream oss;
+      for(auto& p:paths){
+	oss<<indent<<"(";
+	for(int j=0; j<p.ls.size(); j++) oss<<p.ls[j]<<(j<p.ls.size()-1?",":"");
+	oss<<")";
+	for(auto L:p.Ls) oss<<"->"<<L;
+	oss<<" offset="<<p.offs<<endl;
+      }
+      return oss.str();
+    }
+
+    friend ostream& operator<<(ostream& stream, const SO3CGpower& x){
+      stream<<x.str(); return stream;
+    }
+
+  };
+
+}
+
+#endif
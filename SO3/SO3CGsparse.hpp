@@ -0,0 +1,84 @@
+// This file is part of GElib, a C++/CUDA library for group
+// equivariant tensor operations.
+//
+// Copyright (c) 2024, Imre Risi Kondor
+//
+// This Source Code Form is subject to the terms of the Mozilla
+// Public License v. 2.0. If a copy of the MPL was not distributed
+// with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+#ifndef _SO3CGsparse
+#define _SO3CGsparse
+
+#include "GElib_base.hpp"
+#include "TensorView.hpp"
+
+
+namespace GElib{
+
+
+  // Compact form of the (l1,l2,l) Clebsch-Gordan matrix listing only its nonzero entries.
+  // The indices are stored already offset, i.e., as m1+l1, m2+l2 and m1+m2+l, so the kernels
+  // can use them directly as row indices. Entries are ordered by m1 first, then by m2.
+
+  class SO3CGsparse{
+  public:
+
+    int l1,l2,l;
+
+    vector<int> m1;
+    vector<int> m2;
+    vector<int> m;
+    vector<float> c;
+
+
+    SO3CGsparse(const int _l1, const int _l2, const int _l, const cnine::TensorView<float>& C):
+      l1(_l1), l2(_l2), l(_l){
+      for(int _m1=-l1; _m1<=l1; _m1++)
+	for(int _m2=std::max(-l2,-l-_m1); _m2<=std::min(l2,l-_m1); _m2++){
+	  float v=C(_m1+l1,_m2+l2);
+	  if(v==0) continue;
+	  m1.push_back(_m1+l1);
+	  m2.push_back(_m2+l2);
+	  m.push_back(_m1+_m2+l);
+	  c.push_back(v);
+	}
+    }
+
+
+  public: // ---- Access -------------------------------------------------------------------------------------
+
+
+    int size() const{
+      return c.size();
+    }
+
+
+  public: // ---- I/O ----------------------------------------------------------------------------------------
+
+
+    string classname() const{
+      return "GElib::SO3CGsparse";
+    }
+
+    string repr() const{
+      return "<SO3CGsparse ("+to_string(l1)+","+to_string(l2)+","+to_string(l)+") nnz="+to_string(size())+">";
+    }
+
+    string str(const string indent="") const{
+      ostringstream oss;
+      for(int i=0; i<size(); i++)
+	oss<<indent<<"("<<m1[i]-l1<<","<<m2[i]-l2<<","<<m[i]-l<<") "<<c[i]<<endl;
+      return oss.str();
+    }
+
+    friend ostream& operator<<(ostream& stream, const SO3CGsparse& x){
+      stream<<x.str(); return stream;
+    }
+
+  };
+
+}
+
+#endif
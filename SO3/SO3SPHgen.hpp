@@ -54,6 +54,39 @@ namespace GElib{
    }
 
 
+    // Shared handles to the coefficient tables, extended to at least _L. Evaluating with these through 
+    // legendre_Q(...) avoids taking the lock and allocating a new tensor for each point. 
+    pair<TENSOR,TENSOR> coefficients(const int _L){
+      lock_guard<mutex> lock(mx);
+      if(_L>L) extend(_L);
+      return pair<TENSOR,TENSOR>(c1,c2);
+    }
+
+    // Q(l,m)=P(l,m)/(1-x^2)^{m/2} and its derivative dQ(l,m) with respect to x, written to Q[l*(_L+1)+m] 
+    // and dQ[l*(_L+1)+m]. Unlike P, these are polynomials in x, so the spherical harmonics and their gradients 
+    // built from them stay accurate close to the poles.
+    static void legendre_Q(const int _L, const float x, const TENSOR& c1, const TENSOR& c2, float* Q, float* dQ){
+      const float* C1=c1.mem();
+      const float* C2=c2.mem();
+      const int s1=c1.strides[0];
+      const int s2=c2.strides[0];
+      const int w=_L+1;
+
+      Q[0]=sqrt(1.0/(M_PI*4.0));
+      dQ[0]=0;
+      for(int l=1; l<=_L; l++){
+	Q[l*w+l]=C1[l*s1+l]*Q[(l-1)*w+l-1];
+	dQ[l*w+l]=0;
+	Q[l*w+l-1]=C1[l*s1+l-1]*Q[(l-1)*w+l-1]*x;
+	dQ[l*w+l-1]=C1[l*s1+l-1]*Q[(l-1)*w+l-1];
+	for(int m=0; m<l-1; m++){
+	  Q[l*w+m]=C1[l*s1+m]*Q[(l-1)*w+m]*x+C2[l*s2+m]*Q[(l-2)*w+m];
+	  dQ[l*w+m]=C1[l*s1+m]*(dQ[(l-1)*w+m]*x+Q[(l-1)*w+m])+C2[l*s2+m]*dQ[(l-2)*w+m];
+	}
+      }
+    }
+
+
   private:
 
     void extend(const int _L){
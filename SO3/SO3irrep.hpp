@@ -17,6 +17,7 @@
 
 #include "GElib_base.hpp"
 #include "SO3element.hpp"
+#include "GElibThreadPool.hpp"
 
 
 namespace GElib{
@@ -37,9 +38,42 @@ namespace GElib{
 
     template<typename TYPE>
     cnine::TensorView<complex<TYPE> > matrix(const SO3element<TYPE>& R) const{
+      double alpha,beta,gamma;
+      euler_angles(R,alpha,beta,gamma);
+      return matrix<TYPE>(alpha,beta,gamma);
+    }
+
+
+    // The representation matrices of a batch of rotations given as a tensor of dimensions (b,3,3)
+    template<typename TYPE>
+    cnine::TensorView<complex<TYPE> > matrices(const cnine::TensorView<TYPE>& R) const{
+      GELIB_ASSRT(R.ndims()==3 && R.dims[1]==3 && R.dims[2]==3);
+      GELIB_ASSRT(R.get_dev()==0);
+      const int b=R.dims[0];
+      cnine::TensorView<complex<TYPE> > M({b,2*l+1,2*l+1},0,0);
+      parallel_for(b,[&](const int i){
+	  double alpha,beta,gamma;
+	  euler_angles(R.slice(0,i),alpha,beta,gamma);
+	  set_matrix(M.slice(0,i),alpha,beta,gamma);
+	});
+      return M;
+    }
+
+
+    template<typename TYPE>
+    cnine::TensorView<complex<TYPE> > matrix(const double alpha, const double beta, const double gamma) const{
+      cnine::TensorView<complex<TYPE> > M({2*l+1,2*l+1},0,0);
+      set_matrix(M,alpha,beta,gamma);
+      return M;
+    }
+
+
+  private:
+
+    template<typename TYPE>
+    static void euler_angles(const cnine::TensorView<TYPE>& R, double& alpha, double& beta, double& gamma){
 
       // z-y-z convention, extrinsic 
-      double alpha,beta,gamma;
       TYPE r22=R(2,2);
       beta=acos(R(2,2));
       if(abs(r22)<1-1e-6){
@@ -55,55 +89,172 @@ namespace GElib{
 	}
       }
       //cout<<alpha<<" "<<beta<<" "<<gamma<<endl;
+    }
 
-      return matrix<TYPE>(alpha,beta,gamma);
+
+    template<typename TYPE>
+    void set_matrix(const cnine::TensorView<complex<TYPE> >& M, const double alpha, const double beta, const double gamma) const{
+      cnine::TensorView<double> d=littled_matrix(beta);
+      for(int m1=-l; m1<=l; m1++)
+	for(int m2=-l; m2<=l; m2++)
+	  M.set(m1+l,m2+l,complex<TYPE>(d(m1+l,m2+l))*exp(complex<TYPE>(0,m1*alpha))*exp(complex<TYPE>(0,m2*gamma)));
+    }
+
+
+  public: // ---- Wigner little-d ----------------------------------------------------------------------------
+
+    // The little-d matrices are generated with the three-term recursion in l 
+    //
+    // S_{l+1} d^{l+1}_{m'm} = (2l+1)((l+1) cos(beta) - m'm/l) d^l_{m'm} - ((l+1)/l) S_l d^{l-1}_{m'm}, 
+    // S_l = sqrt((l^2-m^2)(l^2-m'^2)), 
+    //
+    // started from the closed form of d^J_{m'm} at J=max(|m|,|m'|), which is evaluated in log space. 
+    // Each entry costs O(1), so a sweep computing all of d^0,...,d^L costs O(L^3), i.e., O(l^2) per matrix, 
+    // and the recursion remains stable to at least l=100. Entry (m'+l,m+l) of the matrices is d^l_{m'm}.
+
+
+    // d^l_{m2,m1}(beta)
+    float littled(const int m1, const int m2, const double beta) const{
+      double r=0;
+      const vector<double> lfact=log_factorials(2*l);
+      littled_recursion(l,m2,m1,beta,lfact,[&](const int j, const double v){
+	  if(j==l) r=v;});
+      return r;
+    }
+
+    // d^l(beta), reusing the last sweep of the calling thread if it was for the same angle 
+    cnine::TensorView<double> littled_matrix(const double beta) const{
+      thread_local double cached_beta=std::nan("");
+      thread_local vector<cnine::TensorView<double> > cached;
+      if(beta!=cached_beta || cached.size()<=l){
+	int L=l;
+	if(beta==cached_beta) L=std::max<int>(l,cached.size()-1);
+	vector<cnine::TensorView<double> > d=littled_all(L,beta);
+	cached.swap(d);
+	cached_beta=beta;
+      }
+      return cached[l];
     }
 
+    // d^0(beta),...,d^L(beta) in a single sweep
+    static vector<cnine::TensorView<double> > littled_all(const int L, const double beta){
+      vector<cnine::TensorView<double> > R;
+      for(int j=0; j<=L; j++)
+	R.push_back(cnine::TensorView<double>({2*j+1,2*j+1},0,0));
+      littled_sweep(L,beta,log_factorials(2*L),R);
+      return R;
+    }
 
+    // d^0,...,d^L for a vector of n angles, as tensors of dimensions (n,2l+1,2l+1)
     template<typename TYPE>
-    cnine::TensorView<complex<TYPE> > matrix(const double alpha, const double beta, const double gamma) const{
-      cnine::TensorView<complex<TYPE> > M({2*l+1,2*l+1},0,0);
+    static vector<cnine::TensorView<TYPE> > littled_all(const int L, const cnine::TensorView<TYPE>& beta){
+      GELIB_ASSRT(beta.ndims()==1);
+      GELIB_ASSRT(beta.get_dev()==0);
+      const int n=beta.dims[0];
+      vector<cnine::TensorView<TYPE> > R;
+      for(int j=0; j<=L; j++)
+	R.push_back(cnine::TensorView<TYPE>({n,2*j+1,2*j+1},0,0));
+      const vector<double> lfact=log_factorials(2*L);
+      parallel_for(n,[&](const int i){
+	  vector<cnine::TensorView<TYPE> > Ri;
+	  for(auto& p:R) Ri.push_back(p.slice(0,i));
+	  littled_sweep(L,beta(i),lfact,Ri);
+	});
+      return R;
+    }
 
-      for(int m1=-l; m1<=l; m1++)
-	for(int m2=-l; m2<=l; m2++){
-	  //complex<TYPE> d=littled(m2,m1,theta);
-	  complex<TYPE> d=littled(m2,m1,beta);
-	  //M.set(m1+l,m2+l,d*exp(-complex<TYPE>(0,m1*phi))*exp(-complex<TYPE>(0,m2*psi)));
-	  M.set(m1+l,m2+l,d*exp(complex<TYPE>(0,m1*alpha))*exp(complex<TYPE>(0,m2*gamma)));
-	  //M.set(m1+l,m2+l,d*exp(-complex<TYPE>(0,m1*alpha))*exp(-complex<TYPE>(0,m2*gamma)));
-	  //M.set(m2+l,m1+l,d*exp(-complex<TYPE>(0,m1*alpha))*exp(-complex<TYPE>(0,m2*gamma))); // why transpose?
-	}
+    // The representation matrices D^0,...,D^L of a batch of rotations given as a tensor of dimensions (b,3,3)
+    template<typename TYPE>
+    static vector<cnine::TensorView<complex<TYPE> > > matrices_all(const int L, const cnine::TensorView<TYPE>& R){
+      GELIB_ASSRT(R.ndims()==3 && R.dims[1]==3 && R.dims[2]==3);
+      GELIB_ASSRT(R.get_dev()==0);
+      const int b=R.dims[0];
+      vector<cnine::TensorView<complex<TYPE> > > M;
+      for(int j=0; j<=L; j++)
+	M.push_back(cnine::TensorView<complex<TYPE> >({b,2*j+1,2*j+1},0,0));
+      const vector<double> lfact=log_factorials(2*L);
+      parallel_for(b,[&](const int i){
+	  double alpha,beta,gamma;
+	  euler_angles(R.slice(0,i),alpha,beta,gamma);
+	  vector<cnine::TensorView<double> > d;
+	  for(int j=0; j<=L; j++)
+	    d.push_back(cnine::TensorView<double>({2*j+1,2*j+1},0,0));
+	  littled_sweep(L,beta,lfact,d);
+	  for(int j=0; j<=L; j++)
+	    SO3irrep(j).set_matrix(M[j].slice(0,i),alpha,d[j],gamma);
+	});
       return M;
     }
-    
-    
-    float littled(const int m1, const int m2, const double beta) const{
-      double x=0;
 
-      if(l<5){
-	for(int s=std::max(0,m1-m2); s<=std::min(l+m1,l-m2); s++){
-	  double pref=1.0/(cnine::factorial(l+m1-s)*cnine::factorial(s)*cnine::factorial(m2-m1+s)*cnine::factorial(l-m2-s));
-	  if((m2-m1+s)%2) pref=-pref;
-	  x+=pref*std::pow(cos(beta/2),2*l+m1-m2-2*s)*std::pow(sin(beta/2),m2-m1+2*s);
-	}
-	double v= sqrt(cnine::factorial(l+m1)*cnine::factorial(l-m1)*cnine::factorial(l+m2)*cnine::factorial(l-m2))*x;
-	if(std::isnan(v)) cout<<l<<m1<<m2<<" "<<beta<<endl;
-	return v;
+
+  private:
+
+    template<typename TYPE>
+    void set_matrix(const cnine::TensorView<complex<TYPE> >& M, const double alpha, const cnine::TensorView<double>& d, const double gamma) const{
+      for(int m1=-l; m1<=l; m1++)
+	for(int m2=-l; m2<=l; m2++)
+	  M.set(m1+l,m2+l,complex<TYPE>(d(m1+l,m2+l))*exp(complex<TYPE>(0,m1*alpha))*exp(complex<TYPE>(0,m2*gamma)));
+    }
+
+    static vector<double> log_factorials(const int n){
+      vector<double> R(n+1);
+      for(int i=0; i<=n; i++) R[i]=lgamma(i+1.0);
+      return R;
+    }
+
+    template<typename TYPE>
+    static void littled_sweep(const int L, const double beta, const vector<double>& lfact, const vector<cnine::TensorView<TYPE> >& R){
+      vector<TYPE*> arr(L+1);
+      vector<int> s0(L+1);
+      vector<int> s1(L+1);
+      for(int j=0; j<=L; j++){
+	arr[j]=R[j].mem();
+	s0[j]=R[j].strides[0];
+	s1[j]=R[j].strides[1];
       }
+      for(int mp=-L; mp<=L; mp++)
+	for(int m=-L; m<=L; m++)
+	  littled_recursion(L,mp,m,beta,lfact,[&](const int j, const double v){
+	      arr[j][(mp+j)*s0[j]+(m+j)*s1[j]]=v;});
+    }
 
-      // check this!
-      for(int s=std::max(0,m1-m2); s<=std::min(l+m1,l-m2); s++){
-	double a=(lgamma(l+m1+1)+lgamma(l-m1+1)+lgamma(l+m2+1)+lgamma(l-m2+1))/2.0;
-	a-=lgamma(l+m1-s+1)+lgamma(s+1)+lgamma(m2-m1+s+1)+lgamma(l-m2-s+1);
-	if(std::isnan(std::exp(a))) cout<<s<<" "<<l<<m1<<m2<<" "<<beta<<endl;
-	x+=(1-2*((m2-m1+s)%2))*std::pow(cos(beta/2),2*l+m1-m2-2*s)*std::pow(sin(beta/2),m2-m1+2*s)*std::exp(a);
-	if(std::isnan(x)){
-	  cout<<l<<m1<<m2<<" "<<beta<<" ww "<<a<<" "<<std::exp(a)<<" "<<x<<" ";
-	  cout<<(2*(s%2)-1)*std::pow(cos(beta/2),2*l+m1-m2-2*s)*std::pow(sin(beta/2),m2-m1+2*s)<<endl;
-	}
+    // Calls fn(j,d^j_{mp,m}(beta)) for j=max(|mp|,|m|),...,L
+    template<typename FN>
+    static void littled_recursion(const int L, const int mp, const int m, const double beta, const vector<double>& lfact, const FN& fn){
+      const int J=std::max(std::abs(mp),std::abs(m));
+      if(J>L) return;
+      const double c=cos(beta/2);
+      const double s=sin(beta/2);
+      const double x=cos(beta);
+
+      // sqrt(binom(2J,k)) c^a s^b
+      auto seed=[&](const int k, const int a, const int b){
+	if((a>0 && c==0) || (b>0 && s==0)) return 0.0;
+	double lv=(lfact[2*J]-lfact[k]-lfact[2*J-k])/2;
+	if(a>0) lv+=a*log(std::abs(c));
+	if(b>0) lv+=b*log(std::abs(s));
+	double v=exp(lv);
+	if((c<0 && a%2) != (s<0 && b%2)) v=-v;
+	return v;
+      };
+
+      double cur;
+      if(mp==J) cur=((J-m)%2?-1:1)*seed(J+m,J+m,J-m);
+      else if(mp==-J) cur=seed(J-m,J-m,J+m);
+      else if(m==J) cur=seed(J+mp,J+mp,J-mp);
+      else cur=((J+mp)%2?-1:1)*seed(J-mp,J-mp,J+mp);
+      fn(J,cur);
+
+      double prev=0;
+      for(int j=J; j<L; j++){
+	const double S1=sqrt(((j+1.0)*(j+1)-m*m)*((j+1.0)*(j+1)-mp*mp));
+	double next;
+	if(j==0) next=x*cur;
+	else next=((2*j+1)*((j+1)*x-((double)m*mp)/j)*cur-(j+1.0)/j*sqrt(((double)j*j-m*m)*((double)j*j-mp*mp))*prev)/S1;
+	fn(j+1,next);
+	prev=cur;
+	cur=next;
       }
-      if(std::isnan(x)) cout<<l<<m1<<m2<<" "<<beta<<endl;
-      return x;
     }
 
 
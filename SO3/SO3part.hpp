@@ -17,6 +17,7 @@
 //#include "SO3CGbank.hpp" // Added missing include
 
 #include "SO3part_addSpharmFn.hpp"
+#include "SO3CGkernels.hpp"
 
 
 namespace GElib{
@@ -47,6 +48,7 @@ namespace GElib{
     typedef SO3group GROUP;
     typedef int IRREP_IX; 
     typedef SO3type GTYPE;
+    typedef SO3CGsparse CGCOEFFS;
 
     static constexpr int null_ix=-1;
 
@@ -188,58 +190,72 @@ namespace GElib{
       return SO3_CGbank.get<TYPE>(x.getl(),y.getl(),getl());
     }
 
-    static void add_CGproduct_kernel(const TENSOR& r, const TENSOR& x, const TENSOR& y, const RTENSOR& C, int offs=0){
-      const int l=(r.dims[0]-1)/2; 
-      const int l1=(x.dims[0]-1)/2; 
-      const int l2=(y.dims[0]-1)/2;
+    const SO3CGsparse& get_CGcoeffs(const SO3part& x, const SO3part& y){
+      return CGcoeffs(x.getl(),y.getl(),getl());
+    }
+
+    static const SO3CGsparse& CGcoeffs(const int l1, const int l2, const int l){
+      return SO3_CGbank.get_sparse<TYPE>(l1,l2,l);
+    }
+
+    static void add_CGproduct_kernel(const TENSOR& r, const TENSOR& x, const TENSOR& y, const SO3CGsparse& C, int offs=0){
       const int N1=x.dims[1];
       const int N2=y.dims[1];
-      for(int n1=0; n1<N1; n1++){
-	for(int n2=0; n2<N2; n2++){
-	  for(int m1=-l1; m1<=l1; m1++){
-	    for(int m2=std::max(-l2,-l-m1); m2<=std::min(l2,l-m1); m2++){
-	      r.inc(m1+m2+l,offs+n2,C(m1+l1,m2+l2)*x(m1+l1,n1)*y(m2+l2,n2));
-	    }
-	  }
-	}
-	offs+=N2;
-      }
+      TYPE* rarr=reinterpret_cast<TYPE*>(r.get_arr())+2*r.strides[1]*offs;
+      const TYPE* xarr=reinterpret_cast<TYPE*>(x.get_arr());
+      const TYPE* yarr=reinterpret_cast<TYPE*>(y.get_arr());
+      const int rs=2*r.strides[1];
+      const int xs=2*x.strides[1];
+      const int ys=2*y.strides[1];
+      for(int i=0; i<C.size(); i++)
+	SO3CGkernels<TYPE>::add_outer(rarr+2*r.strides[0]*C.m[i],rs,xarr+2*x.strides[0]*C.m1[i],xs,
+	  yarr+2*y.strides[0]*C.m2[i],ys,C.c[i],N1,N2);
     }
 
-    static void add_CGproduct_back0_kernel(const TENSOR& r, const TENSOR& x, const TENSOR& y, const RTENSOR& C, int offs=0){
-      const int l=(r.dims[0]-1)/2; 
-      const int l1=(x.dims[0]-1)/2; 
-      const int l2=(y.dims[0]-1)/2;
+    static void add_CGproduct_back0_kernel(const TENSOR& r, const TENSOR& x, const TENSOR& y, const SO3CGsparse& C, int offs=0){
       const int N1=x.dims[1];
       const int N2=y.dims[1];
-      for(int n1=0; n1<N1; n1++){
-	for(int n2=0; n2<N2; n2++){
-	  for(int m1=-l1; m1<=l1; m1++){
-	    for(int m2=std::max(-l2,-l-m1); m2<=std::min(l2,l-m1); m2++){
-	      x.inc(m1+l1,n1,C(m1+l1,m2+l2)*r(m1+m2+l,offs+n2)*std::conj(y(m2+l2,n2)));
-	    }
-	  }
-	}
-	offs+=N2;
-      }
+      const TYPE* rarr=reinterpret_cast<TYPE*>(r.get_arr())+2*r.strides[1]*offs;
+      TYPE* xarr=reinterpret_cast<TYPE*>(x.get_arr());
+      const TYPE* yarr=reinterpret_cast<TYPE*>(y.get_arr());
+      const int rs=2*r.strides[1];
+      const int xs=2*x.strides[1];
+      const int ys=2*y.strides[1];
+      for(int i=0; i<C.size(); i++)
+	SO3CGkernels<TYPE>::add_outer_back0(xarr+2*x.strides[0]*C.m1[i],xs,rarr+2*r.strides[0]*C.m[i],rs,
+	  yarr+2*y.strides[0]*C.m2[i],ys,C.c[i],N1,N2);
     }
 
-    static void add_CGproduct_back1_kernel(const TENSOR& r, const TENSOR& x, const TENSOR& y, const RTENSOR& C, int offs=0){
-      const int l=(r.dims[0]-1)/2; 
-      const int l1=(x.dims[0]-1)/2; 
-      const int l2=(y.dims[0]-1)/2;
+    static void add_CGproduct_back1_kernel(const TENSOR& r, const TENSOR& x, const TENSOR& y, const SO3CGsparse& C, int offs=0){
       const int N1=x.dims[1];
       const int N2=y.dims[1];
-      for(int n1=0; n1<N1; n1++){
-	for(int n2=0; n2<N2; n2++){
-	  for(int m1=-l1; m1<=l1; m1++){
-	    for(int m2=std::max(-l2,-l-m1); m2<=std::min(l2,l-m1); m2++){
-	      y.inc(m2+l2,n2,C(m1+l1,m2+l2)*r(m1+m2+l,offs+n2)*std::conj(x(m1+l1,n1)));
-	    }
-	  }
-	}
-	offs+=N2;
-      }
+      const TYPE* rarr=reinterpret_cast<TYPE*>(r.get_arr())+2*r.strides[1]*offs;
+      const TYPE* xarr=reinterpret_cast<TYPE*>(x.get_arr());
+      TYPE* yarr=reinterpret_cast<TYPE*>(y.get_arr());
+      const int rs=2*r.strides[1];
+      const int xs=2*x.strides[1];
+      const int ys=2*y.strides[1];
+      for(int i=0; i<C.size(); i++)
+	SO3CGkernels<TYPE>::add_outer_back1(yarr+2*y.strides[0]*C.m2[i],ys,rarr+2*r.strides[0]*C.m[i],rs,
+	  xarr+2*x.strides[0]*C.m1[i],xs,C.c[i],N1,N2);
+    }
+
+    // Both backward passes in a single sweep over the rows of the gradient g
+    static void add_CGproduct_back01_kernel(const TENSOR& g, const TENSOR& x, const TENSOR& y, const TENSOR& xg, const TENSOR& yg,
+      const SO3CGsparse& C, int offs=0){
+      const int N1=x.dims[1];
+      const int N2=y.dims[1];
+      const TYPE* garr=reinterpret_cast<TYPE*>(g.get_arr())+2*g.strides[1]*offs;
+      const TYPE* xarr=reinterpret_cast<TYPE*>(x.get_arr());
+      const TYPE* yarr=reinterpret_cast<TYPE*>(y.get_arr());
+      TYPE* xgarr=reinterpret_cast<TYPE*>(xg.get_arr());
+      TYPE* ygarr=reinterpret_cast<TYPE*>(yg.get_arr());
+      const int gs=2*g.strides[1];
+      const int xs=2*x.strides[1];
+      const int ys=2*y.strides[1];
+      for(int i=0; i<C.size(); i++)
+	SO3CGkernels<TYPE>::add_outer_back01(xgarr+2*xg.strides[0]*C.m1[i],2*xg.strides[1],ygarr+2*yg.strides[0]*C.m2[i],2*yg.strides[1],
+	  garr+2*g.strides[0]*C.m[i],gs,xarr+2*x.strides[0]*C.m1[i],xs,yarr+2*y.strides[0]*C.m2[i],ys,C.c[i],N1,N2);
     }
 
     static void add_CGproduct_dev(const SO3part& r, SO3part x, SO3part y, const int _offs=0){
@@ -259,66 +275,232 @@ namespace GElib{
   public: // ---- Diag CG-products --------------------------------------------------------------------------------
 
     
-    static void add_DiagCGproduct_kernel(const TENSOR& r, const TENSOR& x, const TENSOR& y, const RTENSOR& C, int offs=0){
-      const int l=(r.dims[0]-1)/2; 
-      const int l1=(x.dims[0]-1)/2; 
-      const int l2=(y.dims[0]-1)/2;
-      const int N1=x.dims[1];
-      const int N2=y.dims[1];
-      GELIB_ASSRT(N1==N2);
-      for(int n=0; n<N1; n++){
-	for(int m1=-l1; m1<=l1; m1++){
-	  for(int m2=std::max(-l2,-l-m1); m2<=std::min(l2,l-m1); m2++){
-	    r.inc(m1+m2+l,offs+n,C(m1+l1,m2+l2)*x(m1+l1,n)*y(m2+l2,n));
+    static void add_DiagCGproduct_kernel(const TENSOR& r, const TENSOR& x, const TENSOR& y, const SO3CGsparse& C, int offs=0){
+      const int N=x.dims[1];
+      GELIB_ASSRT(y.dims[1]==N);
+      TYPE* rarr=reinterpret_cast<TYPE*>(r.get_arr())+2*r.strides[1]*offs;
+      const TYPE* xarr=reinterpret_cast<TYPE*>(x.get_arr());
+      const TYPE* yarr=reinterpret_cast<TYPE*>(y.get_arr());
+      const int rs=2*r.strides[1];
+      const int xs=2*x.strides[1];
+      const int ys=2*y.strides[1];
+      for(int i=0; i<C.size(); i++)
+	SO3CGkernels<TYPE>::add_diag(rarr+2*r.strides[0]*C.m[i],rs,xarr+2*x.strides[0]*C.m1[i],xs,
+	  yarr+2*y.strides[0]*C.m2[i],ys,C.c[i],N);
+    }
+
+    static void add_DiagCGproduct_back0_kernel(const TENSOR& r, const TENSOR& x, const TENSOR& y, const SO3CGsparse& C, int offs=0){
+      const int N=x.dims[1];
+      GELIB_ASSRT(y.dims[1]==N);
+      const TYPE* rarr=reinterpret_cast<TYPE*>(r.get_arr())+2*r.strides[1]*offs;
+      TYPE* xarr=reinterpret_cast<TYPE*>(x.get_arr());
+      const TYPE* yarr=reinterpret_cast<TYPE*>(y.get_arr());
+      const int rs=2*r.strides[1];
+      const int xs=2*x.strides[1];
+      const int ys=2*y.strides[1];
+      for(int i=0; i<C.size(); i++)
+	SO3CGkernels<TYPE>::add_diag_back(xarr+2*x.strides[0]*C.m1[i],xs,rarr+2*r.strides[0]*C.m[i],rs,
+	  yarr+2*y.strides[0]*C.m2[i],ys,C.c[i],N);
+    }
+
+    static void add_DiagCGproduct_back1_kernel(const TENSOR& r, const TENSOR& x, const TENSOR& y, const SO3CGsparse& C, int offs=0){
+      const int N=x.dims[1];
+      GELIB_ASSRT(y.dims[1]==N);
+      const TYPE* rarr=reinterpret_cast<TYPE*>(r.get_arr())+2*r.strides[1]*offs;
+      const TYPE* xarr=reinterpret_cast<TYPE*>(x.get_arr());
+      TYPE* yarr=reinterpret_cast<TYPE*>(y.get_arr());
+      const int rs=2*r.strides[1];
+      const int xs=2*x.strides[1];
+      const int ys=2*y.strides[1];
+      for(int i=0; i<C.size(); i++)
+	SO3CGkernels<TYPE>::add_diag_back(yarr+2*y.strides[0]*C.m2[i],ys,rarr+2*r.strides[0]*C.m[i],rs,
+	  xarr+2*x.strides[0]*C.m1[i],xs,C.c[i],N);
+    }
+
+    static void add_DiagCGproduct_back01_kernel(const TENSOR& g, const TENSOR& x, const TENSOR& y, const TENSOR& xg, const TENSOR& yg,
+      const SO3CGsparse& C, int offs=0){
+      const int N=x.dims[1];
+      GELIB_ASSRT(y.dims[1]==N);
+      const TYPE* garr=reinterpret_cast<TYPE*>(g.get_arr())+2*g.strides[1]*offs;
+      const TYPE* xarr=reinterpret_cast<TYPE*>(x.get_arr());
+      const TYPE* yarr=reinterpret_cast<TYPE*>(y.get_arr());
+      TYPE* xgarr=reinterpret_cast<TYPE*>(xg.get_arr());
+      TYPE* ygarr=reinterpret_cast<TYPE*>(yg.get_arr());
+      const int gs=2*g.strides[1];
+      const int xs=2*x.strides[1];
+      const int ys=2*y.strides[1];
+      for(int i=0; i<C.size(); i++)
+	SO3CGkernels<TYPE>::add_diag_back01(xgarr+2*xg.strides[0]*C.m1[i],2*xg.strides[1],ygarr+2*yg.strides[0]*C.m2[i],2*yg.strides[1],
+	  garr+2*g.strides[0]*C.m[i],gs,xarr+2*x.strides[0]*C.m1[i],xs,yarr+2*y.strides[0]*C.m2[i],ys,C.c[i],N);
+    }
+
+    static void add_DiagCGproduct_dev(const SO3part& r, SO3part x, SO3part y, const int _offs=0){
+      //CUDA_STREAM(SO3part_addDiagCGproduct_cu(r,x,y,_offs,stream));
+    }
+
+    static void add_DiagCGproduct_back0_dev(const SO3part& r, SO3part x, SO3part y, const int _offs=0){
+      //CUDA_STREAM(SO3part_addDiagCGproduct_back0_cu(r,x,y,_offs,stream));
+    }
+
+    static void add_DiagCGproduct_back1_dev(const SO3part& r, SO3part x, SO3part y, const int _offs=0){
+      //CUDA_STREAM(SO3part_addDiagCGproduct_back1_cu(r,x,y,_offs,stream));
+    }
+
+
+  public: // ---- Weighted CG-products ----------------------------------------------------------------------
+
+
+    // r[m,w]+=sum_{u,v} W[u,v,w] sum_{m1,m2} C[m1,m2,m] x[m1,u] y[m2,v] for a single cell. For each m2
+    // the weights are first contracted with row m2 of y into T[u,w]=sum_v y[m2,v] W[u,v,w], so only
+    // an (n1,n_out) scratch matrix is ever formed, never the n1*n2 channels of the plain CG-product.
+    // T is scratch space owned by the caller, so that it can be reused across cells.
+    static void add_CGproduct_weighted_kernel(const TENSOR& r, const TENSOR& x, const TENSOR& y,
+      const TENSOR& W, const SO3CGsparse& C, vector<complex<TYPE> >& T){
+      const int N1=x.dims[1], N=r.dims[1];
+      T.resize(N1*N);
+      for(int m2=0; m2<y.dims[0]; m2++){
+	if(!has_m2(C,m2)) continue;
+	contract_weights(T,y,W,m2);
+	for(int i=0; i<C.size(); i++){
+	  if(C.m2[i]!=m2) continue;
+	  complex<TYPE>* rp=r.mem()+C.m[i]*r.strides[0];
+	  const complex<TYPE>* xp=x.mem()+C.m1[i]*x.strides[0];
+	  for(int u=0; u<N1; u++){
+	    const complex<TYPE> a=C.c[i]*xp[u*x.strides[1]];
+	    const complex<TYPE>* t=T.data()+u*N;
+	    for(int w=0; w<N; w++)
+	      rp[w*r.strides[1]]+=a*t[w];
 	  }
 	}
       }
     }
 
-    static void add_DiagCGproduct_back0_kernel(const TENSOR& r, const TENSOR& x, const TENSOR& y, const RTENSOR& C, int offs=0){
-      const int l=(r.dims[0]-1)/2; 
-      const int l1=(x.dims[0]-1)/2; 
-      const int l2=(y.dims[0]-1)/2;
-      const int N1=x.dims[1];
-      const int N2=y.dims[1];
-      GELIB_ASSRT(N1==N2);
-      for(int n=0; n<N1; n++){
-	for(int m1=-l1; m1<=l1; m1++){
-	  for(int m2=std::max(-l2,-l-m1); m2<=std::min(l2,l-m1); m2++){
-	    x.inc(m1+l1,n,C(m1+l1,m2+l2)*r(m1+m2+l,offs+n)*std::conj(y(m2+l2,n)));
+    // The gradients of the weighted CG-product with respect to x, y and W for a single cell. Any of
+    // xg, yg and Wg can be null. With S[u,w]=sum c conj(x[m1,u]) g[m,w] over the coefficients with a
+    // given m2, the gradients of y and W are yg[m2,v]+=sum_{u,w} S[u,w] conj(W[u,v,w]) and
+    // Wg[u,v,w]+=conj(y[m2,v]) S[u,w], so again only (n1,n_out) scratch matrices are needed. T and S are
+    // scratch space owned by the caller.
+    static void add_CGproduct_weighted_back_kernel(const TENSOR& g, const TENSOR& x, const TENSOR& y,
+      const TENSOR& W, const SO3CGsparse& C, const TENSOR* xg, const TENSOR* yg, const TENSOR* Wg,
+      vector<complex<TYPE> >& T, vector<complex<TYPE> >& S){
+      const int N1=x.dims[1], N2=y.dims[1], N=g.dims[1];
+      T.resize(N1*N);
+      S.resize(N1*N);
+      for(int m2=0; m2<y.dims[0]; m2++){
+	if(!has_m2(C,m2)) continue;
+
+	if(xg){
+	  contract_weights(T,y,W,m2);
+	  for(int i=0; i<C.size(); i++){
+	    if(C.m2[i]!=m2) continue;
+	    const complex<TYPE>* gp=g.mem()+C.m[i]*g.strides[0];
+	    complex<TYPE>* xp=xg->mem()+C.m1[i]*xg->strides[0];
+	    for(int u=0; u<N1; u++){
+	      const complex<TYPE>* t=T.data()+u*N;
+	      complex<TYPE> s=0;
+	      for(int w=0; w<N; w++)
+		s+=gp[w*g.strides[1]]*std::conj(t[w]);
+	      xp[u*xg->strides[1]]+=C.c[i]*s;
+	    }
 	  }
 	}
-      }
-    }
 
-    static void add_DiagCGproduct_back1_kernel(const TENSOR& r, const TENSOR& x, const TENSOR& y, const RTENSOR& C, int offs=0){
-      const int l=(r.dims[0]-1)/2; 
-      const int l1=(x.dims[0]-1)/2; 
-      const int l2=(y.dims[0]-1)/2;
-      const int N1=x.dims[1];
-      const int N2=y.dims[1];
-      GELIB_ASSRT(N1==N2);
-      for(int n=0; n<N1; n++){
-	for(int m1=-l1; m1<=l1; m1++){
-	  for(int m2=std::max(-l2,-l-m1); m2<=std::min(l2,l-m1); m2++){
-	    y.inc(m2+l2,n,C(m1+l1,m2+l2)*r(m1+m2+l,offs+n)*std::conj(x(m1+l1,n)));
+	if(!yg && !Wg) continue;
+	std::fill(S.begin(),S.end(),complex<TYPE>(0));
+	for(int i=0; i<C.size(); i++){
+	  if(C.m2[i]!=m2) continue;
+	  const complex<TYPE>* gp=g.mem()+C.m[i]*g.strides[0];
+	  const complex<TYPE>* xp=x.mem()+C.m1[i]*x.strides[0];
+	  for(int u=0; u<N1; u++){
+	    const complex<TYPE> a=C.c[i]*std::conj(xp[u*x.strides[1]]);
+	    complex<TYPE>* s=S.data()+u*N;
+	    for(int w=0; w<N; w++)
+	      s[w]+=a*gp[w*g.strides[1]];
+	  }
+	}
+	for(int u=0; u<N1; u++){
+	  const complex<TYPE>* s=S.data()+u*N;
+	  for(int v=0; v<N2; v++){
+	    if(yg){
+	      const complex<TYPE>* wp=W.mem()+u*W.strides[0]+v*W.strides[1];
+	      complex<TYPE> t=0;
+	      for(int w=0; w<N; w++)
+		t+=s[w]*std::conj(wp[w*W.strides[2]]);
+	      yg->mem()[m2*yg->strides[0]+v*yg->strides[1]]+=t;
+	    }
+	    if(Wg){
+	      const complex<TYPE> yc=std::conj(y.mem()[m2*y.strides[0]+v*y.strides[1]]);
+	      complex<TYPE>* wp=Wg->mem()+u*Wg->strides[0]+v*Wg->strides[1];
+	      for(int w=0; w<N; w++)
+		wp[w*Wg->strides[2]]+=yc*s[w];
+	    }
 	  }
 	}
       }
     }
 
-    static void add_DiagCGproduct_dev(const SO3part& r, SO3part x, SO3part y, const int _offs=0){
-      //CUDA_STREAM(SO3part_addDiagCGproduct_cu(r,x,y,_offs,stream));
+    // r[m,offs+u]+=w[u] sum_{m1,m2} C[m1,m2,m] x[m1,u] y[m2,u], with w a vector of channel weights
+    static void add_DiagCGproduct_weighted_kernel(const TENSOR& r, const TENSOR& x, const TENSOR& y,
+      const complex<TYPE>* w, const int ws, const SO3CGsparse& C, const int offs=0){
+      const int N=x.dims[1];
+      GELIB_ASSRT(y.dims[1]==N);
+      for(int i=0; i<C.size(); i++){
+	complex<TYPE>* rp=r.mem()+C.m[i]*r.strides[0]+offs*r.strides[1];
+	const complex<TYPE>* xp=x.mem()+C.m1[i]*x.strides[0];
+	const complex<TYPE>* yp=y.mem()+C.m2[i]*y.strides[0];
+	for(int u=0; u<N; u++)
+	  rp[u*r.strides[1]]+=C.c[i]*w[u*ws]*xp[u*x.strides[1]]*yp[u*y.strides[1]];
+      }
     }
 
-    static void add_DiagCGproduct_back0_dev(const SO3part& r, SO3part x, SO3part y, const int _offs=0){
-      //CUDA_STREAM(SO3part_addDiagCGproduct_back0_cu(r,x,y,_offs,stream));
+    // The gradients of the weighted diagonal CG-product with respect to x, y and w, in one pass over
+    // the coefficients. Any of xg, yg and wg can be null.
+    static void add_DiagCGproduct_weighted_back_kernel(const TENSOR& g, const TENSOR& x, const TENSOR& y,
+      const complex<TYPE>* w, const int ws, const SO3CGsparse& C, const int offs,
+      const TENSOR* xg, const TENSOR* yg, complex<TYPE>* wg, const int wgs){
+      const int N=x.dims[1];
+      GELIB_ASSRT(y.dims[1]==N);
+      for(int i=0; i<C.size(); i++){
+	const complex<TYPE>* gp=g.mem()+C.m[i]*g.strides[0]+offs*g.strides[1];
+	const complex<TYPE>* xp=x.mem()+C.m1[i]*x.strides[0];
+	const complex<TYPE>* yp=y.mem()+C.m2[i]*y.strides[0];
+	for(int u=0; u<N; u++){
+	  const complex<TYPE> cg=C.c[i]*gp[u*g.strides[1]];
+	  const complex<TYPE> xv=xp[u*x.strides[1]];
+	  const complex<TYPE> yv=yp[u*y.strides[1]];
+	  if(xg) xg->mem()[C.m1[i]*xg->strides[0]+u*xg->strides[1]]+=cg*std::conj(w[u*ws]*yv);
+	  if(yg) yg->mem()[C.m2[i]*yg->strides[0]+u*yg->strides[1]]+=cg*std::conj(w[u*ws]*xv);
+	  if(wg) wg[u*wgs]+=cg*std::conj(xv*yv);
+	}
+      }
     }
 
-    static void add_DiagCGproduct_back1_dev(const SO3part& r, SO3part x, SO3part y, const int _offs=0){
-      //CUDA_STREAM(SO3part_addDiagCGproduct_back1_cu(r,x,y,_offs,stream));
+  private:
+
+    static bool has_m2(const SO3CGsparse& C, const int m2){
+      for(int i=0; i<C.size(); i++)
+	if(C.m2[i]==m2) return true;
+      return false;
+    }
+
+    // T[u,w]=sum_v y[m2,v] W[u,v,w]
+    static void contract_weights(vector<complex<TYPE> >& T, const TENSOR& y, const TENSOR& W, const int m2){
+      const int N1=W.dims[0], N2=W.dims[1], N=W.dims[2];
+      const complex<TYPE>* yp=y.mem()+m2*y.strides[0];
+      std::fill(T.begin(),T.end(),complex<TYPE>(0));
+      for(int u=0; u<N1; u++){
+	complex<TYPE>* t=T.data()+u*N;
+	for(int v=0; v<N2; v++){
+	  const complex<TYPE> a=yp[v*y.strides[1]];
+	  const complex<TYPE>* wp=W.mem()+u*W.strides[0]+v*W.strides[1];
+	  for(int w=0; w<N; w++)
+	    t[w]+=a*wp[w*W.strides[2]];
+	}
+      }
     }
 
+  public:
+
 
   public: // ---- Spherical harmonics -----------------------------------------------------------------------
 
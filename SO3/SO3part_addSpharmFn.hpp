@@ -16,6 +16,8 @@
 #include "MultiLoop.hpp"
 #include "TensorUtils.hpp"
 #include "SO3SPHgen.hpp"
+#include "SO3radialBasis.hpp"
+#include "GElibThreadPool.hpp"
 
 
 namespace GElib{
@@ -23,6 +25,13 @@ namespace GElib{
 extern GElib::SO3SPHgen SO3_SPHgen; // Moved into namespace GElib
 
 
+  // Adds the spherical harmonics of the vectors (x,y,z) stored in the columns of x to r. The same 
+  // kernel computes all the l's of an SO3vec in a single pass: the coefficient tables are fetched once, 
+  // the Legendre functions of each point go into a per task scratch buffer and the powers of (x+iy)/r 
+  // are accumulated on the fly, so the loop over points neither locks nor allocates. 
+  // If a radial basis is given, each vector contributes radial->n channels, R_k(|v|)Y_lm(v/|v|) for 
+  // k=0,...,n-1, fusing the edge embeddings of equivariant networks into the same pass.
+
   template<typename TYPE>
   class SO3part_addSpharmFn{
   public:
@@ -33,44 +42,238 @@ extern GElib::SO3SPHgen SO3_SPHgen; // Moved into namespace GElib
 
     template<typename GPART>
     void operator()(GPART& r, const TENSOR& x){
+      add(map<int,GPART>({{r.getl(),r}}),x);
+    }
+
+
+    template<typename GPART>
+    static void add(const map<int,GPART>& parts, const TENSOR& x, const SO3radialBasis* radial=nullptr){
       GELIB_ASSRT(x.ndims()>=3);
-      int l=r.getl();
-      int nc=r.getn();
-      GELIB_ASSRT(x.dims(-1)==nc);
-
-      if(r.get_dev()==0){
-	r.template for_each_cell_multi<TYPE>(x,[&](const int b, const int g, const CTENSOR& r, const TENSOR& x){
-	    for(int j=0; j<nc; j++){
-
-	      float vx=x(0,j);
-	      float vy=x(1,j);
-	      float vz=x(2,j);
-	      float length=sqrt(vx*vx+vy*vy+vz*vz); 
-	      float len2=sqrt(vx*vx+vy*vy);
-
-	      if(len2==0 || std::isnan(vx/len2) || std::isnan(vy/len2)){
-		float a=sqrt(((float)(2*l+1))/(M_PI*4.0));
-		r.inc(0,j,a); // check this
-	      }else{
-		complex<float> cphi(vx/len2,vy/len2);
-		auto P=SO3_SPHgen(l,vz/length);
-		vector<complex<float> > phase(l+1);
-		phase[0]=complex<float>(1.0,0);
-		for(int m=1; m<=l; m++)
-		  phase[m]=cphi*phase[m-1];
-	    
-		for(int m=0; m<=l; m++){
-		  complex<float> a=phase[m]*complex<float>(P(l,m)); // *(1-2*(m%2))
-		  complex<float> aa=complex<float>(1-2*(m%2))*std::conj(a);
-		  r.inc(l+m,j,a);
-		  if(m>0) r.inc(l-m,j,aa);
-		}
-	      }
+      GELIB_ASSRT(x.dims(-2)==3);
+      if(parts.size()==0) return;
+      const int nc=x.dims(-1);
+      const int nr=radial?radial->n:1;
+      const int L=parts.rbegin()->first;
+      for(auto& p:parts)
+	if(p.second.getn()!=nc*nr) 
+	  GELIB_ERROR("the number of channels of "+p.second.repr()+" does not match the number of vectors times the number of radial functions, "+to_string(nc*nr));
+      if(parts.begin()->second.get_dev()>0)
+	GELIB_ERROR("spherical harmonics are only implemented on the CPU");
+
+      TENSOR _x(canonical_4d(x));
+      const int B=_x.dims[0];
+      const int G=_x.dims[1];
+
+      vector<CTENSOR> r(L+1);
+      vector<bool> has(L+1,false);
+      for(auto& p:parts){
+	GPART q=p.second.fuse_grid();
+	GELIB_ASSRT(q.dims[0]==B && q.dims[1]==G);
+	r[p.first].reset(q);
+	has[p.first]=true;
+      }
+
+      auto C=SO3_SPHgen.coefficients(L);
+      int ntiles=1;
+      if(B*G<get_nthreads()) ntiles=std::max(1,std::min(nc,get_nthreads()/(B*G)));
+
+      parallel_for(B*G*ntiles,[&](const int i){
+	  const int b=i/(G*ntiles);
+	  const int g=(i/ntiles)%G;
+	  const int t=i%ntiles;
+	  vector<float> P(2*(L+1)*(L+1)+2*nr);
+	  add_cell(L,r,has,_x,b,g,(nc*t)/ntiles,(nc*(t+1))/ntiles,C.first,C.second,radial,P.data());
+	});
+    }
+
+
+    // Back-propagate the gradients g of the spherical harmonics of the vectors in x to xg
+    template<typename GPART>
+    static void add_back(const map<int,GPART>& g, const TENSOR& x, const TENSOR& xg, const SO3radialBasis* radial=nullptr){
+      GELIB_ASSRT(x.ndims()>=3);
+      GELIB_ASSRT(x.dims(-2)==3);
+      GELIB_ASSRT(xg.dims==x.dims);
+      if(g.size()==0) return;
+      const int nc=x.dims(-1);
+      const int nr=radial?radial->n:1;
+      const int L=g.rbegin()->first;
+      for(auto& p:g)
+	GELIB_ASSRT(p.second.getn()==nc*nr);
+      if(g.begin()->second.get_dev()>0)
+	GELIB_ERROR("spherical harmonics are only implemented on the CPU");
+
+      TENSOR _x(canonical_4d(x));
+      TENSOR _xg(canonical_4d(xg));
+      const int B=_x.dims[0];
+      const int G=_x.dims[1];
+
+      vector<CTENSOR> r(L+1);
+      vector<bool> has(L+1,false);
+      for(auto& p:g){
+	GPART q=p.second.fuse_grid();
+	GELIB_ASSRT(q.dims[0]==B && q.dims[1]==G);
+	r[p.first].reset(q);
+	has[p.first]=true;
+      }
+
+      auto C=SO3_SPHgen.coefficients(L);
+      int ntiles=1;
+      if(B*G<get_nthreads()) ntiles=std::max(1,std::min(nc,get_nthreads()/(B*G)));
+
+      parallel_for(B*G*ntiles,[&](const int i){
+	  const int b=i/(G*ntiles);
+	  const int g=(i/ntiles)%G;
+	  const int t=i%ntiles;
+	  vector<float> Q(2*(L+1)*(L+1)+3*nr);
+	  add_back_cell(L,r,has,_x,_xg,b,g,(nc*t)/ntiles,(nc*(t+1))/ntiles,C.first,C.second,radial,Q.data());
+	});
+    }
+
+
+  private:
+
+    static TENSOR canonical_4d(const TENSOR& x){
+      TENSOR r(x);
+      if(x.ndims()==3){
+	r.dims=r.dims.insert(1,1);
+	r.strides=r.strides.insert(1,0);
+      }
+      if(x.ndims()>4) r.reset(GElib::canonicalize(x));
+      return r;
+    }
+
+    // With w=(x+iy)/r and t=z/r, Y_lm=Q(l,m)(t) w^m for m>=0 and Y_l,-m=(-1)^m conj(Y_lm), so that 
+    // dL/dv = T1 grad(t) + Re(T2 grad(w)) where T1=sum Re(H dQ w^m), T2=sum H Q m w^(m-1) and 
+    // H=conj(g_lm)+(-1)^m g_l,-m collects the incoming gradients of the two entries. With a radial basis, 
+    // H=sum_k R_k H_k over the channels of the vector, and the radial part of the gradient is 
+    // sum_k S_k dR_k/dr v/|v|, where S_k=sum Re(H_k Q w^m).
+    static void add_back_cell(const int L, const vector<CTENSOR>& r, const vector<bool>& has, const TENSOR& x, const TENSOR& xg, 
+      const int b, const int g, const int j0, const int j1, const TENSOR& c1, const TENSOR& c2, const SO3radialBasis* radial, float* Q){
+
+      float* dQ=Q+(L+1)*(L+1);
+      const int nr=radial?radial->n:1;
+      float* R=dQ+(L+1)*(L+1);
+      float* dR=R+nr;
+      float* S=dR+nr;
+      R[0]=1;
+      const TYPE* xp=x.mem()+b*x.strides[0]+g*x.strides[1];
+      const int xs=x.strides[2];
+      const int xc=x.strides[3];
+      TYPE* xgp=xg.mem()+b*xg.strides[0]+g*xg.strides[1];
+      const int xgs=xg.strides[2];
+      const int xgc=xg.strides[3];
+
+      vector<complex<TYPE>*> rp(L+1,nullptr);
+      vector<int> rs(L+1,0);
+      vector<int> rc(L+1,0);
+      for(int l=0; l<=L; l++)
+	if(has[l]){
+	  rp[l]=r[l].mem()+b*r[l].strides[0]+g*r[l].strides[1];
+	  rs[l]=r[l].strides[2];
+	  rc[l]=r[l].strides[3];
+	}
+
+      for(int j=j0; j<j1; j++){
+	float vx=xp[j*xc];
+	float vy=xp[xs+j*xc];
+	float vz=xp[2*xs+j*xc];
+	float length=sqrt(vx*vx+vy*vy+vz*vz);
+	if(length==0) continue;
+	float ct=vz/length;
+	complex<float> w(vx/length,vy/length);
+	SO3_SPHgen.legendre_Q(L,ct,c1,c2,Q,dQ);
+	if(radial){
+	  (*radial)(length,R,dR);
+	  for(int k=0; k<nr; k++) S[k]=0;
+	}
+
+	float T1=0;
+	complex<float> T2(0,0);
+	complex<float> wm1(0,0); // w^(m-1)
+	complex<float> wm(1.0,0); // w^m
+	for(int m=0; m<=L; m++){
+	  for(int l=m; l<=L; l++){
+	    if(!has[l]) continue;
+	    complex<float> H(0,0);
+	    for(int k=0; k<nr; k++){
+	      complex<float> Hk=std::conj(complex<float>(rp[l][(l+m)*rs[l]+(j*nr+k)*rc[l]]));
+	      if(m>0) Hk+=complex<float>(1-2*(m%2))*complex<float>(rp[l][(l-m)*rs[l]+(j*nr+k)*rc[l]]);
+	      H+=R[k]*Hk;
+	      if(radial) S[k]+=std::real(Hk*wm)*Q[l*(L+1)+m];
+	    }
+	    T1+=std::real(H*wm)*dQ[l*(L+1)+m];
+	    if(m>0) T2+=H*wm1*(Q[l*(L+1)+m]*m);
+	  }
+	  wm1=wm;
+	  wm*=w;
+	}
+
+	float r2=length*length;
+	float r3=r2*length;
+	float rho2=vx*vx+vy*vy;
+	float a=std::real(T2*w)/r2;
+	if(radial)
+	  for(int k=0; k<nr; k++) a-=S[k]*dR[k]/length;
+	xgp[j*xgc]+=-T1*vx*vz/r3+std::real(T2)/length-a*vx;
+	xgp[xgs+j*xgc]+=-T1*vy*vz/r3-std::imag(T2)/length-a*vy;
+	xgp[2*xgs+j*xgc]+=T1*rho2/r3-a*vz;
+      }
+    }
+
+    static void add_cell(const int L, const vector<CTENSOR>& r, const vector<bool>& has, const TENSOR& x, 
+      const int b, const int g, const int j0, const int j1, const TENSOR& c1, const TENSOR& c2, 
+      const SO3radialBasis* radial, float* P){
+
+      const int nr=radial?radial->n:1;
+      float* R=P+2*(L+1)*(L+1);
+      R[0]=1;
+
+      const TYPE* xp=x.mem()+b*x.strides[0]+g*x.strides[1];
+      const int xs=x.strides[2];
+      const int xc=x.strides[3];
+
+      vector<complex<TYPE>*> rp(L+1,nullptr);
+      vector<int> rs(L+1,0);
+      vector<int> rc(L+1,0);
+      for(int l=0; l<=L; l++)
+	if(has[l]){
+	  rp[l]=r[l].mem()+b*r[l].strides[0]+g*r[l].strides[1];
+	  rs[l]=r[l].strides[2];
+	  rc[l]=r[l].strides[3];
+	}
+
+      for(int j=j0; j<j1; j++){
+	float vx=xp[j*xc];
+	float vy=xp[xs+j*xc];
+	float vz=xp[2*xs+j*xc];
+	float length=sqrt(vx*vx+vy*vy+vz*vz);
+
+	// Y_lm=Q(l,m)(z/r) ((x+iy)/r)^m avoids computing sin(theta) as sqrt(1-cos^2(theta)), 
+	// which loses precision close to the poles. The zero vector is mapped to the north pole. 
+	complex<float> w(0,0);
+	float ct=1.0;
+	if(length>0){
+	  w=complex<float>(vx/length,vy/length);
+	  ct=vz/length;
+	}
+	SO3_SPHgen.legendre_Q(L,ct,c1,c2,P,P+(L+1)*(L+1));
+	if(radial) (*radial)(length,R,R+nr);
+
+	complex<float> phase(1.0,0);
+	for(int m=0; m<=L; m++){
+	  for(int l=m; l<=L; l++){
+	    if(!has[l]) continue;
+	    complex<TYPE> a=phase*complex<float>(P[l*(L+1)+m]);
+	    complex<TYPE> ac=complex<TYPE>(1-2*(m%2))*std::conj(a);
+	    for(int k=0; k<nr; k++){
+	      rp[l][(l+m)*rs[l]+(j*nr+k)*rc[l]]+=R[k]*a;
+	      if(m>0) rp[l][(l-m)*rs[l]+(j*nr+k)*rc[l]]+=R[k]*ac;
 	    }
-	  });
-      }// dev==0
- 
-   }
+	  }
+	  phase*=w;
+	}
+      }
+    }
 
   };
 
@@ -0,0 +1,138 @@
+// This file is part of GElib, a C++/CUDA library for group
+// equivariant tensor operations.
+//
+// Copyright (c) 2025, Imre Risi Kondor
+//
+// This Source Code Form is subject to the terms of the Mozilla
+// Public License v. 2.0. If a copy of the MPL was not distributed
+// with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+#ifndef _SO3radialBasis
+#define _SO3radialBasis
+
+#include "GElib_base.hpp"
+
+
+namespace GElib{
+
+
+  // A set of n radial functions R_0(r),...,R_{n-1}(r) of the length of the edge vectors, multiplied by
+  // a cutoff envelope u(r/cutoff) that vanishes smoothly at the cutoff.
+  //   bessel:     R_k(r)=sqrt(2/c) sin((k+1) pi r/c)/r
+  //   gaussian:   R_k(r)=exp(-(r-mu_k)^2/(2 sigma^2)) with mu_k=k c/(n-1) and sigma=c/(n-1)
+  //   polynomial: u(d)=1-(p+1)(p+2)/2 d^p+p(p+2) d^(p+1)-p(p+1)/2 d^(p+2)
+  //   cosine:     u(d)=(cos(pi d)+1)/2
+
+  class SO3radialBasis{
+  public:
+
+    enum class Basis{bessel,gaussian};
+    enum class Envelope{none,cosine,polynomial};
+
+    Basis basis;
+    int n;
+    float cutoff;
+    Envelope envelope;
+    int p;
+
+
+    SO3radialBasis(const string& _basis, const int _n, const float _cutoff,
+      const string& _envelope="polynomial", const int _p=6):
+      n(_n), cutoff(_cutoff), p(_p){
+      if(_basis=="bessel") basis=Basis::bessel;
+      else if(_basis=="gaussian") basis=Basis::gaussian;
+      else GELIB_ERROR("unknown radial basis '"+_basis+"'");
+      if(_envelope=="none") envelope=Envelope::none;
+      else if(_envelope=="cosine") envelope=Envelope::cosine;
+      else if(_envelope=="polynomial") envelope=Envelope::polynomial;
+      else GELIB_ERROR("unknown envelope '"+_envelope+"'");
+      GELIB_ASSRT(n>0);
+      GELIB_ASSRT(cutoff>0);
+      GELIB_ASSRT(p>0);
+    }
+
+
+  public: // ---- Evaluation ---------------------------------------------------------------------------------
+
+
+    // Write R_k(r) to R[k] and dR_k/dr to dR[k]
+    void operator()(const float r, float* R, float* dR) const{
+
+      if(basis==Basis::bessel){
+	const float pref=sqrt(2.0/cutoff);
+	for(int k=0; k<n; k++){
+	  const float a=(k+1)*M_PI/cutoff;
+	  if(r<1e-6){
+	    R[k]=pref*a;
+	    dR[k]=0;
+	  }else{
+	    const float s=sin(a*r);
+	    const float c=cos(a*r);
+	    R[k]=pref*s/r;
+	    dR[k]=pref*(a*c/r-s/(r*r));
+	  }
+	}
+      }
+
+      if(basis==Basis::gaussian){
+	const float sigma=(n>1)?cutoff/(n-1):cutoff;
+	const float s2=sigma*sigma;
+	for(int k=0; k<n; k++){
+	  const float d=r-((n>1)?k*cutoff/(n-1):0);
+	  R[k]=exp(-d*d/(2*s2));
+	  dR[k]=-d/s2*R[k];
+	}
+      }
+
+      if(envelope==Envelope::none) return;
+      const float d=r/cutoff;
+      float u=0;
+      float du=0;
+      if(d<1){
+	if(envelope==Envelope::cosine){
+	  u=0.5*(cos(M_PI*d)+1);
+	  du=-0.5*M_PI*sin(M_PI*d)/cutoff;
+	}
+	if(envelope==Envelope::polynomial){
+	  const float dp=pow(d,p);
+	  u=1-0.5*(p+1)*(p+2)*dp+p*(p+2)*dp*d-0.5*p*(p+1)*dp*d*d;
+	  du=-0.5*p*(p+1)*(p+2)*pow(d,p-1)*(1-d)*(1-d)/cutoff;
+	}
+      }
+      for(int k=0; k<n; k++){
+	dR[k]=dR[k]*u+R[k]*du;
+	R[k]*=u;
+      }
+    }
+
+
+  public: // ---- I/O ----------------------------------------------------------------------------------------
+
+
+    string classname() const{
+      return "GElib::SO3radialBasis";
+    }
+
+    string repr() const{
+      ostringstream oss;
+      oss<<"<SO3radialBasis "<<(basis==Basis::bessel?"bessel":"gaussian")<<" n="<<n<<" cutoff="<<cutoff;
+      if(envelope==Envelope::cosine) oss<<" envelope=cosine";
+      if(envelope==Envelope::polynomial) oss<<" envelope=polynomial(p="<<p<<")";
+      oss<<">";
+      return oss.str();
+    }
+
+    string str(const string indent="") const{
+      return indent+repr();
+    }
+
+    friend ostream& operator<<(ostream& stream, const SO3radialBasis& x){
+      stream<<x.str(); return stream;
+    }
+
+  };
+
+}
+
+#endif
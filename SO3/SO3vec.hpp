@@ -13,6 +13,8 @@
 #include "SO3part.hpp"
 #include "SO3type.hpp"
 #include "Gvec.hpp"
+#include "GvecCGplan.hpp"
+#include "SO3CGpower.hpp"
 
 
 namespace GElib{
@@ -60,6 +62,73 @@ namespace GElib{
     }
 
 
+  public: // ---- Packed storage -----------------------------------------------------------------------------
+
+
+    // View a tensor of dimensions (b,g1,...,gk,P) as an SO3vec of type tau whose parts are strided views
+    // into consecutive blocks of the last dimension, part l taking up (2l+1)*tau[l] columns stored m-major.
+    static SO3vec view_packed(const cnine::TensorView<complex<TYPE> >& x, const SO3type& tau){
+      const int d=x.ndims();
+      GELIB_ASSRT(d>=2);
+      const size_t s=x.strides[d-1];
+      SO3vec R;
+      int offs=0;
+      for(auto& p:tau.parts){
+	const int l=p.first;
+	const int n=p.second;
+	vector<size_t> strides(x.strides.begin(),x.strides.begin()+d-1);
+	strides.push_back(n*s);
+	strides.push_back(s);
+	R.parts.emplace(l,SO3part<TYPE>(cnine::TensorView<complex<TYPE> >(x.arr+offs*s,
+	      x.dims.remove(d-1).append(2*l+1).append(n),cnine::GstridesB(strides))));
+	offs+=(2*l+1)*n;
+      }
+      if(offs!=x.dims[d-1])
+	GELIB_ERROR("the last dimension of the packed tensor is "+to_string(x.dims[d-1])+
+	  " but an SO3vec of type "+tau.str()+" requires "+to_string(offs));
+      R._nbatch=x.dims[0];
+      R._gdims=x.dims.chunk(1,d-2);
+      R.dev=x.dev;
+      return R;
+    }
+
+
+  public: // ---- Spherical harmonics ----------------------------------------------------------------------
+
+
+    // The spherical harmonics Y_0,...,Y_L of the vectors stored in the columns of a tensor of dimensions 
+    // (b,g1,...,gk,3,n), as an SO3vec of type {0:n,...,L:n}
+    static SO3vec spharm(const int L, const cnine::TensorView<TYPE>& x){
+      GELIB_ASSRT(x.ndims()>=3);
+      GELIB_ASSRT(x.dims(-2)==3);
+      SO3type tau;
+      for(int l=0; l<=L; l++) tau[l]=x.dims(-1);
+      SO3vec R(x.dims[0],x.dims.chunk(1,x.ndims()-3),tau,0,x.get_dev());
+      R.add_spharm(x);
+      return R;
+    }
+
+    // Add the spherical harmonics of the vectors in x to each part in a single pass
+    void add_spharm(const cnine::TensorView<TYPE>& x){
+      SO3part_addSpharmFn<TYPE>::add(parts,x);
+    }
+
+    // Regarding this vector as the gradient of spharm(x), add the gradient with respect to x to xg 
+    void add_spharm_back(const cnine::TensorView<TYPE>& xg, const cnine::TensorView<TYPE>& x) const{
+      SO3part_addSpharmFn<TYPE>::add_back(parts,x,xg);
+    }
+
+    // Add the products R_k(|v|)Y_l(v/|v|) of the radial functions and the spherical harmonics of the
+    // vectors v in x, which is an embedding of type {0:n*K,...,L:n*K} for n vectors and K radial functions
+    void add_spharm(const cnine::TensorView<TYPE>& x, const SO3radialBasis& radial){
+      SO3part_addSpharmFn<TYPE>::add(parts,x,&radial);
+    }
+
+    void add_spharm_back(const cnine::TensorView<TYPE>& xg, const cnine::TensorView<TYPE>& x, const SO3radialBasis& radial) const{
+      SO3part_addSpharmFn<TYPE>::add_back(parts,x,xg,&radial);
+    }
+
+
   public: // ---- Access -------------------------------------------------------------------------------------
 
 
@@ -14,4 +14,8 @@ int main(int argc, char** argv){
   auto CGmatrix=SO3_CGbank.get<float>(1,1,1);
   cout<<CGmatrix<<endl;
 
+  auto& CGsparse=SO3_CGbank.get_sparse<float>(2,1,2);
+  cout<<CGsparse.repr()<<endl;
+  cout<<CGsparse<<endl;
+
 }
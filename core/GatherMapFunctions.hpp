@@ -0,0 +1,219 @@
+// This file is part of GElib, a C++/CUDA library for group
+// equivariant tensor operations.
+//
+// Copyright (c) 2025, Imre Risi Kondor
+//
+// This Source Code Form is subject to the terms of the Mozilla
+// Public License v. 2.0. If a copy of the MPL was not distributed
+// with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+#ifndef _GatherMapFunctions
+#define _GatherMapFunctions
+
+#include "GElib_base.hpp"
+#include "GElibThreadPool.hpp"
+#include "GatherMapB.hpp"
+
+
+namespace GElib{
+
+
+  // Build the gather map in which each target t collects the sources of the edges (src[i],tgt[i])
+  // pointing to it, in the order in which the edges are given. The edge lists are read in place with
+  // strides src_stride and tgt_stride. If n_in or n_out is negative it is taken to be one more than
+  // the largest source or target index. The lists are formed by a counting sort: each thread
+  // histograms its own chunk of edges, and then scatters them to its own precomputed slots.
+  inline cnine::GatherMapB gather_map_from_edges(const int64_t* src, const int64_t* tgt, const int E,
+    const size_t src_stride, const size_t tgt_stride, int n_in=-1, int n_out=-1){
+
+    const int nchunks=std::max(1,std::min(get_nthreads(),E/4096));
+    const int chunk=(E+nchunks-1)/nchunks;
+    auto chunk_end=[&](const int c){return std::min(E,(c+1)*chunk);};
+
+    vector<int64_t> mins(2*nchunks,0);
+    vector<int64_t> maxs(2*nchunks,-1);
+    parallel_for(nchunks,[&](const int c){
+	for(int i=c*chunk; i<chunk_end(c); i++){
+	  const int64_t s=src[i*src_stride];
+	  const int64_t t=tgt[i*tgt_stride];
+	  mins[2*c]=std::min(mins[2*c],s);
+	  maxs[2*c]=std::max(maxs[2*c],s);
+	  mins[2*c+1]=std::min(mins[2*c+1],t);
+	  maxs[2*c+1]=std::max(maxs[2*c+1],t);
+	}
+      });
+    int64_t min_s=0, max_s=-1, min_t=0, max_t=-1;
+    for(int c=0; c<nchunks; c++){
+      min_s=std::min(min_s,mins[2*c]);
+      max_s=std::max(max_s,maxs[2*c]);
+      min_t=std::min(min_t,mins[2*c+1]);
+      max_t=std::max(max_t,maxs[2*c+1]);
+    }
+    if(n_in<0) n_in=max_s+1;
+    if(n_out<0) n_out=max_t+1;
+    if(min_s<0 || max_s>=n_in)
+      GELIB_ERROR("source indices must be in the range [0,"+to_string(n_in)+")");
+    if(min_t<0 || max_t>=n_out)
+      GELIB_ERROR("target indices must be in the range [0,"+to_string(n_out)+")");
+
+    // offsets[c*n_out+t] first counts the edges to t in chunk c, then becomes the slot in list t
+    // where chunk c starts writing
+    vector<int> offsets(nchunks*n_out,0);
+    parallel_for(nchunks,[&](const int c){
+	int* count=offsets.data()+c*n_out;
+	for(int i=c*chunk; i<chunk_end(c); i++)
+	  count[tgt[i*tgt_stride]]++;
+      });
+
+    vector<int> list_of(n_out,-1);
+    vector<int> heads;
+    vector<int> lengths;
+    for(int t=0; t<n_out; t++){
+      int len=0;
+      for(int c=0; c<nchunks; c++){
+	int n=offsets[c*n_out+t];
+	offsets[c*n_out+t]=len;
+	len+=n;
+      }
+      if(len==0) continue;
+      list_of[t]=heads.size();
+      heads.push_back(t);
+      lengths.push_back(len);
+    }
+
+    cnine::GatherMapB R(n_out,n_in);
+    R.arr=cnine::hlists<int>(heads,lengths);
+    parallel_for(nchunks,[&](const int c){
+	int* slot=offsets.data()+c*n_out;
+	for(int i=c*chunk; i<chunk_end(c); i++){
+	  const int t=tgt[i*tgt_stride];
+	  R.arr.set(list_of[t],slot[t]++,src[i*src_stride]);
+	}
+      });
+    return R;
+  }
+
+
+
+  // The gather map in which each point t collects the points s!=t of the same batch that lie within
+  // distance cutoff of it, in increasing order of s. If max_neighbors>0, only the max_neighbors nearest
+  // ones are kept. pos is an (N,3) tensor and batch is either empty or holds the nonnegative batch
+  // index of each point. The points are hashed into a grid of cells of side cutoff, so each point
+  // only has to be compared with the points in the 27 cells around it.
+  inline cnine::GatherMapB radius_graph(const cnine::TensorView<float>& pos, const float cutoff,
+    const cnine::TensorView<int>& batch, const int max_neighbors=-1){
+    GELIB_ASSRT(pos.ndims()==2 && pos.dims[1]==3);
+    GELIB_ASSRT(cutoff>0);
+    const int N=pos.dims[0];
+    const bool batched=batch.ndims()==1 && batch.dims[0]>0;
+    if(batched) GELIB_ASSRT(batch.dims[0]==N);
+    auto p=[&](const int i, const int j){return pos.mem()[i*pos.strides[0]+j*pos.strides[1]];};
+    auto b=[&](const int i){return batched?batch.mem()[i*batch.strides[0]]:0;};
+
+    float lo[3]={0,0,0};
+    float hi[3]={0,0,0};
+    int nb=1;
+    for(int i=0; i<N; i++){
+      for(int j=0; j<3; j++){
+	lo[j]=(i==0)?p(i,j):std::min(lo[j],p(i,j));
+	hi[j]=(i==0)?p(i,j):std::max(hi[j],p(i,j));
+      }
+      if(b(i)<0) GELIB_ERROR("batch indices must be nonnegative");
+      nb=std::max(nb,b(i)+1);
+    }
+    int64_t n[3];
+    double ncells=nb;
+    for(int j=0; j<3; j++){
+      n[j]=(int64_t)((hi[j]-lo[j])/cutoff)+1;
+      ncells*=n[j];
+    }
+    if(ncells>4e18) GELIB_ERROR("the cutoff is too small compared to the extent of the point cloud");
+    auto cell=[&](const int i, const int j){
+      return std::min(n[j]-1,(int64_t)((p(i,j)-lo[j])/cutoff));};
+    auto key=[&](const int64_t bb, const int64_t x, const int64_t y, const int64_t z){
+      return ((bb*n[2]+z)*n[1]+y)*n[0]+x;};
+
+    vector<pair<int64_t,int> > sorted(N);
+    for(int i=0; i<N; i++)
+      sorted[i]=make_pair(key(b(i),cell(i,0),cell(i,1),cell(i,2)),i);
+    std::sort(sorted.begin(),sorted.end());
+    unordered_map<int64_t,pair<int,int> > cells;
+    for(int i=0; i<N; ){
+      int j=i;
+      while(j<N && sorted[j].first==sorted[i].first) j++;
+      cells[sorted[i].first]=make_pair(i,j);
+      i=j;
+    }
+
+    const float cutoff2=cutoff*cutoff;
+    const int nchunks=std::max(1,std::min(get_nthreads()*4,N/256));
+    const int chunk=(N+nchunks-1)/nchunks;
+    vector<vector<int> > nbrs(N);
+    parallel_for(nchunks,[&](const int c){
+	vector<pair<float,int> > found;
+	for(int t=c*chunk; t<std::min(N,(c+1)*chunk); t++){
+	  found.clear();
+	  const int64_t cx=cell(t,0), cy=cell(t,1), cz=cell(t,2);
+	  for(int64_t z=std::max<int64_t>(cz-1,0); z<=std::min(cz+1,n[2]-1); z++)
+	    for(int64_t y=std::max<int64_t>(cy-1,0); y<=std::min(cy+1,n[1]-1); y++)
+	      for(int64_t x=std::max<int64_t>(cx-1,0); x<=std::min(cx+1,n[0]-1); x++){
+		auto it=cells.find(key(b(t),x,y,z));
+		if(it==cells.end()) continue;
+		for(int k=it->second.first; k<it->second.second; k++){
+		  const int s=sorted[k].second;
+		  if(s==t) continue;
+		  float d2=0;
+		  for(int j=0; j<3; j++)
+		    d2+=(p(s,j)-p(t,j))*(p(s,j)-p(t,j));
+		  if(d2<=cutoff2) found.push_back(make_pair(d2,s));
+		}
+	      }
+	  if(max_neighbors>=0 && (int)found.size()>max_neighbors){
+	    std::partial_sort(found.begin(),found.begin()+max_neighbors,found.end());
+	    found.resize(max_neighbors);
+	  }
+	  auto& v=nbrs[t];
+	  v.resize(found.size());
+	  for(int k=0; k<found.size(); k++) v[k]=found[k].second;
+	  std::sort(v.begin(),v.end());
+	}
+      });
+
+    vector<int> heads;
+    vector<int> lengths;
+    for(int t=0; t<N; t++)
+      if(nbrs[t].size()>0){
+	heads.push_back(t);
+	lengths.push_back(nbrs[t].size());
+      }
+    cnine::GatherMapB R(N,N);
+    R.arr=cnine::hlists<int>(heads,lengths);
+    parallel_for(heads.size(),[&](const int k){
+	auto& v=nbrs[heads[k]];
+	for(int j=0; j<v.size(); j++)
+	  R.arr.set(k,j,v[j]);
+      });
+    return R;
+  }
+
+
+  // The (source,target) pairs of a gather map in list order, as the columns of a (2,E) tensor
+  inline cnine::TensorView<int> gather_map_edges(const cnine::GatherMapB& map){
+    vector<int> offs(map.size()+1,0);
+    for(int k=0; k<map.size(); k++)
+      offs[k+1]=offs[k]+map.size_of(k);
+    cnine::TensorView<int> R(cnine::Gdims({2,offs.back()}),0,0);
+    parallel_for(map.size(),[&](const int k){
+	const int t=map.target(k);
+	for(int j=0; j<map.size_of(k); j++){
+	  R.set(0,offs[k]+j,map(k,j));
+	  R.set(1,offs[k]+j,t);
+	}
+      });
+    return R;
+  }
+
+}
+
+#endif
@@ -19,6 +19,7 @@
 #include "TensorView.hpp"
 #include "NamedTypes.hpp"
 #include "MultiLoop.hpp"
+#include "GElibThreadPool.hpp"
 #include "TensorUtils.hpp"
 #include "GatherSlices.hpp"
 #include "BatchedTensor.hpp"
@@ -524,6 +525,174 @@ namespace GElib{
       cnine::GatherSlices()(*this,r,gmap.inv(),d+1);
     }
 
+
+    // Segment reductions along grid dimension d: cell t of the result receives the sum, the mean, or, 
+    // separately for each channel, the element of largest norm of the cells s of x in the list of t 
+    // in gmap. The lists are processed in parallel, each task writing only its own output cell. 
+    // The backward passes go over gmap.inv(), which is computed once and cached on the map. 
+
+    void add_segment_sum(const GPART& x, const cnine::GatherMapB& gmap, const int d=0, const bool mean=false){
+      TENSOR r=split_grid(*this,d,2);
+      TENSOR _x=split_grid(x,d,2);
+      check_segment_args(r,_x,gmap);
+      parallel_for(gmap.size(),[&](const int k){
+	  const int n=gmap.size_of(k);
+	  const TYPE c=mean?TYPE(1.0/n):TYPE(1.0);
+	  TENSOR rt=r.slice(2,gmap.target(k));
+	  for(int j=0; j<n; j++)
+	    add_cells(rt,_x.slice(2,gmap(k,j)),c);
+	});
+    }
+
+    void add_segment_sum_back(const GPART& g, const cnine::GatherMapB& gmap, const int d=0, const bool mean=false){
+      TENSOR xg=split_grid(*this,d,2);
+      TENSOR _g=split_grid(g,d,2);
+      check_segment_args(_g,xg,gmap);
+      vector<int> count(_g.dims[2],1);
+      if(mean) 
+	for(int k=0; k<gmap.size(); k++)
+	  count[gmap.target(k)]=gmap.size_of(k);
+      const cnine::GatherMapB& inv=gmap.inv();
+      parallel_for(inv.size(),[&](const int k){
+	  TENSOR xgs=xg.slice(2,inv.target(k));
+	  for(int j=0; j<inv.size_of(k); j++){
+	    const int t=inv(k,j);
+	    add_cells(xgs,_g.slice(2,t),TYPE(1.0/count[t]));
+	  }
+	});
+    }
+
+    // argmax has the dimensions of the result without the m dimension and receives the index of the 
+    // selected cell, or is left untouched for targets with no sources.
+    void add_segment_max_norm(const GPART& x, const cnine::GatherMapB& gmap, const int d, 
+      const cnine::TensorView<int>& argmax){
+      TENSOR r=split_grid(*this,d,2);
+      TENSOR _x=split_grid(x,d,2);
+      cnine::TensorView<int> amax=split_grid(argmax,d,1);
+      check_segment_args(r,_x,gmap);
+      GELIB_ASSRT(amax.dims==r.dims.remove(4));
+      const int B=r.dims[0], A=r.dims[1], C=r.dims[3], M=r.dims[4], N=r.dims[5];
+      parallel_for(gmap.size(),[&](const int k){
+	  const int t=gmap.target(k);
+	  const int n=gmap.size_of(k);
+	  for(int b=0; b<B; b++)
+	    for(int a=0; a<A; a++)
+	      for(int c=0; c<C; c++)
+		for(int j=0; j<N; j++){
+		  int best=-1;
+		  float best_norm=-1;
+		  for(int i=0; i<n; i++){
+		    const int s=gmap(k,i);
+		    const TYPE* xp=_x.mem()+b*_x.strides[0]+a*_x.strides[1]+s*_x.strides[2]+c*_x.strides[3]+j*_x.strides[5];
+		    float norm=0;
+		    for(int m=0; m<M; m++)
+		      norm+=std::norm(xp[m*_x.strides[4]]);
+		    if(norm>best_norm){best=s; best_norm=norm;}
+		  }
+		  if(best<0) continue;
+		  const TYPE* xp=_x.mem()+b*_x.strides[0]+a*_x.strides[1]+best*_x.strides[2]+c*_x.strides[3]+j*_x.strides[5];
+		  TYPE* rp=r.mem()+b*r.strides[0]+a*r.strides[1]+t*r.strides[2]+c*r.strides[3]+j*r.strides[5];
+		  for(int m=0; m<M; m++)
+		    rp[m*r.strides[4]]+=xp[m*_x.strides[4]];
+		  amax.mem()[b*amax.strides[0]+a*amax.strides[1]+t*amax.strides[2]+c*amax.strides[3]+j*amax.strides[4]]=best;
+		}
+	});
+    }
+
+    void add_segment_max_norm_back(const GPART& g, const cnine::GatherMapB& gmap, const int d, 
+      const cnine::TensorView<int>& argmax){
+      TENSOR xg=split_grid(*this,d,2);
+      TENSOR _g=split_grid(g,d,2);
+      cnine::TensorView<int> amax=split_grid(argmax,d,1);
+      check_segment_args(_g,xg,gmap);
+      GELIB_ASSRT(amax.dims==_g.dims.remove(4));
+      const int B=_g.dims[0], A=_g.dims[1], C=_g.dims[3], M=_g.dims[4], N=_g.dims[5];
+      const cnine::GatherMapB& inv=gmap.inv();
+      parallel_for(inv.size(),[&](const int k){
+	  const int s=inv.target(k);
+	  for(int i=0; i<inv.size_of(k); i++){
+	    const int t=inv(k,i);
+	    for(int b=0; b<B; b++)
+	      for(int a=0; a<A; a++)
+		for(int c=0; c<C; c++)
+		  for(int j=0; j<N; j++){
+		    if(amax.mem()[b*amax.strides[0]+a*amax.strides[1]+t*amax.strides[2]+c*amax.strides[3]+j*amax.strides[4]]!=s) continue;
+		    const TYPE* gp=_g.mem()+b*_g.strides[0]+a*_g.strides[1]+t*_g.strides[2]+c*_g.strides[3]+j*_g.strides[5];
+		    TYPE* xp=xg.mem()+b*xg.strides[0]+a*xg.strides[1]+s*xg.strides[2]+c*xg.strides[3]+j*xg.strides[5];
+		    for(int m=0; m<M; m++)
+		      xp[m*xg.strides[4]]+=gp[m*_g.strides[4]];
+		  }
+	  }
+	});
+    }
+
+
+  private:
+
+    // View a tensor of dimensions (b,g1,...,gk,c1,...,c_ncell) as (b,A,g_{d+1},C,c1,...,c_ncell), where 
+    // A and C are the fused grid dimensions before and after the d'th one.
+    template<typename TYPE2>
+    static cnine::TensorView<TYPE2> split_grid(const cnine::TensorView<TYPE2>& x, const int d, const int ncell){
+      const int k=x.ndims()-1-ncell;
+      GELIB_ASSRT(d>=0 && d<k);
+      auto fused=[&](const int beg, const int n){
+	if(n==0) return std::pair<size_t,int>(0,1);
+	auto p=x.strides.chunk(beg,n).fuser(x.dims.chunk(beg,n));
+	if(p.second==-1) GELIB_ERROR("the grid dimensions of the tensor cannot be fused.");
+	return p;
+      };
+      auto [sa,A]=fused(1,d);
+      auto [sc,C]=fused(d+2,k-d-1);
+      cnine::TensorView<TYPE2> R(x);
+      R.dims=cnine::Gdims({x.dims[0],A,x.dims[d+1],C}).cat(x.dims.chunk(k+1,ncell));
+      R.strides=cnine::GstridesB({x.strides[0],sa,x.strides[d+1],sc});
+      for(int i=k+1; i<=k+ncell; i++)
+	R.strides.push_back(x.strides[i]);
+      return R;
+    }
+
+    static void check_segment_args(const TENSOR& r, const TENSOR& x, const cnine::GatherMapB& gmap){
+      if(r.get_dev()>0 || x.get_dev()>0)
+	GELIB_ERROR("segment reductions are only implemented on the CPU");
+      if(r.dims.remove(2)!=x.dims.remove(2))
+	GELIB_ERROR("the dimensions of "+r.dims.str()+" and "+x.dims.str()+" are incompatible");
+      gmap.for_each([&](const int t, const int s){
+	  if(t>=r.dims[2] || s>=x.dims[2])
+	    GELIB_ERROR("the gather map refers to out of range cells "+to_string(s)+"->"+to_string(t)+".");
+	});
+    }
+
+    // r+=c*x for two tensors of dimensions (b,A,C,2l+1,n)
+    static void add_cells(const TENSOR& r, const TENSOR& x, const TYPE c){
+      const int B=r.dims[0], A=r.dims[1], C=r.dims[2], M=r.dims[3], N=r.dims[4];
+      for(int b=0; b<B; b++)
+	for(int a=0; a<A; a++)
+	  for(int i=0; i<C; i++){
+	    TYPE* rp=r.mem()+b*r.strides[0]+a*r.strides[1]+i*r.strides[2];
+	    const TYPE* xp=x.mem()+b*x.strides[0]+a*x.strides[1]+i*x.strides[2];
+	    for(int m=0; m<M; m++)
+	      for(int j=0; j<N; j++)
+		rp[m*r.strides[3]+j*r.strides[4]]+=c*xp[m*x.strides[3]+j*x.strides[4]];
+	  }
+    }
+
+
+  public: // ---- Row views ------------------------------------------------------------------------------------
+
+
+    // View a part of dimensions (b,g1,...,gk,m,n) as a tensor of dimensions (b*g1*...*gk,m,n)
+    static TENSOR cell_rows(const TENSOR& x){
+      const int d=x.ndims();
+      GELIB_ASSRT(d>=3);
+      auto p=x.strides.chunk(0,d-2).fuser(x.dims.chunk(0,d-2));
+      if(p.second==-1) GELIB_ERROR("the batch and grid dimensions of the tensor cannot be fused.");
+      TENSOR R(x);
+      R.dims=cnine::Gdims({p.second,x.dims[d-2],x.dims[d-1]});
+      R.strides=cnine::GstridesB({p.first,x.strides[d-2],x.strides[d-1]});
+      return R;
+    }
+
+
  
   public: // ---- CG-products --------------------------------------------------------------------------------
 
@@ -540,183 +709,764 @@ namespace GElib{
 
 
     void add_CGproduct(GPART x, GPART y, const int offs=0){
-      GPART r(*this);
-      const int dev=r.dev;
-      GELIB_ASSRT(x.get_dev()==dev);
-      GELIB_ASSRT(y.get_dev()==dev);
+      add_CGproduct_paths({static_cast<GPART&>(*this)},x,y,{offs});
+    }
 
-      if(!r.reconcile_batches(x,y))
-	GELIB_NONFATAL("Skipping CGproduct: batch dimensions cannot be reconciled.");
 
-      if(!r.reconcile_grids(x,y))
-	GELIB_NONFATAL("Skipping CGproduct: grid dimensions cannot be reconciled.");
+    void add_CGproduct_back0(GPART r, GPART y, const int offs=0){
+      add_CGproduct_back0_paths({r},static_cast<GPART&>(*this),y,{offs});
+    }
 
-      r.co_canonicalize_to_5d(x,y);
 
-      if(dev==0){
-	auto C=r.get_CGmatrix(x,y);
-	r.for_each_cell_multi(x,y,[&](const TENSOR& r, const TENSOR& x, const TENSOR& y){
-	    GPART::add_CGproduct_kernel(r,x,y,C,offs);
-	      });
-      }
+    void add_CGproduct_back1(GPART r, GPART x, const int offs=0){
+      add_CGproduct_back1_paths({r},x,static_cast<GPART&>(*this),{offs});
+    }
 
-      if(dev==1){
-	GPART::add_CGproduct_dev(r,x,y,offs);
-      }
 
+    // Called on the gradient of the product: add the gradients with respect to x and y to xg and yg
+    void add_CGproduct_back01(GPART xg, GPART yg, GPART x, GPART y, const int offs=0) const{
+      add_CGproduct_back01_paths({static_cast<const GPART&>(*this)},x,y,{offs},xg,yg);
     }
 
 
-    void add_CGproduct_back0(GPART r, GPART y, const int offs=0){
-      GPART x(*this);
-      const int dev=r.dev;
-      GELIB_ASSRT(x.get_dev()==dev);
-      GELIB_ASSRT(y.get_dev()==dev);
+  public: // ---- Diagonal CG-products -----------------------------------------------------------------------
+
+
+    template<typename GPART2> // dummy template to break circular dependency
+    GPART DiagCGproduct(const GPART2& y, const typename GPART2::IRREP_IX& l) const{
+      auto& x=static_cast<const GPART&>(*this);
+      int m=GPART::GROUP::CGmultiplicity(x.getl(),y.getl(),l);
+      GELIB_ASSRT(m>0);
+      GELIB_ASSRT(x.getn()==y.getn())
+      GPART R(x.dominant_batch(y),x.dominant_gdims(y),l,x.getn(),0,dev);
+      R.add_DiagCGproduct(x,y);
+      return R;
+    }
 
-      if(!r.reconcile_batches(x,y))
-	GELIB_NONFATAL("Skipping CGproduct: batch dimensions cannot be reconciled.");
 
-      if(!r.reconcile_grids(x,y))
-	GELIB_NONFATAL("Skipping CGproduct: grid dimensions cannot be reconciled.");
+    void add_DiagCGproduct(GPART x, GPART y, const int offs=0){
+      add_DiagCGproduct_paths({static_cast<GPART&>(*this)},x,y,{offs});
+    }
 
-      r.co_canonicalize_to_5d(x,y);
 
-      if(dev==0){
-	auto C=r.get_CGmatrix(x,y);
-	x.for_each_cell_multi(r,y,[&](const TENSOR& x, const TENSOR& r, const TENSOR& y){
-	    GPART::add_CGproduct_back0_kernel(r,x,y,C,offs);});
-      }
+    void add_DiagCGproduct_back0(GPART r, GPART y, const int offs=0){
+      add_DiagCGproduct_back0_paths({r},static_cast<GPART&>(*this),y,{offs});
+    }
 
-      if(dev==1){
-	GPART::add_CGproduct_back0_dev(r,x,y,offs);
-      }
 
+    void add_DiagCGproduct_back1(GPART r, GPART x, const int offs=0){
+      add_DiagCGproduct_back1_paths({r},x,static_cast<GPART&>(*this),{offs});
     }
 
 
-    void add_CGproduct_back1(GPART r, GPART x, const int offs=0){
-      GPART y(*this);
-      const int dev=r.dev;
-      GELIB_ASSRT(x.get_dev()==dev);
-      GELIB_ASSRT(y.get_dev()==dev);
+    void add_DiagCGproduct_back01(GPART xg, GPART yg, GPART x, GPART y, const int offs=0) const{
+      add_DiagCGproduct_back01_paths({static_cast<const GPART&>(*this)},x,y,{offs},xg,yg);
+    }
 
-      if(!r.reconcile_batches(x,y))
-	GELIB_NONFATAL("Skipping CGproduct: batch dimensions cannot be reconciled.");
 
-      if(!r.reconcile_grids(x,y))
-	GELIB_NONFATAL("Skipping CGproduct: grid dimensions cannot be reconciled.");
 
-      r.co_canonicalize_to_5d(x,y);
+  public: // ---- Multi-path CG-products -------------------------------------------------------------------
 
-      if(dev==0){
-	auto C=r.get_CGmatrix(x,y);
-	y.for_each_cell_multi(r,x,[&](const TENSOR& y, const TENSOR& r, const TENSOR& x){
-	    GPART::add_CGproduct_back1_kernel(r,x,y,C,offs);});
-      }
 
-      if(dev==1){
-	GPART::add_CGproduct_back1_dev(r,x,y,offs);
+    // The following variants take all the output parts r[i] that a given pair of input parts
+    // contributes to, reconcile and canonicalize the operands just once, and then
+    // compute every path in a single sweep over the cells of x and y. The CG coefficients
+    // of the paths can be passed in C, otherwise they are looked up in the bank.
+
+    static bool co_canonicalize_paths(vector<GPART>& r, GPART& x, GPART& y){
+      for(int pass=0; pass<2; pass++) // second pass propagates promotions to the earlier paths
+	for(auto& p:r){
+	  if(!p.reconcile_batches(x,y)) return false;
+	  if(!p.reconcile_grids(x,y)) return false;
+	}
+      for(auto& p:r){
+	GPART _x(x);
+	GPART _y(y);
+	p.co_canonicalize_to_5d(_x,_y);
       }
+      x.canonicalize_to_5d();
+      y.canonicalize_to_5d();
+      return true;
+    }
 
+    // True if distinct (b,g0,g1) cells of the canonicalized tensor x occupy distinct memory,
+    // i.e., x has not been broadcast along any of the first three dimensions.
+    static bool cells_are_disjoint(const GPART& x){
+      for(int i=0; i<3; i++)
+	if(x.dims[i]>1 && x.strides[i]==0) return false;
+      return true;
     }
 
+    static auto get_CGcoeffs_paths(const vector<GPART>& r, const GPART& x, const GPART& y){
+      vector<const typename GPART::CGCOEFFS*> C;
+      for(auto p:r) C.push_back(&p.get_CGcoeffs(x,y));
+      return C;
+    }
 
-  public: // ---- Diagonal CG-products -----------------------------------------------------------------------
+    // Distributes the work over the thread pool. Cells are processed in parallel only if the tensor
+    // being accumulated into is not broadcast across them and paths only if parallel_paths is set.
+    // If this gives fewer work items than threads, the channels are also split into tiles:
+    // with tiling==1 the channels of x are tiled (outer products), with tiling==2 those of x and y
+    // together (diagonal products). The last argument of lambda is the resulting shift of offs.
+    static void for_each_cell_multi_paths(const vector<GPART>& r, const GPART& x, const GPART& y,
+      const bool parallel_cells, const bool parallel_paths, const int tiling,
+      const std::function<void(const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y, const int offs)>& lambda){
+      const int npaths=r.size();
+      const int g0=x.dims[1];
+      const int g1=x.dims[2];
+      const int ncells=x.dims[0]*g0*g1;
+      const int N=x.dims[4];
+
+      const int nc=parallel_cells?ncells:1;
+      const int np=parallel_paths?npaths:1;
+      int ntiles=1;
+      if(tiling>0 && nc*np<get_nthreads())
+	ntiles=std::max(1,std::min(N,(get_nthreads()+nc*np-1)/(nc*np)));
+
+      parallel_for(nc*np*ntiles,[&](const int k){
+	  const int t=k%ntiles;
+	  const int p=(k/ntiles)%np;
+	  const int c=k/(ntiles*np);
+	  const int a=(N*t)/ntiles;
+	  const int e=(N*(t+1))/ntiles;
+	  if(a==e) return;
+	  const int shift=(tiling==1)?a*y.dims[4]:a;
+	  for(int cell=(parallel_cells?c:0); cell<(parallel_cells?c+1:ncells); cell++){
+	    const int b=cell/(g0*g1);
+	    const int i0=(cell/g1)%g0;
+	    const int i1=cell%g1;
+	    TENSOR xcell=x.slice(0,b).slice(0,i0).slice(0,i1);
+	    TENSOR ycell=y.slice(0,b).slice(0,i0).slice(0,i1);
+	    TENSOR xc=(ntiles>1)?xcell.block(0,a,xcell.dims[0],e-a):xcell;
+	    TENSOR yc=(ntiles>1 && tiling==2)?ycell.block(0,a,ycell.dims[0],e-a):ycell;
+	    for(int i=(parallel_paths?p:0); i<(parallel_paths?p+1:npaths); i++)
+	      lambda(i,r[i].slice(0,b).slice(0,i0).slice(0,i1),xc,yc,shift);
+	  }
+	});
+    }
 
+    // The cell chunk count and channel tile size of the reductions in the backward passes.
+    static constexpr int reduction_chunks=16;
+    static constexpr int reduction_tile=32;
+
+    // Distributes a backward pass accumulating into x (target==0) or y (target==1) over the thread pool
+    // so that the result is bit for bit the same for any number of threads. If the target is broadcast
+    // across the cells, the cells are split into a fixed number of chunks. If reduce_channels is set and
+    // there are fewer than reduction_chunks cells, the channels of x, which the pass sums over, are also
+    // split into tiles of at most reduction_tile channels. Each chunk and tile accumulates into its own
+    // zero initialized copy of the target, and the copies are added to it in a fixed order at the end.
+    // The channels of the target can also be tiled as in for_each_cell_multi_paths, since those tiles
+    // write to disjoint channels.
+    static void for_each_cell_multi_paths_back(const vector<GPART>& r, const GPART& x, const GPART& y,
+      const int target, const int tiling, const bool reduce_channels,
+      const std::function<void(const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y, const int offs)>& lambda){
+      GELIB_ASSRT(!reduce_channels || (target==1 && tiling==0));
+      const GPART& t=(target==0)?x:y;
+      const int npaths=r.size();
+      const int g0=x.dims[1];
+      const int g1=x.dims[2];
+      const int ncells=x.dims[0]*g0*g1;
+      const int N=x.dims[4];
+      const bool disjoint=cells_are_disjoint(t);
+
+      const int nc=disjoint?ncells:std::max(1,std::min(ncells,reduction_chunks));
+      const int nred=(reduce_channels && ncells<reduction_chunks)?std::max(1,(N+reduction_tile-1)/reduction_tile):1;
+      const bool local=(!disjoint && nc>1) || nred>1;
+      const int ncopies=local?(disjoint?1:nc)*nred:0;
+      int ntiles=1;
+      if(tiling>0 && nc*nred<get_nthreads())
+	ntiles=std::max(1,std::min(N,(get_nthreads()+nc*nred-1)/(nc*nred)));
+
+      vector<TENSOR> acc;
+      for(int j=0; j<ncopies; j++)
+	acc.push_back(broadcast_zeros_like(t));
+
+      parallel_for(nc*nred*ntiles,[&](const int k){
+	  const int s=k%ntiles;
+	  const int u=(k/ntiles)%nred;
+	  const int c=k/(ntiles*nred);
+	  const int a=(N*s)/ntiles;
+	  const int e=(N*(s+1))/ntiles;
+	  const int ra=(N*u)/nred;
+	  const int re=(N*(u+1))/nred;
+	  if(a==e || ra==re) return;
+	  const int shift=(tiling==1)?a*y.dims[4]:((tiling==2)?a:ra*y.dims[4]);
+	  const TENSOR dest=local?acc[(disjoint?0:c)*nred+u]:TENSOR(t);
+	  const int cbegin=disjoint?c:(ncells*c)/nc;
+	  const int cend=disjoint?c+1:(ncells*(c+1))/nc;
+	  for(int cell=cbegin; cell<cend; cell++){
+	    const int b=cell/(g0*g1);
+	    const int i0=(cell/g1)%g0;
+	    const int i1=cell%g1;
+	    TENSOR xcell=((target==0)?dest:x).slice(0,b).slice(0,i0).slice(0,i1);
+	    TENSOR ycell=((target==1)?dest:y).slice(0,b).slice(0,i0).slice(0,i1);
+	    TENSOR xc=(ntiles>1)?xcell.block(0,a,xcell.dims[0],e-a):((nred>1)?xcell.block(0,ra,xcell.dims[0],re-ra):xcell);
+	    TENSOR yc=(ntiles>1 && tiling==2)?ycell.block(0,a,ycell.dims[0],e-a):ycell;
+	    for(int i=0; i<npaths; i++)
+	      lambda(i,r[i].slice(0,b).slice(0,i0).slice(0,i1),xc,yc,shift);
+	  }
+	});
 
-    template<typename GPART2> // dummy template to break circular dependency
-    GPART DiagCGproduct(const GPART2& y, const typename GPART2::IRREP_IX& l) const{
-      auto& x=static_cast<const GPART&>(*this);
-      int m=GPART::GROUP::CGmultiplicity(x.getl(),y.getl(),l);
-      GELIB_ASSRT(m>0);
-      GELIB_ASSRT(x.getn()==y.getn())
-      GPART R(x.dominant_batch(y),x.dominant_gdims(y),l,x.getn(),0,dev);
-      R.add_DiagCGproduct(x,y);
-      return R;
+      for(auto& p:acc)
+	unbroadcast(t).add(unbroadcast(p));
     }
 
 
-    void add_DiagCGproduct(GPART x, GPART y, const int offs=0){
-      GPART r(*this);
-      const int dev=r.dev;
-      GELIB_ASSRT(x.get_dev()==dev);
+    // The common part of the multi-path CG-product drivers. Checks that the operands are on the same
+    // device and co-canonicalizes them. On the CPU, kernel is then called on each cell and path of
+    // a forward product accumulating into r (target==-1) or of a backward pass accumulating into x
+    // (target==0) or y (target==1), with the channels tiled according to tiling. A backward pass
+    // into y whose own channels cannot be tiled (tiling==0) reduces over tiles of the channels of x
+    // instead. On the GPU, dev_kernel is called on each path.
+    static void apply_paths(const string& name, vector<GPART>& r, GPART& x, GPART& y, const int target, const int tiling,
+      const std::function<void(const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y, const int shift)>& kernel,
+      const std::function<void(const int i, const GPART& r, const GPART& x, const GPART& y)>& dev_kernel=nullptr){
+      if(r.size()==0) return;
+      const int dev=x.get_dev();
       GELIB_ASSRT(y.get_dev()==dev);
+      for(auto& p:r) GELIB_ASSRT(p.get_dev()==dev);
 
-      if(!r.reconcile_batches(x,y))
-	GELIB_NONFATAL("Skipping DiagCGproduct: batch dimensions cannot be reconciled.");
+      if(!co_canonicalize_paths(r,x,y))
+	GELIB_NONFATAL("Skipping "+name+": batch or grid dimensions cannot be reconciled.");
 
-      if(!r.reconcile_grids(x,y))
-	GELIB_NONFATAL("Skipping DiagCGproduct: grid dimensions cannot be reconciled.");
+      if(dev>0){
+	if(!dev_kernel) GELIB_ERROR(name+" is not implemented on the GPU");
+	for(int i=0; i<r.size(); i++)
+	  dev_kernel(i,r[i],x,y);
+	return;
+      }
 
-      r.co_canonicalize_to_5d(x,y);
+      if(target<0){
+	bool disjoint=true;
+	for(auto& p:r)
+	  disjoint=disjoint && cells_are_disjoint(p);
+	for_each_cell_multi_paths(r,x,y,disjoint,true,tiling,kernel);
+      }else
+	for_each_cell_multi_paths_back(r,x,y,target,tiling,target==1 && tiling==0,kernel);
+    }
 
-      if(dev==0){
-	auto C=r.get_CGmatrix(x,y);
-	r.for_each_cell_multi(x,y,[&](const TENSOR& r, const TENSOR& x, const TENSOR& y){
-	    GPART::add_DiagCGproduct_kernel(r,x,y,C,offs);
-	      });
-      }
 
-      if(dev==1){
-	GPART::add_DiagCGproduct_dev(r,x,y,offs);
-      }
+    static void add_CGproduct_paths(const vector<GPART>& r, const GPART& x, const GPART& y, const vector<int>& offs){
+      add_CGproduct_paths(r,x,y,offs,get_CGcoeffs_paths(r,x,y));
+    }
 
+    template<typename COEFFS>
+    static void add_CGproduct_paths(vector<GPART> r, GPART x, GPART y, const vector<int>& offs, const vector<const COEFFS*>& C){
+      GELIB_ASSRT(offs.size()==r.size() && C.size()==r.size());
+      apply_paths("CGproduct",r,x,y,-1,1,
+	[&](const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y, const int shift){
+	  GPART::add_CGproduct_kernel(r,x,y,*C[i],offs[i]+shift);},
+	[&](const int i, const GPART& r, const GPART& x, const GPART& y){
+	  GPART::add_CGproduct_dev(r,x,y,offs[i]);});
     }
 
 
-    void add_DiagCGproduct_back0(GPART r, GPART y, const int offs=0){
-      GPART x(*this);
-      const int dev=r.dev;
-      GELIB_ASSRT(x.get_dev()==dev);
-      GELIB_ASSRT(y.get_dev()==dev);
+    static void add_CGproduct_back0_paths(const vector<GPART>& r, const GPART& x, const GPART& y, const vector<int>& offs){
+      add_CGproduct_back0_paths(r,x,y,offs,get_CGcoeffs_paths(r,x,y));
+    }
 
-      if(!r.reconcile_batches(x,y))
-	GELIB_NONFATAL("Skipping DiagCGproduct: batch dimensions cannot be reconciled.");
+    template<typename COEFFS>
+    static void add_CGproduct_back0_paths(vector<GPART> r, GPART x, GPART y, const vector<int>& offs, const vector<const COEFFS*>& C){
+      GELIB_ASSRT(offs.size()==r.size() && C.size()==r.size());
+      apply_paths("CGproduct",r,x,y,0,1,
+	[&](const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y, const int shift){
+	  GPART::add_CGproduct_back0_kernel(r,x,y,*C[i],offs[i]+shift);},
+	[&](const int i, const GPART& r, const GPART& x, const GPART& y){
+	  GPART::add_CGproduct_back0_dev(r,x,y,offs[i]);});
+    }
 
-      if(!r.reconcile_grids(x,y))
-	GELIB_NONFATAL("Skipping DiagCGproduct: grid dimensions cannot be reconciled.");
 
-      r.co_canonicalize_to_5d(x,y);
+    static void add_CGproduct_back1_paths(const vector<GPART>& r, const GPART& x, const GPART& y, const vector<int>& offs){
+      add_CGproduct_back1_paths(r,x,y,offs,get_CGcoeffs_paths(r,x,y));
+    }
 
-      if(dev==0){
-	auto C=r.get_CGmatrix(x,y);
-	x.for_each_cell_multi(r,y,[&](const TENSOR& x, const TENSOR& r, const TENSOR& y){
-	    GPART::add_DiagCGproduct_back0_kernel(r,x,y,C,offs);});
+    template<typename COEFFS>
+    static void add_CGproduct_back1_paths(vector<GPART> r, GPART x, GPART y, const vector<int>& offs, const vector<const COEFFS*>& C){
+      GELIB_ASSRT(offs.size()==r.size() && C.size()==r.size());
+      apply_paths("CGproduct",r,x,y,1,0,
+	[&](const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y, const int shift){
+	  GPART::add_CGproduct_back1_kernel(r,x,y,*C[i],offs[i]+shift);},
+	[&](const int i, const GPART& r, const GPART& x, const GPART& y){
+	  GPART::add_CGproduct_back1_dev(r,x,y,offs[i]);});
+    }
+
+
+    static void add_DiagCGproduct_paths(const vector<GPART>& r, const GPART& x, const GPART& y, const vector<int>& offs){
+      add_DiagCGproduct_paths(r,x,y,offs,get_CGcoeffs_paths(r,x,y));
+    }
+
+    template<typename COEFFS>
+    static void add_DiagCGproduct_paths(vector<GPART> r, GPART x, GPART y, const vector<int>& offs, const vector<const COEFFS*>& C){
+      GELIB_ASSRT(offs.size()==r.size() && C.size()==r.size());
+      apply_paths("DiagCGproduct",r,x,y,-1,2,
+	[&](const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y, const int shift){
+	  GPART::add_DiagCGproduct_kernel(r,x,y,*C[i],offs[i]+shift);},
+	[&](const int i, const GPART& r, const GPART& x, const GPART& y){
+	  GPART::add_DiagCGproduct_dev(r,x,y,offs[i]);});
+    }
+
+
+    static void add_DiagCGproduct_back0_paths(const vector<GPART>& r, const GPART& x, const GPART& y, const vector<int>& offs){
+      add_DiagCGproduct_back0_paths(r,x,y,offs,get_CGcoeffs_paths(r,x,y));
+    }
+
+    template<typename COEFFS>
+    static void add_DiagCGproduct_back0_paths(vector<GPART> r, GPART x, GPART y, const vector<int>& offs, const vector<const COEFFS*>& C){
+      GELIB_ASSRT(offs.size()==r.size() && C.size()==r.size());
+      apply_paths("DiagCGproduct",r,x,y,0,2,
+	[&](const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y, const int shift){
+	  GPART::add_DiagCGproduct_back0_kernel(r,x,y,*C[i],offs[i]+shift);},
+	[&](const int i, const GPART& r, const GPART& x, const GPART& y){
+	  GPART::add_DiagCGproduct_back0_dev(r,x,y,offs[i]);});
+    }
+
+
+    static void add_DiagCGproduct_back1_paths(const vector<GPART>& r, const GPART& x, const GPART& y, const vector<int>& offs){
+      add_DiagCGproduct_back1_paths(r,x,y,offs,get_CGcoeffs_paths(r,x,y));
+    }
+
+    template<typename COEFFS>
+    static void add_DiagCGproduct_back1_paths(vector<GPART> r, GPART x, GPART y, const vector<int>& offs, const vector<const COEFFS*>& C){
+      GELIB_ASSRT(offs.size()==r.size() && C.size()==r.size());
+      apply_paths("DiagCGproduct",r,x,y,1,2,
+	[&](const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y, const int shift){
+	  GPART::add_DiagCGproduct_back1_kernel(r,x,y,*C[i],offs[i]+shift);},
+	[&](const int i, const GPART& r, const GPART& x, const GPART& y){
+	  GPART::add_DiagCGproduct_back1_dev(r,x,y,offs[i]);});
+    }
+
+
+    // Fused backward passes: the gradients of x and y are accumulated into xg and yg in a single sweep
+    // over the cells of g, so that each row of g is read and each CG coefficient is fetched once rather
+    // than twice. If one of the gradients is not needed (xg or yg is an empty part), or the operands
+    // are on the GPU, this falls back to the separate back0 and back1 passes.
+
+    static void add_CGproduct_back01_paths(const vector<GPART>& g, const GPART& x, const GPART& y, const vector<int>& offs,
+      const GPART& xg, const GPART& yg){
+      add_CGproduct_back01_paths(g,x,y,offs,xg,yg,get_CGcoeffs_paths(g,x,y));
+    }
+
+    template<typename COEFFS>
+    static void add_CGproduct_back01_paths(const vector<GPART>& g, const GPART& x, const GPART& y, const vector<int>& offs,
+      const GPART& xg, const GPART& yg, const vector<const COEFFS*>& C){
+      if(g.size()==0) return;
+      GELIB_ASSRT(offs.size()==g.size() && C.size()==g.size());
+      if(!fuse_back01(g,x,y,xg,yg)){
+	if(xg.ndims()>0) add_CGproduct_back0_paths(g,xg,y,offs,C);
+	if(yg.ndims()>0) add_CGproduct_back1_paths(g,x,yg,offs,C);
+	return;
       }
+      vector<GPART> _g(g);
+      GPART _x(x), _y(y), _xg(xg), _yg(yg);
+      if(!co_canonicalize_back(_g,_x,_y,_xg,_yg,{},{}))
+	GELIB_NONFATAL("Skipping CGproduct: batch or grid dimensions cannot be reconciled.");
+      for_each_cell_back01(_g,_x,_y,_xg,_yg,[&](const int i, const TENSOR& g, const TENSOR& x, const TENSOR& y,
+	  const TENSOR& xg, const TENSOR& yg){
+	  GPART::add_CGproduct_back01_kernel(g,x,y,xg,yg,*C[i],offs[i]);});
+    }
+
+
+    static void add_DiagCGproduct_back01_paths(const vector<GPART>& g, const GPART& x, const GPART& y, const vector<int>& offs,
+      const GPART& xg, const GPART& yg){
+      add_DiagCGproduct_back01_paths(g,x,y,offs,xg,yg,get_CGcoeffs_paths(g,x,y));
+    }
 
-      if(dev==1){
-	GPART::add_DiagCGproduct_back0_dev(r,x,y,offs);
+    template<typename COEFFS>
+    static void add_DiagCGproduct_back01_paths(const vector<GPART>& g, const GPART& x, const GPART& y, const vector<int>& offs,
+      const GPART& xg, const GPART& yg, const vector<const COEFFS*>& C){
+      if(g.size()==0) return;
+      GELIB_ASSRT(offs.size()==g.size() && C.size()==g.size());
+      if(!fuse_back01(g,x,y,xg,yg)){
+	if(xg.ndims()>0) add_DiagCGproduct_back0_paths(g,xg,y,offs,C);
+	if(yg.ndims()>0) add_DiagCGproduct_back1_paths(g,x,yg,offs,C);
+	return;
       }
+      vector<GPART> _g(g);
+      GPART _x(x), _y(y), _xg(xg), _yg(yg);
+      if(!co_canonicalize_back(_g,_x,_y,_xg,_yg,{},{}))
+	GELIB_NONFATAL("Skipping DiagCGproduct: batch or grid dimensions cannot be reconciled.");
+      for_each_cell_back01(_g,_x,_y,_xg,_yg,[&](const int i, const TENSOR& g, const TENSOR& x, const TENSOR& y,
+	  const TENSOR& xg, const TENSOR& yg){
+	  GPART::add_DiagCGproduct_back01_kernel(g,x,y,xg,yg,*C[i],offs[i]);});
+    }
+
+
+  public: // ---- Weighted CG-products ----------------------------------------------------------------------
 
+    // Fully connected weighted CG-products: r[i] receives the CG-product of x and y along path i,
+    // with its n1*n2 channels immediately contracted with the (n1,n2,n_out) weight tensor W[i], so
+    // the outer product channels are never materialized. The backward pass computes the gradients
+    // of x, y and the weights in a single sweep over the cells.
+
+    static void add_CGproduct_weighted_paths(vector<GPART> r, GPART x, GPART y, const vector<TENSOR>& W){
+      if(r.size()==0) return;
+      GELIB_ASSRT(W.size()==r.size());
+      check_weighted_args(r,x,y,W);
+      auto C=get_CGcoeffs_paths(r,x,y);
+      if(!co_canonicalize_paths(r,x,y))
+	GELIB_NONFATAL("Skipping weighted CGproduct: batch or grid dimensions cannot be reconciled.");
+      for_each_cell_weighted(r,x,y,[&](const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y, vector<TYPE>& T){
+	  GPART::add_CGproduct_weighted_kernel(r,x,y,W[i],*C[i],T);});
     }
 
+    // xg or yg can be empty parts and Wg an empty vector if the corresponding gradient is not needed
+    static void add_CGproduct_weighted_back_paths(vector<GPART> g, GPART x, GPART y, const vector<TENSOR>& W,
+      GPART xg, GPART yg, const vector<TENSOR>& Wg){
+      if(g.size()==0) return;
+      GELIB_ASSRT(W.size()==g.size());
+      check_weighted_args(g,x,y,W);
+      auto C=get_CGcoeffs_paths(g,x,y);
+      if(!co_canonicalize_back(g,x,y,xg,yg,W,Wg))
+	GELIB_NONFATAL("Skipping weighted CGproduct: batch or grid dimensions cannot be reconciled.");
+      for_each_cell_weighted_back(g,x,y,xg,yg,W,Wg,[&](const int i, const TENSOR& g, const TENSOR& x, const TENSOR& y,
+	  const TENSOR* xg, const TENSOR* yg, const TENSOR* wg, vector<TYPE>& T, vector<TYPE>& S){
+	  GPART::add_CGproduct_weighted_back_kernel(g,x,y,W[i],*C[i],xg,yg,wg,T,S);});
+    }
 
-    void add_DiagCGproduct_back1(GPART r, GPART x, const int offs=0){
-      GPART y(*this);
-      const int dev=r.dev;
-      GELIB_ASSRT(x.get_dev()==dev);
-      GELIB_ASSRT(y.get_dev()==dev);
 
-      if(!r.reconcile_batches(x,y))
-	GELIB_NONFATAL("Skipping DiagCGproduct: batch dimensions cannot be reconciled.");
+    // Diagonal CG-products with the output channels of path i multiplied by the weights in the vector
+    // W[i] inside the kernel. The backward pass computes the weight gradients along with those of x
+    // and y in the same sweep over the cells.
+
+    static void add_DiagCGproduct_weighted_paths(vector<GPART> r, GPART x, GPART y, const vector<int>& offs,
+      const vector<TENSOR>& W){
+      if(r.size()==0) return;
+      GELIB_ASSRT(offs.size()==r.size() && W.size()==r.size());
+      check_diag_weighted_args(x,y,W);
+      auto C=get_CGcoeffs_paths(r,x,y);
+      apply_paths("weighted DiagCGproduct",r,x,y,-1,2,[&](const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y, const int shift){
+	  GPART::add_DiagCGproduct_weighted_kernel(r,x,y,W[i].mem()+shift*W[i].strides[0],W[i].strides[0],*C[i],offs[i]+shift);});
+    }
+
+    static void add_DiagCGproduct_weighted_back_paths(vector<GPART> g, GPART x, GPART y, const vector<int>& offs,
+      const vector<TENSOR>& W, GPART xg, GPART yg, const vector<TENSOR>& Wg){
+      if(g.size()==0) return;
+      GELIB_ASSRT(offs.size()==g.size() && W.size()==g.size());
+      check_diag_weighted_args(x,y,W);
+      auto C=get_CGcoeffs_paths(g,x,y);
+      if(!co_canonicalize_back(g,x,y,xg,yg,W,Wg))
+	GELIB_NONFATAL("Skipping weighted DiagCGproduct: batch or grid dimensions cannot be reconciled.");
+      for_each_cell_weighted_back(g,x,y,xg,yg,W,Wg,[&](const int i, const TENSOR& g, const TENSOR& x, const TENSOR& y,
+	  const TENSOR* xg, const TENSOR* yg, const TENSOR* wg, vector<TYPE>& T, vector<TYPE>& S){
+	  GPART::add_DiagCGproduct_weighted_back_kernel(g,x,y,W[i].mem(),W[i].strides[0],*C[i],offs[i],
+	    xg,yg,wg?wg->mem():nullptr,wg?wg->strides[0]:0);});
+    }
 
-      if(!r.reconcile_grids(x,y))
-	GELIB_NONFATAL("Skipping DiagCGproduct: grid dimensions cannot be reconciled.");
 
-      r.co_canonicalize_to_5d(x,y);
+  private:
 
-      if(dev==0){
-	auto C=r.get_CGmatrix(x,y);
-	y.for_each_cell_multi(r,x,[&](const TENSOR& y, const TENSOR& r, const TENSOR& x){
-	    GPART::add_DiagCGproduct_back1_kernel(r,x,y,C,offs);});
+    static void check_weighted_args(const vector<GPART>& r, const GPART& x, const GPART& y, const vector<TENSOR>& W){
+      if(x.get_dev()>0 || y.get_dev()>0)
+	GELIB_ERROR("weighted CG-products are only implemented on the CPU");
+      for(int i=0; i<r.size(); i++)
+	if(W[i].ndims()!=3 || W[i].dims[0]!=x.getn() || W[i].dims[1]!=y.getn() || W[i].dims[2]!=r[i].getn() || W[i].get_dev()>0)
+	  GELIB_ERROR("the weights of path "+to_string(i)+" have dimensions "+W[i].dims.str()+" but ("+
+	    to_string(x.getn())+","+to_string(y.getn())+","+to_string(r[i].getn())+") are required");
+    }
+
+    static void check_diag_weighted_args(const GPART& x, const GPART& y, const vector<TENSOR>& W){
+      if(x.get_dev()>0 || y.get_dev()>0)
+	GELIB_ERROR("weighted CG-products are only implemented on the CPU");
+      if(x.getn()!=y.getn())
+	GELIB_ERROR("the diagonal CG-product requires the same number of channels in both operands");
+      for(int i=0; i<W.size(); i++)
+	if(W[i].ndims()!=1 || W[i].dims[0]!=x.getn() || W[i].get_dev()>0)
+	  GELIB_ERROR("the weights of path "+to_string(i)+" have dimensions "+W[i].dims.str()+" but ("+
+	    to_string(x.getn())+") are required");
+    }
+
+    // Canonicalize the operands of a backward pass. The gradients xg and yg are canonicalized along
+    // with copies of the other operands so as to undergo exactly the same promotions as x and y.
+    static bool co_canonicalize_back(vector<GPART>& g, GPART& x, GPART& y, GPART& xg, GPART& yg,
+      const vector<TENSOR>& W, const vector<TENSOR>& Wg){
+      GELIB_ASSRT(Wg.size()==0 || Wg.size()==W.size());
+      for(int i=0; i<Wg.size(); i++) GELIB_ASSRT(Wg[i].dims==W[i].dims);
+      if(xg.ndims()>0){
+	GELIB_ASSRT(xg.dims==x.dims);
+	vector<GPART> _g(g); GPART _y(y); co_canonicalize_paths(_g,xg,_y);
       }
+      if(yg.ndims()>0){
+	GELIB_ASSRT(yg.dims==y.dims);
+	vector<GPART> _g(g); GPART _x(x); co_canonicalize_paths(_g,_x,yg);
+      }
+      return co_canonicalize_paths(g,x,y);
+    }
+
+    // Sweep over the cells for a weighted forward product. The cells are split into one chunk per thread,
+    // which are processed in parallel together with the paths unless the output is broadcast across the
+    // cells. Each cell of each output is computed by a single task, so the partition does not affect the
+    // result. Each task allocates the scratch space T of the kernel once and reuses it for all its cells.
+    static void for_each_cell_weighted(const vector<GPART>& r, const GPART& x, const GPART& y,
+      const std::function<void(const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y, vector<TYPE>& T)>& lambda){
+      const int npaths=r.size();
+      const int g0=x.dims[1];
+      const int g1=x.dims[2];
+      const int ncells=x.dims[0]*g0*g1;
+      bool disjoint=true;
+      for(auto& p:r)
+	disjoint=disjoint && cells_are_disjoint(p);
+      const int nchunks=disjoint?std::max(1,std::min(ncells,get_nthreads())):1;
+
+      parallel_for(nchunks*npaths,[&](const int k){
+	  const int i=k%npaths;
+	  const int c=k/npaths;
+	  vector<TYPE> T;
+	  for(int cell=(ncells*c)/nchunks; cell<(ncells*(c+1))/nchunks; cell++){
+	    const int b=cell/(g0*g1);
+	    const int i0=(cell/g1)%g0;
+	    const int i1=cell%g1;
+	    lambda(i,r[i].slice(0,b).slice(0,i0).slice(0,i1),x.slice(0,b).slice(0,i0).slice(0,i1),
+	      y.slice(0,b).slice(0,i0).slice(0,i1),T);
+	  }
+	});
+    }
 
-      if(dev==1){
-	GPART::add_DiagCGproduct_back1_dev(r,x,y,offs);
+    // Sweep over the cells for a fused backward pass so that the result is the same for any number of
+    // threads. The cells are split into a fixed number of chunks that are processed in parallel. Each
+    // chunk accumulates the weight gradients, as well as xg or yg if it is broadcast across the cells,
+    // into its own zero initialized copies, which are added to the gradients in chunk order at the end.
+    // Each chunk allocates the scratch space T and S of the kernel once and reuses it for all its cells.
+    static void for_each_cell_weighted_back(const vector<GPART>& g, const GPART& x, const GPART& y,
+      const GPART& xg, const GPART& yg, const vector<TENSOR>& W, const vector<TENSOR>& Wg,
+      const std::function<void(const int i, const TENSOR& g, const TENSOR& x, const TENSOR& y,
+	const TENSOR* xg, const TENSOR* yg, const TENSOR* wg, vector<TYPE>& T, vector<TYPE>& S)>& lambda){
+      const bool do_x=xg.ndims()>0;
+      const bool do_y=yg.ndims()>0;
+      const bool do_W=Wg.size()>0;
+      const int g0=x.dims[1];
+      const int g1=x.dims[2];
+      const int ncells=x.dims[0]*g0*g1;
+      const int nchunks=std::max(1,std::min(ncells,reduction_chunks));
+      const bool xlocal=do_x && nchunks>1 && !cells_are_disjoint(xg);
+      const bool ylocal=do_y && nchunks>1 && !cells_are_disjoint(yg);
+
+      vector<vector<TENSOR> > partial(nchunks);
+      vector<TENSOR> xacc;
+      vector<TENSOR> yacc;
+      for(int c=0; c<nchunks; c++){
+	if(do_W)
+	  for(auto& w:W) partial[c].push_back(TENSOR(w.dims,0,0));
+	xacc.push_back(xlocal?broadcast_zeros_like(xg):TENSOR(xg));
+	yacc.push_back(ylocal?broadcast_zeros_like(yg):TENSOR(yg));
       }
 
+      parallel_for(nchunks,[&](const int c){
+	  vector<TYPE> T;
+	  vector<TYPE> S;
+	  for(int cell=(ncells*c)/nchunks; cell<(ncells*(c+1))/nchunks; cell++){
+	    const int b=cell/(g0*g1);
+	    const int i0=(cell/g1)%g0;
+	    const int i1=cell%g1;
+	    TENSOR xcell=x.slice(0,b).slice(0,i0).slice(0,i1);
+	    TENSOR ycell=y.slice(0,b).slice(0,i0).slice(0,i1);
+	    TENSOR xgcell=do_x?xacc[c].slice(0,b).slice(0,i0).slice(0,i1):TENSOR();
+	    TENSOR ygcell=do_y?yacc[c].slice(0,b).slice(0,i0).slice(0,i1):TENSOR();
+	    for(int i=0; i<g.size(); i++)
+	      lambda(i,g[i].slice(0,b).slice(0,i0).slice(0,i1),xcell,ycell,
+		do_x?&xgcell:nullptr,do_y?&ygcell:nullptr,do_W?&partial[c][i]:nullptr,T,S);
+	  }
+	});
+
+      for(int c=0; c<nchunks; c++){
+	if(xlocal) unbroadcast(xg).add(unbroadcast(xacc[c]));
+	if(ylocal) unbroadcast(yg).add(unbroadcast(yacc[c]));
+	if(do_W)
+	  for(int i=0; i<Wg.size(); i++)
+	    Wg[i].add(partial[c][i]);
+      }
     }
 
+    static bool fuse_back01(const vector<GPART>& g, const GPART& x, const GPART& y, const GPART& xg, const GPART& yg){
+      if(xg.ndims()==0 || yg.ndims()==0) return false;
+      return x.get_dev()==0 && y.get_dev()==0 && xg.get_dev()==0 && yg.get_dev()==0;
+    }
+
+    // Sweep over the cells for the fused back01 passes. If xg and yg are disjoint across the cells, these
+    // are simply split into one chunk per thread; each cell is then accumulated by a single chunk, so
+    // the partition does not affect the result. If xg or yg is broadcast across the cells, the cells are
+    // split into a fixed number of chunks that does not depend on the number of threads, each of which
+    // accumulates into its own zero initialized copy of it, and the copies are added to the gradient in
+    // chunk order at the end. Either way, the result is the same for any number of threads.
+    static void for_each_cell_back01(const vector<GPART>& g, const GPART& x, const GPART& y, const GPART& xg, const GPART& yg,
+      const std::function<void(const int i, const TENSOR& g, const TENSOR& x, const TENSOR& y,
+	const TENSOR& xg, const TENSOR& yg)>& lambda){
+      const int g0=x.dims[1];
+      const int g1=x.dims[2];
+      const int ncells=x.dims[0]*g0*g1;
+      const bool disjoint=cells_are_disjoint(xg) && cells_are_disjoint(yg);
+      const int nchunks=std::max(1,std::min(ncells,disjoint?get_nthreads():reduction_chunks));
+      const bool xlocal=nchunks>1 && !cells_are_disjoint(xg);
+      const bool ylocal=nchunks>1 && !cells_are_disjoint(yg);
+
+      vector<TENSOR> xacc;
+      vector<TENSOR> yacc;
+      for(int c=0; c<nchunks; c++){
+	xacc.push_back(xlocal?broadcast_zeros_like(xg):TENSOR(xg));
+	yacc.push_back(ylocal?broadcast_zeros_like(yg):TENSOR(yg));
+      }
+
+      parallel_for(nchunks,[&](const int c){
+	  for(int cell=(ncells*c)/nchunks; cell<(ncells*(c+1))/nchunks; cell++){
+	    const int b=cell/(g0*g1);
+	    const int i0=(cell/g1)%g0;
+	    const int i1=cell%g1;
+	    TENSOR xcell=x.slice(0,b).slice(0,i0).slice(0,i1);
+	    TENSOR ycell=y.slice(0,b).slice(0,i0).slice(0,i1);
+	    TENSOR xgcell=xacc[c].slice(0,b).slice(0,i0).slice(0,i1);
+	    TENSOR ygcell=yacc[c].slice(0,b).slice(0,i0).slice(0,i1);
+	    for(int i=0; i<g.size(); i++)
+	      lambda(i,g[i].slice(0,b).slice(0,i0).slice(0,i1),xcell,ycell,xgcell,ygcell);
+	  }
+	});
+
+      for(int c=0; c<nchunks; c++){
+	if(xlocal) unbroadcast(xg).add(unbroadcast(xacc[c]));
+	if(ylocal) unbroadcast(yg).add(unbroadcast(yacc[c]));
+      }
+    }
+
+    // A zero tensor that is broadcast along the same cell dimensions as the canonicalized tensor x
+    static TENSOR broadcast_zeros_like(const TENSOR& x){
+      cnine::Gdims dims(x.dims);
+      for(int i=0; i<3; i++)
+	if(x.strides[i]==0) dims[i]=1;
+      TENSOR R(dims,0,x.get_dev());
+      for(int i=0; i<3; i++)
+	if(x.strides[i]==0){
+	  R.dims[i]=x.dims[i];
+	  R.strides[i]=0;
+	}
+      return R;
+    }
+
+    // The view of a canonicalized tensor in which each of its broadcast dimensions is collapsed to size 1
+    static TENSOR unbroadcast(const TENSOR& x){
+      TENSOR R(x);
+      for(int i=0; i<3; i++)
+	if(R.strides[i]==0) R.dims[i]=1;
+      return R;
+    }
+
+  public:
+
+
+  public: // ---- Gathered CG-products ---------------------------------------------------------------------
+
+    // CG-products fused with a gather along the first grid dimension: r_t+=CG(x_s,y_t) for each source s 
+    // of each target t in gmap. This is the message passing step of equivariant graph networks, with x 
+    // holding node features and y edge features, and avoids materializing the gathered copy of x. 
+    // The backward pass for x goes over the inverse map, so each task accumulates into its own cell of xg.
+
+    void add_CGproduct_gather(GPART x, GPART y, const cnine::GatherMapB& gmap, const int offs=0){
+      add_CGproduct_gather_paths({static_cast<GPART&>(*this)},x,y,gmap,{offs});
+    }
+
+    void add_CGproduct_gather_back0(GPART r, GPART y, const cnine::GatherMapB& gmap, const int offs=0){
+      add_CGproduct_gather_back0_paths({r},static_cast<GPART&>(*this),y,gmap,{offs});
+    }
+
+    void add_CGproduct_gather_back1(GPART r, GPART x, const cnine::GatherMapB& gmap, const int offs=0){
+      add_CGproduct_gather_back1_paths({r},x,static_cast<GPART&>(*this),gmap,{offs});
+    }
+
+    void add_DiagCGproduct_gather(GPART x, GPART y, const cnine::GatherMapB& gmap, const int offs=0){
+      add_DiagCGproduct_gather_paths({static_cast<GPART&>(*this)},x,y,gmap,{offs});
+    }
+
+    void add_DiagCGproduct_gather_back0(GPART r, GPART y, const cnine::GatherMapB& gmap, const int offs=0){
+      add_DiagCGproduct_gather_back0_paths({r},static_cast<GPART&>(*this),y,gmap,{offs});
+    }
+
+    void add_DiagCGproduct_gather_back1(GPART r, GPART x, const cnine::GatherMapB& gmap, const int offs=0){
+      add_DiagCGproduct_gather_back1_paths({r},x,static_cast<GPART&>(*this),gmap,{offs});
+    }
+
+
+    static void add_CGproduct_gather_paths(const vector<GPART>& r, const GPART& x, const GPART& y, 
+      const cnine::GatherMapB& gmap, const vector<int>& offs){
+      auto C=get_CGcoeffs_paths(r,x,y);
+      for_each_gathered_cell(r,x,y,gmap,false,[&](const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y){
+	  GPART::add_CGproduct_kernel(r,x,y,*C[i],offs[i]);});
+    }
+
+    static void add_CGproduct_gather_back0_paths(const vector<GPART>& g, const GPART& xg, const GPART& y, 
+      const cnine::GatherMapB& gmap, const vector<int>& offs){
+      auto C=get_CGcoeffs_paths(g,xg,y);
+      for_each_gathered_cell(g,xg,y,gmap,true,[&](const int i, const TENSOR& g, const TENSOR& xg, const TENSOR& y){
+	  GPART::add_CGproduct_back0_kernel(g,xg,y,*C[i],offs[i]);});
+    }
+
+    static void add_CGproduct_gather_back1_paths(const vector<GPART>& g, const GPART& x, const GPART& yg, 
+      const cnine::GatherMapB& gmap, const vector<int>& offs){
+      auto C=get_CGcoeffs_paths(g,x,yg);
+      for_each_gathered_cell(g,x,yg,gmap,false,[&](const int i, const TENSOR& g, const TENSOR& x, const TENSOR& yg){
+	  GPART::add_CGproduct_back1_kernel(g,x,yg,*C[i],offs[i]);});
+    }
+
+    static void add_DiagCGproduct_gather_paths(const vector<GPART>& r, const GPART& x, const GPART& y, 
+      const cnine::GatherMapB& gmap, const vector<int>& offs){
+      auto C=get_CGcoeffs_paths(r,x,y);
+      for_each_gathered_cell(r,x,y,gmap,false,[&](const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y){
+	  GPART::add_DiagCGproduct_kernel(r,x,y,*C[i],offs[i]);});
+    }
+
+    static void add_DiagCGproduct_gather_back0_paths(const vector<GPART>& g, const GPART& xg, const GPART& y, 
+      const cnine::GatherMapB& gmap, const vector<int>& offs){
+      auto C=get_CGcoeffs_paths(g,xg,y);
+      for_each_gathered_cell(g,xg,y,gmap,true,[&](const int i, const TENSOR& g, const TENSOR& xg, const TENSOR& y){
+	  GPART::add_DiagCGproduct_back0_kernel(g,xg,y,*C[i],offs[i]);});
+    }
+
+    static void add_DiagCGproduct_gather_back1_paths(const vector<GPART>& g, const GPART& x, const GPART& yg, 
+      const cnine::GatherMapB& gmap, const vector<int>& offs){
+      auto C=get_CGcoeffs_paths(g,x,yg);
+      for_each_gathered_cell(g,x,yg,gmap,false,[&](const int i, const TENSOR& g, const TENSOR& x, const TENSOR& yg){
+	  GPART::add_DiagCGproduct_back1_kernel(g,x,yg,*C[i],offs[i]);});
+    }
+
+
+  private:
+
+    // Calls lambda(i,r[i]_t,x_s,y_t) for each path i, each batch index and each (target,source) pair (t,s) 
+    // of gmap. The pairs are grouped by t, or by s if by_source is set, and the groups are processed in 
+    // parallel. Batch dimensions of 1 are broadcast. 
+    static void for_each_gathered_cell(const vector<GPART>& r, const GPART& x, const GPART& y, 
+      const cnine::GatherMapB& gmap, const bool by_source, 
+      const std::function<void(const int i, const TENSOR& r, const TENSOR& x, const TENSOR& y)>& lambda){
+      if(r.size()==0) return;
+      GELIB_ASSRT(x.ndims()==4 && y.ndims()==4);
+      gmap.for_each([&](const int t, const int s){
+	  if(s>=x.dims[1] || t>=y.dims[1])
+	    GELIB_ERROR("the gather map refers to cell "+to_string(s)+" of "+x.repr()+" and cell "+to_string(t)+
+	      " of "+y.repr()+", which are out of range.");
+	});
+      if(x.get_dev()>0 || y.get_dev()>0)
+	GELIB_ERROR("gathered CG-products are only implemented on the CPU");
+      int B=std::max(x.dims[0],y.dims[0]);
+      for(auto& p:r){
+	GELIB_ASSRT(p.ndims()==4 && p.dims[1]==y.dims[1]);
+	B=std::max(B,p.dims[0]);
+      }
+      GELIB_ASSRT(x.dims[0]==B || x.dims[0]==1);
+      GELIB_ASSRT(y.dims[0]==B || y.dims[0]==1);
+      for(auto& p:r) GELIB_ASSRT(p.dims[0]==B || p.dims[0]==1);
+
+      const cnine::GatherMapB& map=by_source?gmap.inv():gmap;
+      parallel_for(map.size(),[&](const int k){
+	  const int head=map.target(k);
+	  const int n=map.size_of(k);
+	  for(int j=0; j<n; j++){
+	    const int t=by_source?map(k,j):head;
+	    const int s=by_source?head:map(k,j);
+	    for(int b=0; b<B; b++){
+	      TENSOR xc=x.slice(0,(x.dims[0]>1)*b).slice(0,s);
+	      TENSOR yc=y.slice(0,(y.dims[0]>1)*b).slice(0,t);
+	      for(int i=0; i<r.size(); i++)
+		lambda(i,r[i].slice(0,(r[i].dims[0]>1)*b).slice(0,t),xc,yc);
+	    }
+	  }
+	});
+    }
 
 
   public: // ---- I/O ----------------------------------------------------------------------------------------
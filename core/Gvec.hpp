@@ -17,6 +17,7 @@
 
 #include "GElib_base.hpp"
 #include "Gpart.hpp"
+#include "GvecCGplan.hpp"
 
 
 namespace GElib{
@@ -162,6 +163,19 @@ namespace GElib{
 	lambda(p.first,p.second);
     }
 
+    // The parts of this vector with the given indices
+    vector<GPART> path_parts(const vector<IRREP_IX>& ls) const{
+      vector<GPART> R;
+      for(auto& l:ls)
+	R.push_back(part(l));
+      return R;
+    }
+
+    // The paths of the (diagonal) CG-product of x and y into the parts of r, see GvecCGplan::paths
+    static vector<typename GvecCGplan<GPART>::Block> CGpaths(const Gvec& r, const Gvec& x, const Gvec& y, const bool diag){
+      return GvecCGplan<GPART>::paths(x.get_tau(),y.get_tau(),diag,[&](const IRREP_IX& z){return r.has_part(z);});
+    }
+
 
   public: // ---- Access -----------------------------------------------------------------------------------
 
@@ -309,36 +323,27 @@ namespace GElib{
     }
 
     void add_CGproduct(const GVEC& x, const GVEC& y){
-      GTYPE offset;
-      for(auto& p:x.parts)
-	for(auto& q:y.parts)
-	  GROUP::for_each_CGcomponent(p.first,q.first,[&](const IRREP_IX& z, const int m){
-	      if(!has_part(z)) return;
-	      part(z).add_CGproduct(p.second,q.second,offset[z]);
-	      offset[z]+=m*p.second.getn()*q.second.getn();
-	    });
+      for(auto& b:CGpaths(*this,x,y,false))
+	GPART::add_CGproduct_paths(path_parts(b.ls),x.part(b.l1),y.part(b.l2),b.offs,b.coeffs);
     }
 
     void add_CGproduct_back0(const GVEC& g, const GVEC& y){
-      GTYPE offset;
-      for(auto& p:parts)
-	for(auto& q:y.parts)
-	  GROUP::for_each_CGcomponent(p.first,q.first,[&](const IRREP_IX& z, const int m){
-	      if(!g.has_part(z)) return;
-	      p.second.add_CGproduct_back0(g.part(z),q.second,offset[z]);
-	      offset[z]+=m*p.second.getn()*q.second.getn();
-	    });
+      for(auto& b:CGpaths(g,*this,y,false))
+	GPART::add_CGproduct_back0_paths(g.path_parts(b.ls),part(b.l1),y.part(b.l2),b.offs,b.coeffs);
     }
 
     void add_CGproduct_back1(const GVEC& g, const GVEC& x){
-      GTYPE offset;
-      for(auto& p:x.parts)
-	for(auto& q:parts)
-	  GROUP::for_each_CGcomponent(p.first,q.first,[&](const IRREP_IX& z, const int m){
-	      if(!g.has_part(z)) return;
-	      q.second.add_CGproduct_back1(g.part(z),p.second,offset[z]);
-	      offset[z]+=m*p.second.getn()*q.second.getn();
-	    });
+      for(auto& b:CGpaths(g,x,*this,false))
+	GPART::add_CGproduct_back1_paths(g.path_parts(b.ls),x.part(b.l1),part(b.l2),b.offs,b.coeffs);
+    }
+
+    // Called on the gradient of the CG-product of x and y: add its gradients with respect to x and y
+    // to xg and yg with a single pass over each part of the gradient. xg or yg may have no parts if the
+    // corresponding gradient is not needed.
+    void add_CGproduct_back01(const GVEC& xg, const GVEC& yg, const GVEC& x, const GVEC& y) const{
+      for(auto& b:CGpaths(*this,x,y,false))
+	GPART::add_CGproduct_back01_paths(path_parts(b.ls),x.part(b.l1),y.part(b.l2),b.offs,
+	  xg.parts.size()>0?xg.part(b.l1):GPART(),yg.parts.size()>0?yg.part(b.l2):GPART(),b.coeffs);
     }
 
 
@@ -353,36 +358,127 @@ namespace GElib{
     }
 
     void add_DiagCGproduct(const GVEC& x, const GVEC& y){
-      GTYPE offset;
-      for(auto& p:x.parts)
-	for(auto& q:y.parts)
-	  GROUP::for_each_CGcomponent(p.first,q.first,[&](const IRREP_IX& z, const int m){
-	      if(!has_part(z)) return;
-	      part(z).add_DiagCGproduct(p.second,q.second,offset[z]);
-	      offset[z]+=m*p.second.getn();
-	    });
+      for(auto& b:CGpaths(*this,x,y,true))
+	GPART::add_DiagCGproduct_paths(path_parts(b.ls),x.part(b.l1),y.part(b.l2),b.offs,b.coeffs);
     }
 
     void add_DiagCGproduct_back0(const GVEC& g, const GVEC& y){
-      GTYPE offset;
-      for(auto& p:parts)
-	for(auto& q:y.parts)
-	  GROUP::for_each_CGcomponent(p.first,q.first,[&](const IRREP_IX& z, const int m){
-	      if(!g.has_part(z)) return;
-	      p.second.add_DiagCGproduct_back0(g.part(z),q.second,offset[z]);
-	      offset[z]+=m*p.second.getn();
-	    });
+      for(auto& b:CGpaths(g,*this,y,true))
+	GPART::add_DiagCGproduct_back0_paths(g.path_parts(b.ls),part(b.l1),y.part(b.l2),b.offs,b.coeffs);
     }
 
     void add_DiagCGproduct_back1(const GVEC& g, const GVEC& x){
-      GTYPE offset;
-      for(auto& p:x.parts)
-	for(auto& q:parts)
-	  GROUP::for_each_CGcomponent(p.first,q.first,[&](const IRREP_IX& z, const int m){
-	      if(!g.has_part(z)) return;
-	      q.second.add_DiagCGproduct_back1(g.part(z),p.second,offset[z]);
-	      offset[z]+=m*p.second.getn();
-	    });
+      for(auto& b:CGpaths(g,x,*this,true))
+	GPART::add_DiagCGproduct_back1_paths(g.path_parts(b.ls),x.part(b.l1),part(b.l2),b.offs,b.coeffs);
+    }
+
+    // Called on the gradient of the diagonal CG-product of x and y: add its gradients with respect to x and y
+    // to xg and yg with a single pass over each part of the gradient. xg or yg may have no parts if the
+    // corresponding gradient is not needed.
+    void add_DiagCGproduct_back01(const GVEC& xg, const GVEC& yg, const GVEC& x, const GVEC& y) const{
+      for(auto& b:CGpaths(*this,x,y,true))
+	GPART::add_DiagCGproduct_back01_paths(path_parts(b.ls),x.part(b.l1),y.part(b.l2),b.offs,
+	  xg.parts.size()>0?xg.part(b.l1):GPART(),yg.parts.size()>0?yg.part(b.l2):GPART(),b.coeffs);
+    }
+
+
+  public: // ---- Weighted CG-products -----------------------------------------------------------------------
+
+    // W holds one (n1,n2,n_out) weight tensor for each path (ix1,ix2)->ix into a part of this vector,
+    // in the order in which the paths are enumerated by CGpaths.
+
+    void add_CGproduct_weighted(const GVEC& x, const GVEC& y, const vector<typename GPART::TENSOR>& W){
+      int k=0;
+      for(auto& b:CGpaths(*this,x,y,false)){
+	GPART::add_CGproduct_weighted_paths(path_parts(b.ls),x.part(b.l1),y.part(b.l2),path_weights(W,k,b));
+	k+=b.ls.size();
+      }
+      GELIB_ASSRT(k==W.size());
+    }
+
+    // Regarding this vector as the gradient of the weighted CG-product of x and y, add the gradients
+    // with respect to x, y and W to xg, yg and Wg. Each of them is skipped if it is empty.
+    void add_CGproduct_weighted_back(const GVEC& xg, const GVEC& yg, const vector<typename GPART::TENSOR>& Wg,
+      const GVEC& x, const GVEC& y, const vector<typename GPART::TENSOR>& W) const{
+      GELIB_ASSRT(Wg.size()==0 || Wg.size()==W.size());
+      int k=0;
+      for(auto& b:CGpaths(*this,x,y,false)){
+	GPART::add_CGproduct_weighted_back_paths(path_parts(b.ls),x.part(b.l1),y.part(b.l2),path_weights(W,k,b),
+	  xg.parts.size()>0?xg.part(b.l1):GPART(),yg.parts.size()>0?yg.part(b.l2):GPART(),
+	  (Wg.size()>0)?path_weights(Wg,k,b):vector<typename GPART::TENSOR>());
+	k+=b.ls.size();
+      }
+      GELIB_ASSRT(k==W.size());
+    }
+
+    // Diagonal CG-product with the output channels of each path multiplied by the weight vector in W,
+    // W being ordered as the paths in add_DiagCGproduct.
+    void add_DiagCGproduct_weighted(const GVEC& x, const GVEC& y, const vector<typename GPART::TENSOR>& W){
+      int k=0;
+      for(auto& b:CGpaths(*this,x,y,true)){
+	GPART::add_DiagCGproduct_weighted_paths(path_parts(b.ls),x.part(b.l1),y.part(b.l2),b.offs,path_weights(W,k,b));
+	k+=b.ls.size();
+      }
+      GELIB_ASSRT(k==W.size());
+    }
+
+    // Regarding this vector as the gradient of the weighted diagonal CG-product of x and y, add the
+    // gradients with respect to x, y and W to xg, yg and Wg. Each of them is skipped if it is empty.
+    void add_DiagCGproduct_weighted_back(const GVEC& xg, const GVEC& yg, const vector<typename GPART::TENSOR>& Wg,
+      const GVEC& x, const GVEC& y, const vector<typename GPART::TENSOR>& W) const{
+      GELIB_ASSRT(Wg.size()==0 || Wg.size()==W.size());
+      int k=0;
+      for(auto& b:CGpaths(*this,x,y,true)){
+	GPART::add_DiagCGproduct_weighted_back_paths(path_parts(b.ls),x.part(b.l1),y.part(b.l2),b.offs,path_weights(W,k,b),
+	  xg.parts.size()>0?xg.part(b.l1):GPART(),yg.parts.size()>0?yg.part(b.l2):GPART(),
+	  (Wg.size()>0)?path_weights(Wg,k,b):vector<typename GPART::TENSOR>());
+	k+=b.ls.size();
+      }
+      GELIB_ASSRT(k==W.size());
+    }
+
+    // The weights of the paths of block b, which start at position k of W
+    static vector<typename GPART::TENSOR> path_weights(const vector<typename GPART::TENSOR>& W, const int k,
+      const typename GvecCGplan<GPART>::Block& b){
+      GELIB_ASSRT(k+b.ls.size()<=W.size());
+      return vector<typename GPART::TENSOR>(W.begin()+k,W.begin()+k+b.ls.size());
+    }
+
+
+  public: // ---- Gathered CG-products -----------------------------------------------------------------------
+
+    // r_t+=CG(x_s,y_t) for each source s of each target t of gmap along the grid dimension,
+    // without materializing x.gather(gmap). See Gpart::add_CGproduct_gather_paths.
+
+    void add_CGproduct_gather(const GVEC& x, const GVEC& y, const cnine::GatherMapB& gmap){
+      for(auto& b:CGpaths(*this,x,y,false))
+	GPART::add_CGproduct_gather_paths(path_parts(b.ls),x.part(b.l1),y.part(b.l2),gmap,b.offs);
+    }
+
+    void add_CGproduct_gather_back0(const GVEC& g, const GVEC& y, const cnine::GatherMapB& gmap){
+      for(auto& b:CGpaths(g,*this,y,false))
+	GPART::add_CGproduct_gather_back0_paths(g.path_parts(b.ls),part(b.l1),y.part(b.l2),gmap,b.offs);
+    }
+
+    void add_CGproduct_gather_back1(const GVEC& g, const GVEC& x, const cnine::GatherMapB& gmap){
+      for(auto& b:CGpaths(g,x,*this,false))
+	GPART::add_CGproduct_gather_back1_paths(g.path_parts(b.ls),x.part(b.l1),part(b.l2),gmap,b.offs);
+    }
+
+
+    void add_DiagCGproduct_gather(const GVEC& x, const GVEC& y, const cnine::GatherMapB& gmap){
+      for(auto& b:CGpaths(*this,x,y,true))
+	GPART::add_DiagCGproduct_gather_paths(path_parts(b.ls),x.part(b.l1),y.part(b.l2),gmap,b.offs);
+    }
+
+    void add_DiagCGproduct_gather_back0(const GVEC& g, const GVEC& y, const cnine::GatherMapB& gmap){
+      for(auto& b:CGpaths(g,*this,y,true))
+	GPART::add_DiagCGproduct_gather_back0_paths(g.path_parts(b.ls),part(b.l1),y.part(b.l2),gmap,b.offs);
+    }
+
+    void add_DiagCGproduct_gather_back1(const GVEC& g, const GVEC& x, const cnine::GatherMapB& gmap){
+      for(auto& b:CGpaths(g,x,*this,true))
+	GPART::add_DiagCGproduct_gather_back1_paths(g.path_parts(b.ls),x.part(b.l1),part(b.l2),gmap,b.offs);
     }
 
 
@@ -0,0 +1,205 @@
+// This file is part of GElib, a C++/CUDA library for group
+// equivariant tensor operations.
+//
+// Copyright (c) 2024, Imre Risi Kondor
+//
+// This Source Code Form is subject to the terms of the Mozilla
+// Public License v. 2.0. If a copy of the MPL was not distributed
+// with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+#ifndef _GElibGvecCGplan
+#define _GElibGvecCGplan
+
+#include "GElib_base.hpp"
+#include "Gpart.hpp"
+
+
+namespace GElib{
+
+
+  // Precomputed plan for the CG-product (or diagonal CG-product) of two Gvecs of given types.
+  // For each pair of input parts (l1,l2) the plan stores the output parts that the pair
+  // contributes to, the channel offsets within those parts and pointers to the CG coefficients
+  // in the bank, so that repeated products of vectors of the same types can skip all of this.
+
+  template<typename GPART>
+  class GvecCGplan{
+  public:
+
+    typedef typename GPART::IRREP_IX IRREP_IX;
+    typedef typename GPART::GTYPE GTYPE;
+    typedef typename GPART::GROUP GROUP;
+    typedef typename GPART::CGCOEFFS CGCOEFFS;
+
+    struct Block{
+      IRREP_IX l1;
+      IRREP_IX l2;
+      vector<IRREP_IX> ls;
+      vector<int> offs;
+      vector<const CGCOEFFS*> coeffs;
+    };
+
+    GTYPE tau_x;
+    GTYPE tau_y;
+    GTYPE tau;
+    IRREP_IX limit;
+    bool diag=false;
+
+    vector<Block> blocks;
+
+
+  public: // ---- Constructors ------------------------------------------------------------------------------
+
+
+    GvecCGplan(const GTYPE& _tau_x, const GTYPE& _tau_y, const IRREP_IX& _limit=GPART::null_ix, const bool _diag=false):
+      tau_x(_tau_x),
+      tau_y(_tau_y),
+      limit(_limit),
+      diag(_diag){
+
+      if(diag) tau=tau_x.DiagCGproduct(tau_y,limit);
+      else tau=tau_x.CGproduct(tau_y,limit);
+      blocks=paths(tau_x,tau_y,diag,[&](const IRREP_IX& z){return tau.parts.find(z)!=tau.parts.end();});
+    }
+
+
+  public: // ---- Paths --------------------------------------------------------------------------------------
+
+
+    // The paths of the CG-product (or diagonal CG-product) of two Gvecs of types tau_x and tau_y into
+    // the output parts z for which has_part(z) is true, grouped by the pair of input parts. This is the
+    // order in which all the CG-product functions of Gvec enumerate the paths and lay out the channels
+    // of the output parts.
+    static vector<Block> paths(const GTYPE& tau_x, const GTYPE& tau_y, const bool diag,
+      const std::function<bool(const IRREP_IX&)>& has_part){
+      vector<Block> R;
+      map<IRREP_IX,int> offset;
+      for(auto& p:tau_x.parts)
+	for(auto& q:tau_y.parts){
+	  Block block;
+	  block.l1=p.first;
+	  block.l2=q.first;
+	  GROUP::for_each_CGcomponent(p.first,q.first,[&](const IRREP_IX& z, const int m){
+	      if(!has_part(z)) return;
+	      block.ls.push_back(z);
+	      block.offs.push_back(offset[z]);
+	      block.coeffs.push_back(&GPART::CGcoeffs(p.first,q.first,z));
+	      if(diag) offset[z]+=m*p.second;
+	      else offset[z]+=m*p.second*q.second;
+	    });
+	  if(block.ls.size()>0) R.push_back(block);
+	}
+      return R;
+    }
+
+
+  public: // ---- Access -------------------------------------------------------------------------------------
+
+
+    GTYPE get_tau() const{
+      return tau;
+    }
+
+    int npaths() const{
+      int t=0;
+      for(auto& p:blocks) t+=p.ls.size();
+      return t;
+    }
+
+
+  public: // ---- Execution ----------------------------------------------------------------------------------
+
+
+    template<typename GVEC>
+    GVEC operator()(const GVEC& x, const GVEC& y) const{
+      GVEC R(x.dominant_batch(y),x.dominant_gdims(y),tau,0,x.get_dev());
+      add(R,x,y);
+      return R;
+    }
+
+    template<typename GVEC>
+    void add(const GVEC& r, const GVEC& x, const GVEC& y) const{
+      check_types(r,x,y);
+      for(auto& b:blocks){
+	vector<GPART> rparts=r.path_parts(b.ls);
+	if(diag) GPART::add_DiagCGproduct_paths(rparts,x.part(b.l1),y.part(b.l2),b.offs,b.coeffs);
+	else GPART::add_CGproduct_paths(rparts,x.part(b.l1),y.part(b.l2),b.offs,b.coeffs);
+      }
+    }
+
+    template<typename GVEC>
+    void add_back0(const GVEC& xg, const GVEC& g, const GVEC& y) const{
+      check_types(g,xg,y);
+      for(auto& b:blocks){
+	vector<GPART> gparts=g.path_parts(b.ls);
+	if(diag) GPART::add_DiagCGproduct_back0_paths(gparts,xg.part(b.l1),y.part(b.l2),b.offs,b.coeffs);
+	else GPART::add_CGproduct_back0_paths(gparts,xg.part(b.l1),y.part(b.l2),b.offs,b.coeffs);
+      }
+    }
+
+    template<typename GVEC>
+    void add_back1(const GVEC& yg, const GVEC& g, const GVEC& x) const{
+      check_types(g,x,yg);
+      for(auto& b:blocks){
+	vector<GPART> gparts=g.path_parts(b.ls);
+	if(diag) GPART::add_DiagCGproduct_back1_paths(gparts,x.part(b.l1),yg.part(b.l2),b.offs,b.coeffs);
+	else GPART::add_CGproduct_back1_paths(gparts,x.part(b.l1),yg.part(b.l2),b.offs,b.coeffs);
+      }
+    }
+
+    // Both backward passes with a single pass over g. xg or yg may have no parts if that gradient is not needed.
+    template<typename GVEC>
+    void add_back01(const GVEC& xg, const GVEC& yg, const GVEC& g, const GVEC& x, const GVEC& y) const{
+      check_types(g,x,y);
+      for(auto& b:blocks){
+	vector<GPART> gparts=g.path_parts(b.ls);
+	GPART _xg=xg.parts.size()>0?xg.part(b.l1):GPART();
+	GPART _yg=yg.parts.size()>0?yg.part(b.l2):GPART();
+	if(diag) GPART::add_DiagCGproduct_back01_paths(gparts,x.part(b.l1),y.part(b.l2),b.offs,_xg,_yg,b.coeffs);
+	else GPART::add_CGproduct_back01_paths(gparts,x.part(b.l1),y.part(b.l2),b.offs,_xg,_yg,b.coeffs);
+      }
+    }
+
+
+  private:
+
+    template<typename GVEC>
+    void check_types(const GVEC& r, const GVEC& x, const GVEC& y) const{
+      if(x.get_tau().parts!=tau_x.parts || y.get_tau().parts!=tau_y.parts || r.get_tau().parts!=tau.parts)
+	GELIB_ERROR("the types of the arguments do not match the types that this CG plan was constructed for");
+    }
+
+
+  public: // ---- I/O ----------------------------------------------------------------------------------------
+
+
+    string classname() const{
+      return "GElib::GvecCGplan";
+    }
+
+    string repr() const{
+      ostringstream oss;
+      oss<<"<CGplan "<<tau_x.str()<<" x "<<tau_y.str()<<" -> "<<tau.str();
+      if(diag) oss<<" diag";
+      oss<<" paths="<<npaths()<<">";
+      return oss.str();
+    }
+
+    string str(const string indent="") const{
+      ostringstream oss;
+      for(auto& b:blocks)
+	for(int i=0; i<b.ls.size(); i++)
+	  oss<<indent<<"("<<b.l1<<","<<b.l2<<")->"<<b.ls[i]<<" offset="<<b.offs[i]<<endl;
+      return oss.str();
+    }
+
+    friend ostream& operator<<(ostream& stream, const GvecCGplan& x){
+      stream<<x.str(); return stream;
+    }
+
+  };
+
+}
+
+#endif
@@ -0,0 +1,137 @@
+// This file is part of GElib, a C++/CUDA library for group
+// equivariant tensor operations.
+//
+// Copyright (c) 2025, Imre Risi Kondor
+//
+// This Source Code Form is subject to the terms of the Mozilla
+// Public License v. 2.0. If a copy of the MPL was not distributed
+// with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+#ifndef _GElibGroupedGemm
+#define _GElibGroupedGemm
+
+#ifdef _WITH_ATEN
+
+#include <ATen/ATen.h>
+
+#include "GElib_base.hpp"
+
+#ifdef _WITH_MKL
+// MKL's grouped batch GEMM, exported by the MKL build that torch links against. The symbol is weak so
+// that a torch built without it falls back to one GEMM per product.
+extern "C" void cblas_cgemm_batch(const int layout, const int* transa, const int* transb,
+  const int* m, const int* n, const int* k, const void* alpha, const void** a, const int* lda,
+  const void** b, const int* ldb, const void* beta, void** c, const int* ldc,
+  const int group_count, const int* group_size) __attribute__((weak));
+#endif
+
+
+namespace GElib{
+
+
+  // A list of complex products C_i=op(A_i)*op(B_i) of 2d tensors, where op is the identity or the
+  // conjugate transpose. run() computes all of them in a single grouped GEMM call on the CPU when torch
+  // is built with MKL, and by one GEMM per product otherwise, e.g., on the GPU.
+
+  class GroupedGemm{
+  public:
+
+    vector<at::Tensor> C;
+    vector<at::Tensor> A;
+    vector<at::Tensor> B;
+    vector<int> transa;
+    vector<int> transb;
+
+
+  public: // ---- Products -----------------------------------------------------------------------------------
+
+
+    // Add the product C=op(A)*op(B), where C is a 2d tensor with unit column stride to be overwritten
+    void add(const at::Tensor& _C, const at::Tensor& _A, const at::Tensor& _B, const bool conjA, const bool conjB){
+      GELIB_ASSRT(_C.dim()==2 && _A.dim()==2 && _B.dim()==2);
+      GELIB_ASSRT(_C.size(1)<=1 || _C.stride(1)==1);
+      GELIB_ASSRT(_C.scalar_type()==at::kComplexFloat);
+      GELIB_ASSRT(_C.size(0)==_A.size(conjA) && _C.size(1)==_B.size(1-conjB) && _A.size(1-conjA)==_B.size(conjB));
+      C.push_back(_C);
+      A.push_back(matrix(_A));
+      B.push_back(matrix(_B));
+      transa.push_back(conjA);
+      transb.push_back(conjB);
+    }
+
+    void run(){
+      if(C.size()==0) return;
+#ifdef _WITH_MKL
+      if(cblas_cgemm_batch!=nullptr && C[0].device().is_cpu()){
+	run_mkl();
+	return;
+      }
+#endif
+      for(int i=0; i<C.size(); i++)
+	at::mm_out(C[i],transa[i]?A[i].conj().t():A[i],transb[i]?B[i].conj().t():B[i]);
+    }
+
+
+    // View a part of dimensions (b,g1,...,gk,m,n) as a matrix of dimensions (b*g1*...*gk*m,n)
+    static at::Tensor cell_rows(const at::Tensor& x){
+      GELIB_ASSRT(x.dim()>=1);
+      int64_t rows=1;
+      for(int i=0; i<x.dim()-1; i++) rows*=x.size(i);
+      return x.reshape({rows,x.size(-1)});
+    }
+
+
+  private:
+
+    // View x as a matrix with unit column stride that the GEMM can read directly
+    static at::Tensor matrix(const at::Tensor& x){
+      GELIB_ASSRT(x.scalar_type()==at::kComplexFloat);
+      at::Tensor R=x.resolve_conj().resolve_neg();
+      if((R.size(1)>1 && R.stride(1)!=1) || (R.size(0)>1 && R.stride(0)<R.size(1))) R=R.contiguous();
+      return R;
+    }
+
+    // The leading dimension of a matrix returned by matrix()
+    static int ld(const at::Tensor& x){
+      if(x.size(0)<=1) return std::max<int64_t>(1,x.size(1));
+      return x.stride(0);
+    }
+
+#ifdef _WITH_MKL
+    void run_mkl(){
+      const int n=C.size();
+      vector<int> ta(n), tb(n), m(n), N(n), k(n), lda(n), ldb(n), ldc(n), group_size(n,1);
+      vector<complex<float> > alpha(n,1), beta(n,0);
+      vector<const void*> a(n), b(n);
+      vector<void*> c(n);
+      int g=0;
+      for(int i=0; i<n; i++){
+	const int K=transa[i]?A[i].size(0):A[i].size(1);
+	if(C[i].numel()==0) continue;
+	if(K==0){C[i].zero_(); continue;}
+	ta[g]=transa[i]?113:111; // CblasConjTrans, CblasNoTrans
+	tb[g]=transb[i]?113:111;
+	m[g]=C[i].size(0);
+	N[g]=C[i].size(1);
+	k[g]=K;
+	a[g]=A[i].data_ptr();
+	b[g]=B[i].data_ptr();
+	c[g]=C[i].data_ptr();
+	lda[g]=ld(A[i]);
+	ldb[g]=ld(B[i]);
+	ldc[g]=ld(C[i]);
+	g++;
+      }
+      if(g==0) return;
+      cblas_cgemm_batch(101,ta.data(),tb.data(),m.data(),N.data(),k.data(),alpha.data(), // CblasRowMajor
+	a.data(),lda.data(),b.data(),ldb.data(),beta.data(),c.data(),ldc.data(),g,group_size.data());
+    }
+#endif
+
+  };
+
+}
+
+#endif
+#endif
@@ -13,6 +13,7 @@
 #define _GElibSession
 
 #include "CnineSession.hpp"
+#include "GElibThreadPool.hpp"
 //#include "GElibConfig.hpp"
 //#include "GElibLog.hpp"
 
@@ -36,6 +37,7 @@ namespace GElib{
       #endif
 
       cnine_session=new cnine::cnine_session(_nthreads);
+      GElib_threads.set_nthreads(_nthreads);
       //gelib_config=new GElibConfig();
       //gelib_log=new GElibLog();
     }
@@ -0,0 +1,187 @@
+// This file is part of GElib, a C++/CUDA library for group
+// equivariant tensor operations.
+//
+// Copyright (c) 2024, Imre Risi Kondor
+//
+// This Source Code Form is subject to the terms of the Mozilla
+// Public License v. 2.0. If a copy of the MPL was not distributed
+// with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+#ifndef _GElibThreadPool
+#define _GElibThreadPool
+
+#include <thread>
+#include <mutex>
+#include <condition_variable>
+#include <atomic>
+#include <exception>
+
+#include "GElib_base.hpp"
+
+
+namespace GElib{
+
+
+  // Persistent pool of worker threads used by the CPU kernels. parallel_for(n,lambda) calls
+  // lambda(0),...,lambda(n-1), distributing the indices dynamically between the workers and the
+  // calling thread, and returns once all of them have finished. Nested calls, and calls made
+  // while another thread is already using the pool, simply run serially.
+
+  class GElibThreadPool{
+  public:
+
+    GElibThreadPool(){}
+
+    ~GElibThreadPool(){
+      stop_workers();
+    }
+
+    GElibThreadPool(const GElibThreadPool& x)=delete;
+    GElibThreadPool& operator=(const GElibThreadPool& x)=delete;
+
+
+  public: // ---- Access -------------------------------------------------------------------------------------
+
+
+    int get_nthreads() const{
+      return nthreads;
+    }
+
+    void set_nthreads(const int n){
+      GELIB_ASSRT(n>=1);
+      lock_guard<mutex> guard(run_mx);
+      if(n==nthreads) return;
+      stop_workers();
+      nthreads=n;
+      for(int i=0; i<n-1; i++)
+	workers.push_back(thread([this,g=generation](){worker_loop(g);}));
+    }
+
+
+  public: // ---- Execution ----------------------------------------------------------------------------------
+
+
+    void parallel_for(const int n, const std::function<void(const int)>& lambda){
+      if(n<=0) return;
+      if(n==1 || nthreads<=1 || in_parallel_region()){
+	for(int i=0; i<n; i++) lambda(i);
+	return;
+      }
+
+      unique_lock<mutex> run_lock(run_mx,std::try_to_lock);
+      if(!run_lock.owns_lock()){
+	for(int i=0; i<n; i++) lambda(i);
+	return;
+      }
+
+      {
+	lock_guard<mutex> lock(mx);
+	job=&lambda;
+	njobs=n;
+	next=0;
+	npending=workers.size();
+	error=nullptr;
+	generation++;
+      }
+      work_cv.notify_all();
+
+      run_jobs();
+
+      unique_lock<mutex> lock(mx);
+      done_cv.wait(lock,[this](){return npending==0;});
+      job=nullptr;
+      if(error) std::rethrow_exception(error);
+    }
+
+
+  private:
+
+
+    static bool& in_parallel_region(){
+      thread_local bool flag=false;
+      return flag;
+    }
+
+    void run_jobs(){
+      in_parallel_region()=true;
+      int i;
+      while((i=next++)<njobs){
+	try{
+	  (*job)(i);
+	}catch(...){
+	  lock_guard<mutex> lock(mx);
+	  if(!error) error=std::current_exception();
+	}
+      }
+      in_parallel_region()=false;
+    }
+
+    void worker_loop(size_t seen){
+      while(true){
+	{
+	  unique_lock<mutex> lock(mx);
+	  work_cv.wait(lock,[&](){return stopping || generation!=seen;});
+	  if(stopping) return;
+	  seen=generation;
+	}
+	run_jobs();
+	{
+	  lock_guard<mutex> lock(mx);
+	  npending--;
+	}
+	done_cv.notify_one();
+      }
+    }
+
+    void stop_workers(){
+      {
+	lock_guard<mutex> lock(mx);
+	stopping=true;
+      }
+      work_cv.notify_all();
+      for(auto& p:workers) p.join();
+      workers.clear();
+      stopping=false;
+      nthreads=1;
+    }
+
+
+  private:
+
+    int nthreads=1;
+    vector<thread> workers;
+
+    mutex run_mx;
+    mutex mx;
+    condition_variable work_cv;
+    condition_variable done_cv;
+
+    const std::function<void(const int)>* job=nullptr;
+    int njobs=0;
+    std::atomic<int> next{0};
+    int npending=0;
+    size_t generation=0;
+    bool stopping=false;
+    std::exception_ptr error;
+
+  };
+
+
+  extern GElibThreadPool GElib_threads;
+
+  inline void parallel_for(const int n, const std::function<void(const int)>& lambda){
+    GElib_threads.parallel_for(n,lambda);
+  }
+
+  inline int get_nthreads(){
+    return GElib_threads.get_nthreads();
+  }
+
+  inline void set_nthreads(const int n){
+    GElib_threads.set_nthreads(n);
+  }
+
+}
+
+#endif
@@ -10,6 +10,7 @@
 
 #include "Cnine_base.cpp"
 #include "GElib_base.hpp"
+#include "GElibThreadPool.hpp"
 
 #include "SO3CGbank.hpp"
 #include "SO3SPHgen.hpp"
@@ -17,6 +18,7 @@
 
 namespace GElib{
 
+  GElibThreadPool GElib_threads;
   SO3CGbank SO3_CGbank;
   SO3SPHgen SO3_SPHgen;
 
@@ -0,0 +1,58 @@
+# This file is part of GElib, a C++/CUDA library for group
+# equivariant tensor operations.
+#
+# Copyright (c) 2025, Imre Risi Kondor
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# Time SO3weights, forward and backward, against the same map written as a loop of torch.matmul calls
+# over the parts of the vector. SO3weights computes the products of all the parts, and in the backward
+# pass both gradients of all the parts, in one grouped GEMM call behind a single autograd node.
+#
+#   python bench_SO3weights.py
+
+import time
+import torch
+import gelib as G
+
+
+def timeit(fn, reps):
+    fn()
+    t=time.perf_counter()
+    for i in range(reps):
+        fn()
+    return (time.perf_counter()-t)/reps
+
+
+def bench(b, nc, L, reps=20):
+    tau={l:nc for l in range(L+1)}
+    x=G.SO3vec.randn(b,tau)
+    W=G.SO3weights.randn(tau,tau)
+    x.requires_grad_()
+    W.requires_grad_()
+    xparts=list(x.parts.values())
+    wparts=list(W.parts.values())
+    grads=[torch.randn_like(p) for p in W.apply_to_parts(x.parts)]
+
+    def gelib_fwd():
+        W.apply_to_parts(x.parts)
+
+    def torch_fwd():
+        [torch.matmul(p,w) for p,w in zip(xparts,wparts)]
+
+    def gelib_fwd_bwd():
+        torch.autograd.backward(W.apply_to_parts(x.parts),grads)
+
+    def torch_fwd_bwd():
+        torch.autograd.backward([torch.matmul(p,w) for p,w in zip(xparts,wparts)],grads)
+
+    t=[timeit(f,reps) for f in [gelib_fwd,torch_fwd,gelib_fwd_bwd,torch_fwd_bwd]]
+    print("b=%4d nc=%4d L=%d   forward: gelib %.5fs torch %.5fs (x%.2f)   forward+backward: gelib %.5fs torch %.5fs (x%.2f)"%
+          (b,nc,L,t[0],t[1],t[1]/t[0],t[2],t[3],t[3]/t[2]))
+
+
+if __name__=="__main__":
+    for b,nc in [(4,16),(32,16),(256,16),(64,64),(256,128)]:
+        bench(b,nc,6)
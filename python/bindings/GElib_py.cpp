@@ -15,8 +15,10 @@
 
 #include "GElib_base.cpp"
 #include "GElibSession.hpp"
+#include "GElibGroupedGemm.hpp"
 
 #include "GatherMapB.hpp" // temporary 
+#include "GatherMapFunctions.hpp"
 
 #include "SO3element.hpp"
 #include "SO3irrep.hpp"
@@ -40,6 +42,44 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
 
   m.def("version",[](){cout<<_GELIB_VERSION<<endl;});
 
+  m.def("set_num_threads",[](const int n){GElib_threads.set_nthreads(n);},
+    "Set the number of CPU threads used by GElib's kernels.");
+  m.def("get_num_threads",[](){return GElib_threads.get_nthreads();},
+    "Return the number of CPU threads used by GElib's kernels.");
+
+  m.def("linear_parts",[](const vector<at::Tensor>& x, const vector<at::Tensor>& W){
+      GELIB_ASSRT(W.size()==x.size());
+      GroupedGemm gemm;
+      vector<at::Tensor> r;
+      for(int i=0; i<x.size(); i++){
+	auto dims=x[i].sizes().vec();
+	dims.back()=W[i].size(1);
+	r.push_back(at::empty(dims,x[i].options()));
+	gemm.add(GroupedGemm::cell_rows(r[i]),GroupedGemm::cell_rows(x[i]),W[i],false,false);
+      }
+      gemm.run();
+      return r;},py::arg("x"),py::arg("W"),
+    "Multiply the channel dimension of each part x[i] by the matrix W[i], all in one grouped GEMM.");
+
+  m.def("linear_parts_back",[](const vector<at::Tensor>& g, const vector<at::Tensor>& x, const vector<at::Tensor>& W,
+      const bool xgrad, const bool Wgrad){
+      GELIB_ASSRT(g.size()==x.size() && W.size()==x.size());
+      GroupedGemm gemm;
+      vector<at::Tensor> xg, Wg;
+      for(int i=0; i<x.size(); i++){
+	if(xgrad){
+	  xg.push_back(at::empty(x[i].sizes(),x[i].options()));
+	  gemm.add(GroupedGemm::cell_rows(xg[i]),GroupedGemm::cell_rows(g[i]),W[i],false,true);
+	}
+	if(Wgrad){
+	  Wg.push_back(at::empty(W[i].sizes(),W[i].options()));
+	  gemm.add(Wg[i],GroupedGemm::cell_rows(x[i]),GroupedGemm::cell_rows(g[i]),true,false);
+	}
+      }
+      gemm.run();
+      return make_pair(xg,Wg);},py::arg("g"),py::arg("x"),py::arg("W"),py::arg("xgrad")=true,py::arg("Wgrad")=true,
+    "The gradients g[i]*W[i]^H and x[i]^H*g[i] of linear_parts with respect to x and W, computed in one grouped GEMM.");
+
   typedef cnine::TensorView<float> tensorf;
   typedef cnine::TensorView<complex<float> > tensorc;
 
@@ -47,6 +87,7 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
 
   #include "SO3element_py.cpp"
   #include "SO3irrep_py.cpp"
+  #include "SO3radialBasis_py.cpp"
   #include "SO3type_py.cpp"
   #include "SO3part_py.cpp"
   #include "SO3vec_py.cpp"
@@ -22,6 +22,21 @@ py::class_<SO3irrep>(m,"SO3irrep",
 	 return x.matrix<float>(alpha,beta,gamma).torch();})
   .def("matrix",[](const SO3irrep& x, const SO3element<float>& R){
 	 return x.matrix(R).torch();})
+  .def("matrices",[](const SO3irrep& x, at::Tensor& R){
+	 return x.matrices<float>(tensorf::view(R)).torch();},
+    "Representation matrices of a batch of rotations given as a tensor of dimensions (b,3,3)")
+  .def_static("matrices_all",[](const int L, at::Tensor& R){
+      vector<at::Tensor> r;
+      for(auto& p:SO3irrep::matrices_all<float>(L,tensorf::view(R))) r.push_back(p.torch());
+      return r;},
+    "Representation matrices D^0,...,D^L of a batch of rotations given as a tensor of dimensions (b,3,3)")
+
+  .def("littled",&SO3irrep::littled)
+  .def_static("littled_all",[](const int L, at::Tensor& beta){
+      vector<at::Tensor> r;
+      for(auto& p:SO3irrep::littled_all<float>(L,tensorf::view(beta))) r.push_back(p.torch());
+      return r;},
+    "Wigner little-d matrices d^0,...,d^L for a vector of n angles, as tensors of dimensions (n,2l+1,2l+1)")
     
   .def("str",&SO3irrep::str,py::arg("indent")="")
   .def("__str__",&SO3irrep::str,py::arg("indent")="")
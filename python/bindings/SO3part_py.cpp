@@ -18,7 +18,16 @@ py::class_<SO3part<float> >(m,"SO3part",
   .def("add_gather",[](SO3part<float>& r, const SO3part<float>& x, const GatherMapB& gmap, const int d){
       r.add_gather(x,gmap,d);})
   .def("add_gather_back",[](SO3part<float>& xg, const SO3part<float>& rg, const GatherMapB& gmap, const int d){
-      xg.add_gather(rg,gmap,d);})
+      xg.add_gather_back(rg,gmap,d);})
+
+  .def("add_segment_sum",[](SO3part<float>& r, const SO3part<float>& x, const GatherMapB& gmap, const int d, const bool mean){
+      r.add_segment_sum(x,gmap,d,mean);},py::arg("x"),py::arg("gmap"),py::arg("d")=0,py::arg("mean")=false)
+  .def("add_segment_sum_back",[](SO3part<float>& xg, const SO3part<float>& g, const GatherMapB& gmap, const int d, const bool mean){
+      xg.add_segment_sum_back(g,gmap,d,mean);},py::arg("g"),py::arg("gmap"),py::arg("d")=0,py::arg("mean")=false)
+  .def("add_segment_max_norm",[](SO3part<float>& r, const SO3part<float>& x, const GatherMapB& gmap, const int d, at::Tensor& argmax){
+      r.add_segment_max_norm(x,gmap,d,TensorView<int>::view(argmax));})
+  .def("add_segment_max_norm_back",[](SO3part<float>& xg, const SO3part<float>& g, const GatherMapB& gmap, const int d, at::Tensor& argmax){
+      xg.add_segment_max_norm_back(g,gmap,d,TensorView<int>::view(argmax));})
 
 //  .def("add_spharm",[](SO3part<float>& obj, const float x, const float y, const float z){
 //    obj.add_spharm(x,y,z);})
@@ -32,6 +41,10 @@ py::class_<SO3part<float> >(m,"SO3part",
       r.add_CGproduct_back0(g,y,offs);},py::arg("g"),py::arg("y"),py::arg("offs")=0)
   .def("add_CGproduct_back1",[](SO3part<float>& r, SO3part<float>& g, const SO3part<float>& x, const int offs){
       r.add_CGproduct_back1(g,x,offs);},py::arg("g"),py::arg("x"),py::arg("offs")=0)
+  .def("add_CGproduct_back01",[](const SO3part<float>& g, SO3part<float>& xg, SO3part<float>& yg,
+      const SO3part<float>& x, const SO3part<float>& y, const int offs){
+      g.add_CGproduct_back01(xg,yg,x,y,offs);},py::arg("xg"),py::arg("yg"),py::arg("x"),py::arg("y"),py::arg("offs")=0,
+    "Add the gradients of the CG-product of x and y with respect to x and y to xg and yg in a single pass.")
   
   .def("add_DiagCGproduct",[](SO3part<float>& r, const SO3part<float>& x, const SO3part<float>& y, const int offs){
       r.add_DiagCGproduct(x,y,offs);},py::arg("x"),py::arg("y"),py::arg("offs")=0)
@@ -39,6 +52,24 @@ py::class_<SO3part<float> >(m,"SO3part",
       r.add_DiagCGproduct_back0(g,y,offs);},py::arg("g"),py::arg("y"),py::arg("offs")=0)
   .def("add_DiagCGproduct_back1",[](SO3part<float>& r, SO3part<float>& g, const SO3part<float>& x, const int offs){
       r.add_DiagCGproduct_back1(g,x,offs);},py::arg("g"),py::arg("x"),py::arg("offs")=0)
+  .def("add_DiagCGproduct_back01",[](const SO3part<float>& g, SO3part<float>& xg, SO3part<float>& yg,
+      const SO3part<float>& x, const SO3part<float>& y, const int offs){
+      g.add_DiagCGproduct_back01(xg,yg,x,y,offs);},py::arg("xg"),py::arg("yg"),py::arg("x"),py::arg("y"),py::arg("offs")=0,
+    "Add the gradients of the diagonal CG-product of x and y with respect to x and y to xg and yg in a single pass.")
+  
+  .def("add_CGproduct_gather",[](SO3part<float>& r, const SO3part<float>& x, const SO3part<float>& y, const GatherMapB& gmap, const int offs){
+      r.add_CGproduct_gather(x,y,gmap,offs);},py::arg("x"),py::arg("y"),py::arg("gmap"),py::arg("offs")=0)
+  .def("add_CGproduct_gather_back0",[](SO3part<float>& r, SO3part<float>& g, const SO3part<float>& y, const GatherMapB& gmap, const int offs){
+      r.add_CGproduct_gather_back0(g,y,gmap,offs);},py::arg("g"),py::arg("y"),py::arg("gmap"),py::arg("offs")=0)
+  .def("add_CGproduct_gather_back1",[](SO3part<float>& r, SO3part<float>& g, const SO3part<float>& x, const GatherMapB& gmap, const int offs){
+      r.add_CGproduct_gather_back1(g,x,gmap,offs);},py::arg("g"),py::arg("x"),py::arg("gmap"),py::arg("offs")=0)
+
+  .def("add_DiagCGproduct_gather",[](SO3part<float>& r, const SO3part<float>& x, const SO3part<float>& y, const GatherMapB& gmap, const int offs){
+      r.add_DiagCGproduct_gather(x,y,gmap,offs);},py::arg("x"),py::arg("y"),py::arg("gmap"),py::arg("offs")=0)
+  .def("add_DiagCGproduct_gather_back0",[](SO3part<float>& r, SO3part<float>& g, const SO3part<float>& y, const GatherMapB& gmap, const int offs){
+      r.add_DiagCGproduct_gather_back0(g,y,gmap,offs);},py::arg("g"),py::arg("y"),py::arg("gmap"),py::arg("offs")=0)
+  .def("add_DiagCGproduct_gather_back1",[](SO3part<float>& r, SO3part<float>& g, const SO3part<float>& x, const GatherMapB& gmap, const int offs){
+      r.add_DiagCGproduct_gather_back1(g,x,gmap,offs);},py::arg("g"),py::arg("x"),py::arg("gmap"),py::arg("offs")=0)
   
 //  .def("apply",&SO3part<float>::rotate)
   
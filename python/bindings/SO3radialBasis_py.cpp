@@ -0,0 +1,28 @@
+// This file is part of GElib, a C++/CUDA library for group
+// equivariant tensor operations. 
+// 
+// Copyright (c) 2025, Imre Risi Kondor
+//
+// This Source Code Form is subject to the terms of the Mozilla
+// Public License v. 2.0. If a copy of the MPL was not distributed
+// with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+
+py::class_<SO3radialBasis>(m,"SO3radialBasis",
+  "Class to store a set of radial basis functions with a cutoff envelope")
+
+  .def(py::init<const string&, const int, const float, const string&, const int>(),
+    py::arg("basis"),py::arg("n"),py::arg("cutoff"),py::arg("envelope")="polynomial",py::arg("p")=6)
+
+  .def("__call__",[](const SO3radialBasis& obj, const float r){
+      vector<float> R(obj.n);
+      vector<float> dR(obj.n);
+      obj(r,R.data(),dR.data());
+      return make_pair(R,dR);})
+
+  .def_readonly("n",&SO3radialBasis::n)
+  .def_readonly("cutoff",&SO3radialBasis::cutoff)
+
+  .def("str",&SO3radialBasis::str,py::arg("indent")="")
+  .def("__str__",&SO3radialBasis::str,py::arg("indent")="")
+  .def("__repr__",&SO3radialBasis::repr);
@@ -40,18 +40,117 @@ py::class_<SO3vec<float> >(m,"SO3vec",
       return R;
     })
 
+  .def_static("view_packed",[](at::Tensor& x, const SO3type& tau){
+      return SO3vec<float>::view_packed(tensorc::view(x),tau);})
+
   .def("get_tau",&SO3vec<float>::get_tau)
 
+  .def("add_spharm",[](SO3vec<float>& obj, at::Tensor& X){
+      obj.add_spharm(tensorf::view(X));})
+  .def("add_spharm_back",[](const SO3vec<float>& obj, at::Tensor& XG, at::Tensor& X){
+      obj.add_spharm_back(tensorf::view(XG),tensorf::view(X));})
+  .def("add_spharm",[](SO3vec<float>& obj, at::Tensor& X, const SO3radialBasis& radial){
+      obj.add_spharm(tensorf::view(X),radial);})
+  .def("add_spharm_back",[](const SO3vec<float>& obj, at::Tensor& XG, at::Tensor& X, const SO3radialBasis& radial){
+      obj.add_spharm_back(tensorf::view(XG),tensorf::view(X),radial);})
+
   .def("addCGproduct",&SO3vec<float>::add_CGproduct,py::arg("x"),py::arg("y"))
   .def("addCGproduct_back0",&SO3vec<float>::add_CGproduct_back0,py::arg("g"),py::arg("y"))
   .def("addCGproduct_back1",&SO3vec<float>::add_CGproduct_back1,py::arg("g"),py::arg("x"))
+  .def("addCGproduct_back01",&SO3vec<float>::add_CGproduct_back01,py::arg("xg"),py::arg("yg"),py::arg("x"),py::arg("y"),
+    "Add the gradients of the CG-product of x and y with respect to x and y to xg and yg in a single pass over this gradient.")
 
   .def("addDiagCGproduct",&SO3vec<float>::add_DiagCGproduct,py::arg("x"),py::arg("y"))
   .def("addDiagCGproduct_back0",&SO3vec<float>::add_DiagCGproduct_back0,py::arg("g"),py::arg("y"))
   .def("addDiagCGproduct_back1",&SO3vec<float>::add_DiagCGproduct_back1,py::arg("g"),py::arg("x"))
+  .def("addDiagCGproduct_back01",&SO3vec<float>::add_DiagCGproduct_back01,py::arg("xg"),py::arg("yg"),py::arg("x"),py::arg("y"),
+    "Add the gradients of the diagonal CG-product of x and y with respect to x and y to xg and yg in a single pass over this gradient.")
+
+  .def("addCGproduct_weighted",[](SO3vec<float>& obj, const SO3vec<float>& x, const SO3vec<float>& y, vector<at::Tensor>& W){
+      vector<tensorc> _W;
+      for(auto& w:W) _W.push_back(tensorc::view(w));
+      obj.add_CGproduct_weighted(x,y,_W);},py::arg("x"),py::arg("y"),py::arg("W"))
+  .def("addCGproduct_weighted_back",[](const SO3vec<float>& obj, const SO3vec<float>& xg, const SO3vec<float>& yg,
+      vector<at::Tensor>& Wg, const SO3vec<float>& x, const SO3vec<float>& y, vector<at::Tensor>& W){
+      vector<tensorc> _W, _Wg;
+      for(auto& w:W) _W.push_back(tensorc::view(w));
+      for(auto& w:Wg) _Wg.push_back(tensorc::view(w));
+      obj.add_CGproduct_weighted_back(xg,yg,_Wg,x,y,_W);},
+    py::arg("xg"),py::arg("yg"),py::arg("Wg"),py::arg("x"),py::arg("y"),py::arg("W"),
+    "Add the gradients of the weighted CG-product of x and y with respect to x, y and W to xg, yg and Wg.")
+
+  .def("addDiagCGproduct_weighted",[](SO3vec<float>& obj, const SO3vec<float>& x, const SO3vec<float>& y, vector<at::Tensor>& W){
+      vector<tensorc> _W;
+      for(auto& w:W) _W.push_back(tensorc::view(w));
+      obj.add_DiagCGproduct_weighted(x,y,_W);},py::arg("x"),py::arg("y"),py::arg("W"))
+  .def("addDiagCGproduct_weighted_back",[](const SO3vec<float>& obj, const SO3vec<float>& xg, const SO3vec<float>& yg,
+      vector<at::Tensor>& Wg, const SO3vec<float>& x, const SO3vec<float>& y, vector<at::Tensor>& W){
+      vector<tensorc> _W, _Wg;
+      for(auto& w:W) _W.push_back(tensorc::view(w));
+      for(auto& w:Wg) _Wg.push_back(tensorc::view(w));
+      obj.add_DiagCGproduct_weighted_back(xg,yg,_Wg,x,y,_W);},
+    py::arg("xg"),py::arg("yg"),py::arg("Wg"),py::arg("x"),py::arg("y"),py::arg("W"),
+    "Add the gradients of the weighted diagonal CG-product of x and y with respect to x, y and W to xg, yg and Wg.")
+
+  .def("addCGproduct_gather",&SO3vec<float>::add_CGproduct_gather,py::arg("x"),py::arg("y"),py::arg("gmap"))
+  .def("addCGproduct_gather_back0",&SO3vec<float>::add_CGproduct_gather_back0,py::arg("g"),py::arg("y"),py::arg("gmap"))
+  .def("addCGproduct_gather_back1",&SO3vec<float>::add_CGproduct_gather_back1,py::arg("g"),py::arg("x"),py::arg("gmap"))
+
+  .def("addDiagCGproduct_gather",&SO3vec<float>::add_DiagCGproduct_gather,py::arg("x"),py::arg("y"),py::arg("gmap"))
+  .def("addDiagCGproduct_gather_back0",&SO3vec<float>::add_DiagCGproduct_gather_back0,py::arg("g"),py::arg("y"),py::arg("gmap"))
+  .def("addDiagCGproduct_gather_back1",&SO3vec<float>::add_DiagCGproduct_gather_back1,py::arg("g"),py::arg("x"),py::arg("gmap"))
 
   .def("str",&SO3vec<float>::str,py::arg("indent")="")
   .def("__str__",&SO3vec<float>::str,py::arg("indent")="")
   .def("__repr__",&SO3vec<float>::repr)
 ;
 
+
+
+py::class_<GvecCGplan<SO3part<float> > >(m,"SO3CGplan",
+  "Precomputed plan for the CG-product of two SO3vecs of given types")
+
+  .def(py::init([](const SO3type& x, const SO3type& y, const int maxl, const bool diag){
+	return GvecCGplan<SO3part<float> >(x,y,maxl,diag);}),
+    py::arg("tau_x"),py::arg("tau_y"),py::arg("maxl")=-1,py::arg("diag")=false)
+
+  .def("get_tau",&GvecCGplan<SO3part<float> >::get_tau)
+  .def("npaths",&GvecCGplan<SO3part<float> >::npaths)
+
+  .def("add",[](const GvecCGplan<SO3part<float> >& plan, const SO3vec<float>& r, const SO3vec<float>& x, const SO3vec<float>& y){
+      plan.add(r,x,y);},py::arg("r"),py::arg("x"),py::arg("y"))
+  .def("add_back0",[](const GvecCGplan<SO3part<float> >& plan, const SO3vec<float>& xg, const SO3vec<float>& g, const SO3vec<float>& y){
+      plan.add_back0(xg,g,y);},py::arg("xg"),py::arg("g"),py::arg("y"))
+  .def("add_back1",[](const GvecCGplan<SO3part<float> >& plan, const SO3vec<float>& yg, const SO3vec<float>& g, const SO3vec<float>& x){
+      plan.add_back1(yg,g,x);},py::arg("yg"),py::arg("g"),py::arg("x"))
+  .def("add_back01",[](const GvecCGplan<SO3part<float> >& plan, const SO3vec<float>& xg, const SO3vec<float>& yg,
+      const SO3vec<float>& g, const SO3vec<float>& x, const SO3vec<float>& y){
+      plan.add_back01(xg,yg,g,x,y);},py::arg("xg"),py::arg("yg"),py::arg("g"),py::arg("x"),py::arg("y"))
+
+  .def("str",&GvecCGplan<SO3part<float> >::str,py::arg("indent")="")
+  .def("__str__",&GvecCGplan<SO3part<float> >::str,py::arg("indent")="")
+  .def("__repr__",&GvecCGplan<SO3part<float> >::repr)
+;
+
+
+py::class_<SO3CGpower>(m,"SO3CGpower",
+  "Precomputed plan for the symmetric power of an SO3vec of a given type")
+
+  .def(py::init([](const SO3type& x, const int nu, const int maxl){
+	return SO3CGpower(x,nu,maxl);}),
+    py::arg("tau"),py::arg("nu"),py::arg("maxl")=-1)
+
+  .def("get_tau",&SO3CGpower::get_tau)
+  .def("npaths",&SO3CGpower::npaths)
+  .def("nmonomials",&SO3CGpower::nmonomials)
+  .def("get_paths",&SO3CGpower::get_paths)
+
+  .def("add",[](const SO3CGpower& plan, const SO3vec<float>& r, const SO3vec<float>& x){
+      plan.add(r,x);},py::arg("r"),py::arg("x"))
+  .def("add_back",[](const SO3CGpower& plan, const SO3vec<float>& xg, const SO3vec<float>& g, const SO3vec<float>& x){
+      plan.add_back(xg,g,x);},py::arg("xg"),py::arg("g"),py::arg("x"))
+
+  .def("str",&SO3CGpower::str,py::arg("indent")="")
+  .def("__str__",&SO3CGpower::str,py::arg("indent")="")
+  .def("__repr__",&SO3CGpower::repr)
+;
@@ -18,11 +18,34 @@ py::class_<cnine::GatherMapB>(m,"gather_map","Class to store the type of an SO3-
       return cnine::GatherMapB(sources,targets);})
 
   .def_static("from_matrix",[](const at::Tensor& M, const int nin, const int nout){
-      return cnine::GatherMapB(TensorView<int>::view(M),nin,nout);})
+      cnine::GatherMapB r(TensorView<int>::view(M),nin,nout);
+      r.n_in=nin; // the constructor does not record these
+      r.n_out=nout;
+      return r;})
+
+  .def_static("from_edge_index",[](const at::Tensor& edge_index, const int n_in, const int n_out){
+      GELIB_ASSRT(edge_index.dim()==2 && edge_index.size(0)==2);
+      GELIB_ASSRT(edge_index.scalar_type()==at::kLong && edge_index.device().is_cpu());
+      const int64_t* p=edge_index.data_ptr<int64_t>();
+      return gather_map_from_edges(p,p+edge_index.stride(0),edge_index.size(1),
+	edge_index.stride(1),edge_index.stride(1),n_in,n_out);},
+    py::arg("edge_index"),py::arg("n_in")=-1,py::arg("n_out")=-1,
+    "Gather map collecting the sources edge_index[0] of the edges into their targets edge_index[1].")
+
+  .def_static("radius_graph",[](at::Tensor& pos, const float cutoff, at::Tensor& batch, const int max_neighbors){
+      return radius_graph(tensorf::view(pos),cutoff,TensorView<int>::view(batch),max_neighbors);},
+    py::arg("pos"),py::arg("cutoff"),py::arg("batch"),py::arg("max_neighbors")=-1)
 
   .def_static("random",[](const int n, const int m, const float p){
       return cnine::GatherMapB::random(n,m,p);},py::arg("n"),py::arg("m"),py::arg("p")=0.5)
 
+  .def_readonly("n_in",&cnine::GatherMapB::n_in)
+  .def_readonly("n_out",&cnine::GatherMapB::n_out)
+  .def("edges",[](const cnine::GatherMapB& map){return gather_map_edges(map).torch();},
+    "The (source,target) pairs of the map in list order, as the columns of a (2,E) tensor.")
+  .def("inv",&cnine::GatherMapB::inv,py::return_value_policy::reference_internal,
+    "The inverse map. It is computed on first use and cached.")
+
   .def("str",&cnine::GatherMapB::str,py::arg("indent")="")
   .def("__str__",&cnine::GatherMapB::str,py::arg("indent")="")
   .def("__repr__",&cnine::GatherMapB::repr)
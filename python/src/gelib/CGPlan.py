@@ -0,0 +1,116 @@
+# This file is part of GElib, a C++/CUDA library for group
+# equivariant tensor operations.
+#
+# Copyright (c) 2024, Imre Risi Kondor
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import torch
+import gelib_base as gb
+from gelib.gelib_common import *
+from gelib.SO3vec import SO3vec, MakeZeroSO3parts
+from gelib.SO3vecArr import SO3vecArr, MakeZeroSO3partArrs
+
+
+# ----------------------------------------------------------------------------------------------------------
+# ---- CGPlan ----------------------------------------------------------------------------------------------
+# ----------------------------------------------------------------------------------------------------------
+
+
+class CGPlan:
+    """
+    Precomputed plan for the (full or diagonal) Clebsch--Gordan product of SO3vecs or SO3vecArrs
+    of types tau_x and tau_y. The output type, the channel offsets of the individual (l1,l2,l) paths and
+    the CG coefficients are computed once, and the plan can then be applied to any number of pairs
+    of vectors of these types.
+    >>> plan = gelib.CGPlan({0:2,1:2},{0:2,1:2},maxl=2)
+    >>> z = plan(x,y)
+    """
+
+    def __init__(self, tau_x, tau_y, maxl=-1, diag=False):
+        if maxl is None:
+            maxl=-1
+        self.tau_x=_as_tau(tau_x)
+        self.tau_y=_as_tau(tau_y)
+        self.maxl=maxl
+        self.diag=diag
+        self.obj=gb.SO3CGplan(gb.SO3type(self.tau_x),gb.SO3type(self.tau_y),maxl,diag)
+        self.tau=self.obj.get_tau().get_parts()
+
+    def __call__(self, x, y):
+        assert type(x)==type(y)
+        assert isinstance(x,(SO3vec,SO3vecArr))
+        if x.tau()!=self.tau_x or y.tau()!=self.tau_y:
+            raise ValueError("CGPlan: the types of the arguments do not match the types of the plan.")
+        xparts=list(x.parts.values())
+        yparts=list(y.parts.values())
+        rparts=list(CGPlanFn.apply(self, len(xparts), len(yparts), *(xparts+yparts)))
+        return type(x)(*rparts)
+
+    def npaths(self):
+        return self.obj.npaths()
+
+
+    # ---- I/O ----------------------------------------------------------------------------------------------
+
+
+    def __repr__(self):
+        return self.obj.__repr__()
+
+    def __str__(self):
+        return self.obj.__str__()
+
+
+def _as_tau(tau):
+    if isinstance(tau,dict):
+        return dict(tau)
+    if isinstance(tau,(list,tuple)):
+        return {l:n for l,n in enumerate(tau)}
+    if isinstance(tau,gb.SO3type):
+        return tau.get_parts()
+    return _as_tau(tau.obj)
+
+
+# ----------------------------------------------------------------------------------------------------------
+# ---- Autograd functions -----------------------------------------------------------------------------------
+# ----------------------------------------------------------------------------------------------------------
+
+
+class CGPlanFn(torch.autograd.Function):
+
+    @staticmethod
+    def forward(ctx, plan, k1, k2, *args):
+        ctx.plan = plan
+        ctx.k1 = k1
+        ctx.k2 = k2
+        ctx.save_for_backward(*args)
+
+        x=gb.SO3vec.view(args[0:k1])
+        y=gb.SO3vec.view(args[k1:k1+k2])
+        b=common_batch(args[0],args[k1])
+        if args[0].dim()>3:
+            rparts=MakeZeroSO3partArrs(b,list(args[0].size()[1:-2]),plan.tau,args[0].device)
+        else:
+            rparts=MakeZeroSO3parts(b,plan.tau,args[0].device)
+        r=gb.SO3vec.view(rparts)
+        plan.obj.add(r,x,y)
+
+        return tuple(rparts)
+
+    @staticmethod
+    def backward(ctx, *args):
+
+        k1 = ctx.k1
+        k2 = ctx.k2
+        saved=ctx.saved_tensors
+        xgrads=zero_grads(ctx.needs_input_grad[3:3+k1],saved[0:k1])
+        ygrads=zero_grads(ctx.needs_input_grad[3+k1:3+k1+k2],saved[k1:k1+k2])
+
+        x=gb.SO3vec.view(saved[0:k1])
+        y=gb.SO3vec.view(saved[k1:k1+k2])
+        g=gb.SO3vec.view(args)
+        ctx.plan.obj.add_back01(gb.SO3vec.view(xgrads or []),gb.SO3vec.view(ygrads or []),g,x,y)
+
+        return tuple([None,None,None]+(xgrads or [None]*k1)+(ygrads or [None]*k2))
@@ -34,6 +34,16 @@ class SO3element(torch.Tensor):
     def random(self):
         return SO3element(gb.SO3element.random().torch())
 
+    @classmethod
+    def random_batch(self,b,device='cpu'):
+        """
+        A tensor of dimensions (b,3,3) of independent uniformly random rotations, e.g. for passing to apply.
+        """
+        Q,R=torch.linalg.qr(torch.randn(b,3,3,device=device))
+        Q=Q*torch.sign(torch.diagonal(R,dim1=-2,dim2=-1)).unsqueeze(-2)
+        Q[:,:,0]*=torch.sign(torch.linalg.det(Q)).unsqueeze(-1)
+        return Q
+
 
     # ---- Operations --------------------------------------------------------------------------------------
 
@@ -37,6 +37,32 @@ class SO3irrep:
             assert len(R)==3
             return self.obj.matrix(R[0],R[1],R[2])
 
+    def matrices(self,R):
+        """
+        The representation matrices of a batch of rotations given as a tensor of dimensions (b,3,3).
+        Returns a (b,2l+1,2l+1) dimensional complex tensor on the same device as R.
+        """
+        assert isinstance(R,torch.Tensor) and R.dim()==3
+        return self.obj.matrices(R.detach().to('cpu',torch.float32).contiguous()).to(R.device)
+
+    @staticmethod
+    def matrices_all(L,R):
+        """
+        The representation matrices D^0,...,D^L of a batch of rotations given as a tensor of dimensions (b,3,3),
+        computed in a single sweep. Returns a list of (b,2l+1,2l+1) dimensional complex tensors.
+        """
+        assert isinstance(R,torch.Tensor) and R.dim()==3
+        return [D.to(R.device) for D in gb.SO3irrep.matrices_all(L,R.detach().to('cpu',torch.float32).contiguous())]
+
+    @staticmethod
+    def littled_all(L,beta):
+        """
+        The Wigner little-d matrices d^0,...,d^L at each of the angles in the one dimensional tensor beta.
+        Returns a list of (n,2l+1,2l+1) dimensional real tensors.
+        """
+        assert isinstance(beta,torch.Tensor) and beta.dim()==1
+        return [d.to(beta.device) for d in gb.SO3irrep.littled_all(L,beta.detach().to('cpu',torch.float32).contiguous())]
+
 
 
     # ---- I/O ----------------------------------------------------------------------------------------------
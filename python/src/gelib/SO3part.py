@@ -12,6 +12,7 @@
 import torch
 import gelib_base as gb
 from gelib import *
+import gelib.ops as ops
 
 
 # ----------------------------------------------------------------------------------------------------------
@@ -57,9 +58,7 @@ class SO3part(torch.Tensor):
         Return the spherical harmonics of the vectors in the tensor (x,y,z)
         """
         assert(X.dim()==3)
-        R = SO3part.zeros(X.size(0),l,X.size(2),device=device)
-        R.backend().add_spharm(X)
-        return R
+        return SO3part(SO3part_SpharmFn.apply([l],X)[0].to(device))
 
     @classmethod
     def Fzeros(self,b,l,device='cpu'):
@@ -130,11 +129,22 @@ class SO3part(torch.Tensor):
 
 
     def apply(self, R):
+        """
+        Apply the rotation R to this SO3part. R can be an SO3element or a tensor of dimensions (b,3,3)
+        giving a separate rotation for each batch entry.
+        """
+        if isinstance(R,torch.Tensor) and R.dim()==3:
+            return self._apply_matrices(SO3irrep(self.getl()).matrices(R))
         assert(isinstance(R,SO3element))
         rho=SO3irrep(self.getl())
         return SO3part(torch.matmul(rho.matrix(R),self))
 
 
+    def _apply_matrices(self, D):
+        assert self.size(0)==D.size(0) or self.size(0)==1
+        return SO3part(torch.matmul(D,self))
+
+
     # ---- Products -----------------------------------------------------------------------------------------
 
 
@@ -147,6 +157,8 @@ class SO3part(torch.Tensor):
         """
         assert isinstance(y,SO3part)
         assert isinstance(l,int)
+        if ops.has_custom_ops:
+            return SO3part(ops.SO3part_CGproduct(self,y,l,False))
         return SO3part_CGproductFn.apply(self,y,l)
 
     def DiagCGproduct(self, y, l):
@@ -155,6 +167,8 @@ class SO3part(torch.Tensor):
         """
         assert isinstance(y,SO3part)
         assert isinstance(l,int)
+        if ops.has_custom_ops:
+            return SO3part(ops.SO3part_CGproduct(self,y,l,True))
         return SO3part_DiagCGproductFn.apply(self,y,l)
 
 
@@ -189,10 +203,14 @@ class SO3part_CGproductFn(torch.autograd.Function):
     def backward(ctx,g):
         x,y = ctx.saved_tensors
         #g=SO3part(_g)
-        xg=x.zeros_like()
-        yg=y.zeros_like()
-        gb.SO3part.view(xg).add_CGproduct_back0(gb.SO3part.view(g),gb.SO3part.view(y))
-        gb.SO3part.view(yg).add_CGproduct_back1(gb.SO3part.view(g),gb.SO3part.view(x))
+        xg=x.zeros_like() if ctx.needs_input_grad[0] else None
+        yg=y.zeros_like() if ctx.needs_input_grad[1] else None
+        if xg is not None and yg is not None:
+            gb.SO3part.view(g).add_CGproduct_back01(gb.SO3part.view(xg),gb.SO3part.view(yg),gb.SO3part.view(x),gb.SO3part.view(y))
+        elif xg is not None:
+            gb.SO3part.view(xg).add_CGproduct_back0(gb.SO3part.view(g),gb.SO3part.view(y))
+        elif yg is not None:
+            gb.SO3part.view(yg).add_CGproduct_back1(gb.SO3part.view(g),gb.SO3part.view(x))
         return xg,yg,None
 
 
@@ -213,13 +231,54 @@ class SO3part_DiagCGproductFn(torch.autograd.Function):
     @staticmethod
     def backward(ctx,g):
         x,y = ctx.saved_tensors
-        xg=x.zeros_like()
-        yg=y.zeros_like()
-        gb.SO3part.view(xg).add_DiagCGproduct_back0(gb.SO3part.view(g),gb.SO3part.view(y))
-        gb.SO3part.view(yg).add_DiagCGproduct_back1(gb.SO3part.view(g),gb.SO3part.view(x))
+        xg=x.zeros_like() if ctx.needs_input_grad[0] else None
+        yg=y.zeros_like() if ctx.needs_input_grad[1] else None
+        if xg is not None and yg is not None:
+            gb.SO3part.view(g).add_DiagCGproduct_back01(gb.SO3part.view(xg),gb.SO3part.view(yg),gb.SO3part.view(x),gb.SO3part.view(y))
+        elif xg is not None:
+            gb.SO3part.view(xg).add_DiagCGproduct_back0(gb.SO3part.view(g),gb.SO3part.view(y))
+        elif yg is not None:
+            gb.SO3part.view(yg).add_DiagCGproduct_back1(gb.SO3part.view(g),gb.SO3part.view(x))
         return xg,yg,None
 
 
+class SO3part_SpharmFn(torch.autograd.Function):
+    """
+    The spherical harmonics Y_l for each l in ls of the vectors stored in the columns of the 
+    (b,a1,...,ak,3,n) tensor X. The gradient with respect to X is computed analytically for all l 
+    in a single pass. If a gelib_base.SO3radialBasis of K functions is given, each vector v gives 
+    K channels R_k(|v|)Y_l(v/|v|).
+    """
+
+    @staticmethod
+    def forward(ctx,ls,X,radial=None):
+        _X=X.detach().to('cpu',torch.float32).contiguous()
+        ctx.radial=radial
+        ctx.save_for_backward(X)
+        dims=list(X.size()[:-2])
+        n=X.size(-1) if radial is None else X.size(-1)*radial.n
+        parts=[torch.zeros(dims+[2*l+1,n],dtype=torch.complex64) for l in ls]
+        if radial is None:
+            gb.SO3vec.view(parts).add_spharm(_X)
+        else:
+            gb.SO3vec.view(parts).add_spharm(_X,radial)
+        return tuple([p.to(X.device) for p in parts])
+
+    @staticmethod
+    def backward(ctx,*g):
+        X,=ctx.saved_tensors
+        _X=X.detach().to('cpu',torch.float32).contiguous()
+        g=[p for p in g if p is not None]
+        xg=torch.zeros_like(_X)
+        if len(g)>0:
+            _g=gb.SO3vec.view([p.to('cpu').contiguous() for p in g])
+            if ctx.radial is None:
+                _g.add_spharm_back(xg,_X)
+            else:
+                _g.add_spharm_back(xg,_X,ctx.radial)
+        return None,xg.to(X.device,X.dtype),None
+
+
 # ----------------------------------------------------------------------------------------------------------
 # ---- Other functions --------------------------------------------------------------------------------------
 # ----------------------------------------------------------------------------------------------------------
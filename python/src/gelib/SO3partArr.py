@@ -13,6 +13,7 @@ import torch
 import gelib_base as gb
 import gelib
 from gelib import *
+import gelib.ops as ops
 
 
 class SO3partArr(torch.Tensor):
@@ -62,9 +63,7 @@ class SO3partArr(torch.Tensor):
         Return the spherical harmonics of the vector (x,y,z)
         """
         assert(X.size(-2)==3)
-        R=SO3partArr.zeros(X.size(0),list(X.size())[1:X.dim()-2],l,X.size(-1),device='cpu')
-        R.backend().add_spharm(X)
-        return R.to(device)
+        return SO3partArr(SO3part_SpharmFn.apply([l],X)[0].to(device))
 
 
     @staticmethod
@@ -135,16 +134,36 @@ class SO3partArr(torch.Tensor):
         return torch.Tensor(torch.sum(torch.mul(torch.view_as_real(self),torch.view_as_real(y))))
 
     def apply(self, R):
+        """
+        Apply the rotation R to this SO3partArr. R can be an SO3element or a tensor of dimensions (b,3,3)
+        giving a separate rotation for each batch entry.
+        """
+        if isinstance(R,torch.Tensor) and R.dim()==3:
+            return self._apply_matrices(SO3irrep(self.getl()).matrices(R))
         assert(isinstance(R,SO3element))
         rho=SO3irrep(self.getl())
         return SO3partArr(torch.matmul(rho.matrix(R),self.collapse()).reshape(self.size()))
 
+    def _apply_matrices(self, D):
+        assert self.size(0)==D.size(0) or self.size(0)==1
+        D=D.reshape([D.size(0)]+[1]*self.get_nadims()+list(D.size()[1:]))
+        return SO3partArr(torch.matmul(D,self))
+
     def gather(self,gmap,dim=0):
         """
         Gather the cells of this SO3partArr into a new SO3partArr according to the gather_map
         """
         return SO3partArr_GatherFn.apply(self,gmap,dim)
 
+    def scatter_reduce(self,gmap,dim=0,reduce='sum'):
+        """
+        Reduce the cells of this SO3partArr along array dimension dim into the targets of gmap. Cell t of 
+        the result is the sum or the mean of the cells in the list of t, or, if reduce=='max_norm', 
+        separately for each channel, the one of largest norm. 
+        """
+        assert reduce in ['sum','mean','max_norm']
+        return SO3partArr_ScatterReduceFn.apply(self,gmap_backend(gmap),dim,reduce)
+
 #     def conterpolate(self,M):
 #         return SO3partArr_ConterpolateFn.apply(self,M)
 
@@ -159,6 +178,8 @@ class SO3partArr(torch.Tensor):
         """
         Compute the l component of the Clesbsch--Gordan product of this SO3partArr with another SO3partArr y.
         """
+        if ops.has_custom_ops:
+            return SO3partArr(ops.SO3part_CGproduct(self,y,l,False))
         return gelib.SO3partArr_CGproductFn.apply(self,y,l)
 
 
@@ -166,8 +187,24 @@ class SO3partArr(torch.Tensor):
         """
         Compute the l component of the diagonal Clesbsch--Gordan product of this SO3partArr with another SO3partArr y.
         """
+        if ops.has_custom_ops:
+            return SO3partArr(ops.SO3part_CGproduct(self,y,l,True))
         return gelib.SO3partArr_DiagCGproductFn.apply(self,y,l)
 
+    def gather_CGproduct(self,y,gmap,l):
+        """
+        Compute the l component of the CG-product of the gathered cells of this SO3partArr with the cells
+        of y, i.e., self.gather(gmap).CGproduct(y,l), without forming the gathered SO3partArr.
+        """
+        return SO3partArr_GatherCGproductFn.apply(self,y,gmap_backend(gmap),l,False)
+
+    def gather_DiagCGproduct(self,y,gmap,l):
+        """
+        Compute the l component of the diagonal CG-product of the gathered cells of this SO3partArr 
+        with the cells of y without forming the gathered SO3partArr.
+        """
+        return SO3partArr_GatherCGproductFn.apply(self,y,gmap_backend(gmap),l,True)
+
 
     ## ---- I/O ----------------------------------------------------------------------------------------------
 
@@ -202,10 +239,14 @@ class SO3partArr_CGproductFn(torch.autograd.Function):
     def backward(ctx,g):
         x,y = ctx.saved_tensors
         #g=SO3part(_g)
-        xg=x.zeros_like()
-        yg=y.zeros_like()
-        gb.SO3part.view(xg).add_CGproduct_back0(gb.SO3part.view(g),gb.SO3part.view(y))
-        gb.SO3part.view(yg).add_CGproduct_back1(gb.SO3part.view(g),gb.SO3part.view(x))
+        xg=x.zeros_like() if ctx.needs_input_grad[0] else None
+        yg=y.zeros_like() if ctx.needs_input_grad[1] else None
+        if xg is not None and yg is not None:
+            gb.SO3part.view(g).add_CGproduct_back01(gb.SO3part.view(xg),gb.SO3part.view(yg),gb.SO3part.view(x),gb.SO3part.view(y))
+        elif xg is not None:
+            gb.SO3part.view(xg).add_CGproduct_back0(gb.SO3part.view(g),gb.SO3part.view(y))
+        elif yg is not None:
+            gb.SO3part.view(yg).add_CGproduct_back1(gb.SO3part.view(g),gb.SO3part.view(x))
         return xg,yg,None
 
 
@@ -227,13 +268,52 @@ class SO3partArr_DiagCGproductFn(torch.autograd.Function):
     @staticmethod
     def backward(ctx,g):
         x,y = ctx.saved_tensors
-        xg=x.zeros_like()
-        yg=y.zeros_like()
-        gb.SO3part.view(xg).add_DiagCGproduct_back0(gb.SO3part.view(g),gb.SO3part.view(y))
-        gb.SO3part.view(yg).add_DiagCGproduct_back1(gb.SO3part.view(g),gb.SO3part.view(x))
+        xg=x.zeros_like() if ctx.needs_input_grad[0] else None
+        yg=y.zeros_like() if ctx.needs_input_grad[1] else None
+        if xg is not None and yg is not None:
+            gb.SO3part.view(g).add_DiagCGproduct_back01(gb.SO3part.view(xg),gb.SO3part.view(yg),gb.SO3part.view(x),gb.SO3part.view(y))
+        elif xg is not None:
+            gb.SO3part.view(xg).add_DiagCGproduct_back0(gb.SO3part.view(g),gb.SO3part.view(y))
+        elif yg is not None:
+            gb.SO3part.view(yg).add_DiagCGproduct_back1(gb.SO3part.view(g),gb.SO3part.view(x))
         return xg,yg,None
 
 
+class SO3partArr_GatherCGproductFn(torch.autograd.Function):
+
+    @staticmethod
+    def forward(ctx,x,y,gmap,l,diag):
+        ctx.gmap=gmap
+        ctx.diag=diag
+        ctx.save_for_backward(x,y)
+        b=common_batch(x,y)
+        n=x.size(-1) if diag else x.size(-1)*y.size(-1)
+        r=SO3partArr.zeros(b,y.get_adims(),l,n,device=x.device)
+        if diag:
+            gb.SO3part.view(r).add_DiagCGproduct_gather(gb.SO3part.view(x),gb.SO3part.view(y),gmap)
+        else:
+            gb.SO3part.view(r).add_CGproduct_gather(gb.SO3part.view(x),gb.SO3part.view(y),gmap)
+        return r
+
+    @staticmethod
+    def backward(ctx,g):
+        x,y = ctx.saved_tensors
+        g=gb.SO3part.view(g.contiguous())
+        xg=torch.zeros_like(x) if ctx.needs_input_grad[0] else None
+        yg=torch.zeros_like(y) if ctx.needs_input_grad[1] else None
+        if xg is not None:
+            if ctx.diag:
+                gb.SO3part.view(xg).add_DiagCGproduct_gather_back0(g,gb.SO3part.view(y),ctx.gmap)
+            else:
+                gb.SO3part.view(xg).add_CGproduct_gather_back0(g,gb.SO3part.view(y),ctx.gmap)
+        if yg is not None:
+            if ctx.diag:
+                gb.SO3part.view(yg).add_DiagCGproduct_gather_back1(g,gb.SO3part.view(x),ctx.gmap)
+            else:
+                gb.SO3part.view(yg).add_CGproduct_gather_back1(g,gb.SO3part.view(x),ctx.gmap)
+        return xg,yg,None,None,None
+
+
 class SO3partArr_GatherFn(torch.autograd.Function): 
 
     @staticmethod
@@ -254,6 +334,37 @@ class SO3partArr_GatherFn(torch.autograd.Function):
         return xg,None,None
 
 
+class SO3partArr_ScatterReduceFn(torch.autograd.Function): 
+
+    @staticmethod
+    def forward(ctx,x,gmap,d,reduce):
+        ctx.gmap=gmap
+        ctx.d=d
+        ctx.reduce=reduce
+        ctx.adims=x.get_adims()
+        adims=list(ctx.adims)
+        adims[d]=gmap.n_out
+        r=SO3partArr.zeros(x.getb(),adims,x.getl(),x.getn(),device=x.device)
+        if reduce=='max_norm':
+            argmax=torch.full([x.getb()]+adims+[x.getn()],-1,dtype=torch.int32)
+            gb.SO3part.view(r).add_segment_max_norm(gb.SO3part.view(x),gmap,d,argmax)
+            ctx.save_for_backward(argmax)
+        else:
+            gb.SO3part.view(r).add_segment_sum(gb.SO3part.view(x),gmap,d,reduce=='mean')
+        return r
+
+    @staticmethod
+    def backward(ctx,g):
+        xg=SO3partArr.zeros(g.size(0),ctx.adims,(g.size(-2)-1)//2,g.size(-1),device=g.device)
+        g=gb.SO3part.view(g.contiguous())
+        if ctx.reduce=='max_norm':
+            argmax,=ctx.saved_tensors
+            gb.SO3part.view(xg).add_segment_max_norm_back(g,ctx.gmap,ctx.d,argmax)
+        else:
+            gb.SO3part.view(xg).add_segment_sum_back(g,ctx.gmap,ctx.d,ctx.reduce=='mean')
+        return xg,None,None,None
+
+
 class SO3partArr_ConterpolateFn(torch.autograd.Function): 
 
     @staticmethod
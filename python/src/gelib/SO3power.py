@@ -0,0 +1,104 @@
+# This file is part of GElib, a C++/CUDA library for group
+# equivariant tensor operations.
+#
+# Copyright (c) 2025, Imre Risi Kondor
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import functools
+import torch
+import gelib_base as gb
+from gelib.gelib_common import zero_grads
+
+
+# ----------------------------------------------------------------------------------------------------------
+# ---- SO3CGpower ------------------------------------------------------------------------------------------
+# ----------------------------------------------------------------------------------------------------------
+
+
+class SO3CGpower:
+    """
+    Precomputed plan for the symmetric power of order nu of SO3vecs or SO3vecArrs of type tau, i.e., the
+    iterated CG-product (((x*x)*x)...*x) with all factors taken from the same channel of x. Instead of
+    materializing the intermediate products, the generalized coupling coefficients of every path
+    (l_1<=...<=l_nu, L_2,...,L_nu=l) are precomputed from the CG coefficients, and terms that only differ
+    by a permutation of the factors are merged, so each distinct monomial is evaluated only once.
+    All parts of tau must have the same multiplicity n, and part l of the result has n channels for each
+    path ending in l, in the order given by get_paths().
+    >>> P = gelib.SO3CGpower({0:8,1:8,2:8},3,maxl=2)
+    >>> z = P(x)
+    """
+
+    def __init__(self, tau, nu, maxl=-1):
+        if maxl is None:
+            maxl=-1
+        self.tau_x=dict(tau)
+        self.nu=nu
+        self.maxl=maxl
+        self.obj=gb.SO3CGpower(gb.SO3type(self.tau_x),nu,maxl)
+        self.tau=self.obj.get_tau().get_parts()
+
+    @classmethod
+    def get(cls, tau, nu, maxl=-1):
+        "Return a cached plan for the given type, order and maxl. The cache holds the 64 most recently used plans."
+        return _cached_plan(cls,tuple(sorted(tau.items())),nu,maxl)
+
+    def __call__(self, x):
+        return x.symmetric_power(self)
+
+    def apply_to_parts(self, parts):
+        if {l:p.size(-1) for l,p in parts.items()}!=self.tau_x:
+            raise ValueError("SO3CGpower: the type of the argument does not match the type of the plan.")
+        return list(SO3CGpowerFn.apply(self,*parts.values()))
+
+    def npaths(self):
+        return self.obj.npaths()
+
+    def get_paths(self):
+        "The list of (l_1,...,l_nu),(L_2,...,L_nu) pairs of the paths."
+        return [(tuple(ls),tuple(Ls)) for ls,Ls in self.obj.get_paths()]
+
+
+    # ---- I/O ----------------------------------------------------------------------------------------------
+
+
+    def __repr__(self):
+        return self.obj.__repr__()
+
+    def __str__(self):
+        return self.obj.__str__()
+
+
+@functools.lru_cache(maxsize=64)
+def _cached_plan(cls, tau, nu, maxl):
+    return cls(dict(tau),nu,maxl)
+
+
+# ----------------------------------------------------------------------------------------------------------
+# ---- Autograd functions -----------------------------------------------------------------------------------
+# ----------------------------------------------------------------------------------------------------------
+
+
+class SO3CGpowerFn(torch.autograd.Function):
+
+    @staticmethod
+    def forward(ctx, plan, *args):
+        ctx.plan=plan
+        ctx.save_for_backward(*args)
+
+        adims=list(args[0].size()[:-2])
+        rparts=[torch.zeros(adims+[2*l+1,n],dtype=torch.cfloat,device=args[0].device) for l,n in plan.tau.items()]
+        plan.obj.add(gb.SO3vec.view(rparts),gb.SO3vec.view(args))
+        return tuple(rparts)
+
+    @staticmethod
+    def backward(ctx, *args):
+        saved=ctx.saved_tensors
+        grads=zero_grads(ctx.needs_input_grad[1:],saved)
+        if grads is None:
+            return tuple([None]*(1+len(saved)))
+        x=gb.SO3vec.view(saved)
+        ctx.plan.obj.add_back(gb.SO3vec.view(grads),gb.SO3vec.view(args),x)
+        return tuple([None]+[g if needed else None for g,needed in zip(grads,ctx.needs_input_grad[1:])])
@@ -12,6 +12,7 @@
 import torch
 import gelib_base as gb
 from gelib import *
+import gelib.ops as ops
 
 
 # ----------------------------------------------------------------------------------------------------------
@@ -27,6 +28,7 @@ class SO3vec:
 
     def __init__(self,*args):
         self.parts={}
+        self.buffer=None
         if not args:
             return
         for x in args:
@@ -98,13 +100,24 @@ class SO3vec:
         return R
 
     @classmethod
-    def spharm(self,l,X,device='cpu'):
+    def spharm(self,L,X,device='cpu'):
         """
-        Return the spherical harmonics of the vectors in the tensor X
+        Return the spherical harmonics Y_0,...,Y_L of the vectors stored in the columns of the (b,3,n) tensor X
+        as an SO3vec of type {0:n,...,L:n}. All the l's are computed in a single pass.
+        """
+        assert(X.dim()==3 and X.size(1)==3)
+        return SO3vec(*[SO3part(p.to(device)) for p in SO3part_SpharmFn.apply(list(range(L+1)),X)])
+
+    @classmethod
+    def from_packed(self,buf,tau):
+        """
+        Construct an SO3vec of type tau whose parts are zero-copy views into the single packed buffer buf
+        of size [b,P]. Part l occupies (2l+1)*tau[l] consecutive columns of buf.
         """
-        assert(X.dim()==3)
         R=SO3vec()
-        R.parts[l]=SO3part.spharm(b,l,X,device=device)
+        R.buffer=buf
+        for l,p in packed_views(buf,tau).items():
+            R.parts[l]=SO3part(p)
         return R
 
     @classmethod
@@ -122,6 +135,8 @@ class SO3vec:
         return R
 
     def backend(self):
+        if self.is_packed():
+            return gb.SO3vec.view_packed(self.buffer,gb.SO3type(self.tau()))
         return gb.SO3vec.view(self.parts)
 
 
@@ -146,29 +161,73 @@ class SO3vec:
         return r
 
     def requires_grad_(self):
+        if self.is_packed():
+            tau=self.tau()
+            self.buffer.requires_grad_()
+            for l,p in packed_views(self.buffer,tau).items():
+                self.parts[l]=SO3part(p)
+            return
         for l,p in self.parts.items():
             p.requires_grad_()
 
     def get_grad(self):
+        if self.is_packed():
+            return SO3vec.from_packed(self.buffer.grad,self.tau())
         return SO3vec(*[p.grad for l,p in self.parts.items()])
 
 
+    # ---- Packed storage -----------------------------------------------------------------------------------
+
+
+    def is_packed(self):
+        "True if all the parts of this SO3vec are views into a single packed buffer."
+        return self.buffer is not None
+
+    def pack(self):
+        """
+        Return an SO3vec with the same contents whose parts are views into a single contiguous buffer.
+        If this SO3vec is already packed it is returned as is, otherwise the parts are copied once.
+        """
+        if self.is_packed():
+            return self
+        return SO3vec.from_packed(pack_parts(self.parts),self.tau())
+
+    def unpack(self):
+        "Return an SO3vec holding the same parts as separate tensors (no copying)."
+        R=SO3vec()
+        R.parts=dict(self.parts)
+        return R
+
+
     # ---- Operations ---------------------------------------------------------------------------------------
 
 
     def apply(self, R):
-        "Apply the group element to this vector"
+        "Apply the group element, or a (b,3,3) tensor of per-batch rotations, to this vector"
         r = SO3vec()
+        if isinstance(R,torch.Tensor) and R.dim()==3:
+            D=SO3irrep.matrices_all(max(self.parts.keys()),R)
+            for l,p in self.parts.items():
+                r.parts[l]=p._apply_matrices(D[l])
+            return r
         for l,p in self.parts.items():
             r.parts[l]=p.apply(R)
         return r
 
     def odot(self,y):
         assert(list(self.parts.keys())==list(y.parts.keys()))
+        if self.is_packed() and y.is_packed():
+            return torch.sum(torch.mul(torch.view_as_real(self.buffer),torch.view_as_real(y.buffer)))
         return sum([self.parts[l].odot(y.parts[l]) for l in self.parts.keys()])
 
+    def linear(self,W):
+        "Mix the channels of each part of this SO3vec by the weight matrices of the SO3weights object W."
+        return SO3vec(*[SO3part(p) for p in W.apply_to_parts(self.parts)])
+
     def __add__(self,y):
         assert(list(self.parts.keys())==list(y.parts.keys()))
+        if self.is_packed() and y.is_packed():
+            return SO3vec.from_packed(self.buffer+y.buffer,self.tau())
         return SO3vec(*[self.parts[l]+y.parts[l] for l in self.parts.keys()])
 
         
@@ -179,8 +238,12 @@ class SO3vec:
         """
         Compute the full Clesbsch--Gordan product of this SO3vec with another SO3vec y.
         """
+        if self.is_packed() and y.is_packed():
+            return packed_CGproduct(self,y,maxl,False)
         xparts=list(self.parts.values())
         yparts=list(y.parts.values())
+        if ops.has_custom_ops:
+            return SO3vec(*ops.SO3vec_CGproduct(xparts,yparts,list(self.parts.keys()),list(y.parts.keys()),maxl,False))
         rparts =list(SO3vec_CGproductFn.apply(len(xparts), len(yparts), maxl,*(xparts+yparts)))
         return SO3vec(*rparts)
 
@@ -188,11 +251,38 @@ class SO3vec:
         """
         Compute the diagonal Clesbsch--Gordan product of this SO3vec with another SO3vec y.
         """
+        if self.is_packed() and y.is_packed():
+            return packed_CGproduct(self,y,maxl,True)
         xparts=list(self.parts.values())
         yparts=list(y.parts.values())
+        if ops.has_custom_ops:
+            return SO3vec(*ops.SO3vec_CGproduct(xparts,yparts,list(self.parts.keys()),list(y.parts.keys()),maxl,True))
         rparts =list(SO3vec_DiagCGproductFn.apply(len(xparts), len(yparts), maxl,*(xparts+yparts)))
         return SO3vec(*rparts)
 
+    def weighted_CGproduct(self, y, W):
+        """
+        Compute the fully connected weighted CG-product of this SO3vec with y, using the weights in the
+        SO3CGweights object W. The outer product channels of the CG-product are never formed.
+        """
+        return SO3vec(*[SO3part(p) for p in W.apply_to_parts(self.parts,y.parts)])
+
+    def weighted_DiagCGproduct(self, y, W):
+        """
+        Compute the diagonal CG-product of this SO3vec with y, with the channels of each path multiplied
+        by the corresponding weights in the SO3DiagCGweights object W.
+        """
+        return SO3vec(*[SO3part(p) for p in W.apply_to_parts(self.parts,y.parts)])
+
+    def symmetric_power(self, nu, maxl=-1):
+        """
+        Compute the symmetric power of order nu of this SO3vec, i.e., the iterated CG-product of nu copies of
+        it taken channel by channel, computed in a single step with the SO3CGpower plan for its type.
+        nu may also be a precomputed SO3CGpower object.
+        """
+        P=nu if isinstance(nu,SO3CGpower) else SO3CGpower.get(self.tau(),nu,maxl)
+        return SO3vec(*[SO3part(p) for p in P.apply_to_parts(self.parts)])
+
 
     # ---- I/O ----------------------------------------------------------------------------------------------
 
@@ -235,17 +325,16 @@ class SO3vec_CGproductFn(torch.autograd.Function):
 
         k1 = ctx.k1
         k2 = ctx.k2
-        grads=[torch.zeros_like(x) for x in ctx.saved_tensors]
+        saved=ctx.saved_tensors
+        xgrads=zero_grads(ctx.needs_input_grad[3:3+k1],saved[0:k1])
+        ygrads=zero_grads(ctx.needs_input_grad[3+k1:3+k1+k2],saved[k1:k1+k2])
 
-        x=gb.SO3vec.view(ctx.saved_tensors[0:k1])
-        y=gb.SO3vec.view(ctx.saved_tensors[k1:k1+k2])
+        x=gb.SO3vec.view(saved[0:k1])
+        y=gb.SO3vec.view(saved[k1:k1+k2])
         g=gb.SO3vec.view(args)
-        xg=gb.SO3vec.view(grads[0:k1])
-        yg=gb.SO3vec.view(grads[k1:k1+k2])
-        xg.addCGproduct_back0(g,y)
-        yg.addCGproduct_back1(g,x)
+        g.addCGproduct_back01(gb.SO3vec.view(xgrads or []),gb.SO3vec.view(ygrads or []),x,y)
 
-        return tuple([None,None,None]+grads)
+        return tuple([None,None,None]+(xgrads or [None]*k1)+(ygrads or [None]*k2))
 
 
 class SO3vec_DiagCGproductFn(torch.autograd.Function):
@@ -274,17 +363,69 @@ class SO3vec_DiagCGproductFn(torch.autograd.Function):
 
         k1 = ctx.k1
         k2 = ctx.k2
-        grads=[torch.zeros_like(x) for x in ctx.saved_tensors]
+        saved=ctx.saved_tensors
+        xgrads=zero_grads(ctx.needs_input_grad[3:3+k1],saved[0:k1])
+        ygrads=zero_grads(ctx.needs_input_grad[3+k1:3+k1+k2],saved[k1:k1+k2])
 
-        x=gb.SO3vec.view(ctx.saved_tensors[0:k1])
-        y=gb.SO3vec.view(ctx.saved_tensors[k1:k1+k2])
+        x=gb.SO3vec.view(saved[0:k1])
+        y=gb.SO3vec.view(saved[k1:k1+k2])
         g=gb.SO3vec.view(args)
-        xg=gb.SO3vec.view(grads[0:k1])
-        yg=gb.SO3vec.view(grads[k1:k1+k2])
-        xg.addDiagCGproduct_back0(g,y)
-        yg.addDiagCGproduct_back1(g,x)
+        g.addDiagCGproduct_back01(gb.SO3vec.view(xgrads or []),gb.SO3vec.view(ygrads or []),x,y)
+
+        return tuple([None,None,None]+(xgrads or [None]*k1)+(ygrads or [None]*k2))
+
 
-        return tuple([None,None,None]+grads)
+class SO3vec_PackedCGproductFn(torch.autograd.Function):
+
+    @staticmethod
+    def forward(ctx, tau_x, tau_y, tau, diag, x, y):
+        ctx.tau_x = tau_x
+        ctx.tau_y = tau_y
+        ctx.tau = tau
+        ctx.diag = diag
+        ctx.save_for_backward(x,y)
+
+        b=common_batch(x,y)
+        r=torch.zeros([b]+list(x.size()[1:-1])+[packed_size(tau)],dtype=torch.complex64,device=x.device)
+        _x=gb.SO3vec.view_packed(x,gb.SO3type(tau_x))
+        _y=gb.SO3vec.view_packed(y,gb.SO3type(tau_y))
+        _r=gb.SO3vec.view_packed(r,gb.SO3type(tau))
+        if diag:
+            _r.addDiagCGproduct(_x,_y)
+        else:
+            _r.addCGproduct(_x,_y)
+        return r
+
+    @staticmethod
+    def backward(ctx, g):
+        x,y=ctx.saved_tensors
+        xg=torch.zeros_like(x) if ctx.needs_input_grad[4] else None
+        yg=torch.zeros_like(y) if ctx.needs_input_grad[5] else None
+        _x=gb.SO3vec.view_packed(x,gb.SO3type(ctx.tau_x))
+        _y=gb.SO3vec.view_packed(y,gb.SO3type(ctx.tau_y))
+        _g=gb.SO3vec.view_packed(g.contiguous(),gb.SO3type(ctx.tau))
+        _xg=gb.SO3vec.view_packed(xg,gb.SO3type(ctx.tau_x)) if xg is not None else gb.SO3vec.view([])
+        _yg=gb.SO3vec.view_packed(yg,gb.SO3type(ctx.tau_y)) if yg is not None else gb.SO3vec.view([])
+        if ctx.diag:
+            _g.addDiagCGproduct_back01(_xg,_yg,_x,_y)
+        else:
+            _g.addCGproduct_back01(_xg,_yg,_x,_y)
+        return None,None,None,None,xg,yg
+
+
+def packed_CGproduct(x, y, maxl, diag):
+    """
+    CG-product of two packed SO3vecs or SO3vecArrs, computed directly on the packed buffers with
+    a single autograd node. The result is packed as well.
+    """
+    tau_x=x.tau()
+    tau_y=y.tau()
+    if diag:
+        tau=gb.SO3type(tau_x).DiagCGproduct(gb.SO3type(tau_y),maxl).get_parts()
+    else:
+        tau=gb.SO3type(tau_x).CGproduct(gb.SO3type(tau_y),maxl).get_parts()
+    r=SO3vec_PackedCGproductFn.apply(tau_x,tau_y,tau,diag,x.buffer,y.buffer)
+    return type(x).from_packed(r,tau)
 
 
 class SO3vec_FproductFn(torch.autograd.Function):
@@ -12,6 +12,7 @@ import torch
 
 import gelib_base as gb
 from gelib import *
+import gelib.ops as ops
 
 
 # ----------------------------------------------------------------------------------------------------------
@@ -26,6 +27,7 @@ class SO3vecArr:
 
     def __init__(self,*args):
         self.parts : Dict[int, SO3partArr]={}
+        self.buffer=None
         if args is None:
             return
         
@@ -132,12 +134,35 @@ class SO3vecArr:
         return R
 
     @classmethod
-    def spharm(self, l : int, X : torch.Tensor, device : str = 'cpu') -> 'SO3vecArr':
+    def spharm(self, L : int, X : torch.Tensor, device : str = 'cpu') -> 'SO3vecArr':
         """
-        Return the spherical harmonics of the vector (x,y,z) for all ro <= l.
+        Return the spherical harmonics Y_0,...,Y_L of the vectors stored in the columns of the (b,a1,...,ak,3,n)
+        tensor X as an SO3vecArr of type {0:n,...,L:n}. All the l's are computed in a single pass.
+        """
+        assert(X.dim()>=4 and X.size(-2)==3)
+        return SO3vecArr(*[SO3partArr(p.to(device)) for p in SO3part_SpharmFn.apply(list(range(L+1)),X)])
+
+    @classmethod
+    def edge_embedding(self, L : int, X : torch.Tensor, radial, device : str = 'cpu') -> 'SO3vecArr':
+        """
+        Return the embedding R_k(|v|)Y_l(v/|v|), l=0,...,L of the edge vectors v stored in the (b,a1,...,ak,3) 
+        tensor X as an SO3vecArr of type {0:K,...,L:K}, where R_0,...,R_{K-1} are the functions of the 
+        SO3radialBasis radial, e.g., SO3radialBasis('bessel',8,cutoff). The radial functions, the spherical 
+        harmonics and their products are computed in a single pass, and so is the gradient with respect to X.
+        """
+        assert(X.dim()>=3 and X.size(-1)==3)
+        return SO3vecArr(*[SO3partArr(p.to(device)) for p in SO3part_SpharmFn.apply(list(range(L+1)),X.unsqueeze(-1),radial)])
+
+    @classmethod
+    def from_packed(self,buf,tau):
+        """
+        Construct an SO3vecArr of type tau whose parts are zero-copy views into the single packed buffer
+        buf of size [b,a1,...,ak,P]. Part l occupies (2l+1)*tau[l] consecutive entries of the last dimension.
         """
         R=SO3vecArr()
-        R.parts[l]=SO3partArr.spharm(l,X,device=device)
+        R.buffer=buf
+        for l,p in packed_views(buf,tau).items():
+            R.parts[l]=SO3partArr(p)
         return R
 
     @classmethod
@@ -155,6 +180,8 @@ class SO3vecArr:
         return R
 
     def backend(self):
+        if self.is_packed():
+            return gb.SO3vec.view_packed(self.buffer,gb.SO3type(self.tau()))
         return gb.SO3vec.view(self.parts)
 
 
@@ -190,10 +217,18 @@ class SO3vecArr:
         return max(self.parts.keys())
 
     def requires_grad_(self):
+        if self.is_packed():
+            tau=self.tau()
+            self.buffer.requires_grad_()
+            for l,p in packed_views(self.buffer,tau).items():
+                self.parts[l]=SO3partArr(p)
+            return
         for l,p in self.parts.items():
             p.requires_grad_()
 
     def get_grad(self):
+        if self.is_packed():
+            return SO3vecArr.from_packed(self.buffer.grad,self.tau())
         return SO3vecArr(*[p.grad for l,p in self.parts.items()])
 
     def l_max(self) -> int:
@@ -202,22 +237,58 @@ class SO3vecArr:
         return max(self.parts.keys())
 
 
+    # ---- Packed storage -----------------------------------------------------------------------------------
+
+
+    def is_packed(self):
+        "True if all the parts of this SO3vecArr are views into a single packed buffer."
+        return self.buffer is not None
+
+    def pack(self):
+        """
+        Return an SO3vecArr with the same contents whose parts are views into a single contiguous buffer.
+        If this SO3vecArr is already packed it is returned as is, otherwise the parts are copied once.
+        """
+        if self.is_packed():
+            return self
+        return SO3vecArr.from_packed(pack_parts(self.parts),self.tau())
+
+    def unpack(self):
+        "Return an SO3vecArr holding the same parts as separate tensors (no copying)."
+        R=SO3vecArr()
+        R.parts=dict(self.parts)
+        return R
+
+
     # ---- Operations ---------------------------------------------------------------------------------------
 
 
     def apply(self, R):
-        "Apply the group element to this vector"
+        "Apply the group element, or a (b,3,3) tensor of per-batch rotations, to this vector"
         r = SO3vecArr()
+        if isinstance(R,torch.Tensor) and R.dim()==3:
+            D=SO3irrep.matrices_all(max(self.parts.keys()),R)
+            for l,p in self.parts.items():
+                r.parts[l]=p._apply_matrices(D[l])
+            return r
         for l,p in self.parts.items():
             r.parts[l]=p.apply(R)
         return r
 
     def odot(self,y):
         assert(list(self.parts.keys())==list(y.parts.keys()))
+        if self.is_packed() and y.is_packed():
+            return torch.sum(torch.mul(torch.view_as_real(self.buffer),torch.view_as_real(y.buffer)))
         return sum([self.parts[l].odot(y.parts[l]) for l in self.parts.keys()])
 
+    def linear(self,W):
+        "Mix the channels of each part of this SO3vecArr by the weight matrices of the SO3weights object W."
+        return SO3vecArr(*[SO3partArr(p) for p in W.apply_to_parts(self.parts)])
+
     def __add__(self,y):
         assert(list(self.parts.keys())==list(y.parts.keys()))
+        if self.is_packed() and y.is_packed():
+            return SO3vecArr.from_packed(self.buffer+y.buffer,self.tau())
         return SO3vecArr(*[self.parts[l]+y.parts[l] for l in self.parts.keys()])
 
     def gather(self,gmap,dim=0):
@@ -226,6 +297,13 @@ class SO3vecArr:
         """
         return SO3vecArr(*[p.gather(gmap,dim) for p in self.parts.values])
 
+    def scatter_reduce(self,gmap,dim=0,reduce='sum'):
+        """
+        Reduce the cells of this SO3vecArr along array dimension dim into the targets of gmap, one part at a time. 
+        See SO3partArr.scatter_reduce.
+        """
+        return SO3vecArr(*[SO3partArr(p).scatter_reduce(gmap,dim,reduce) for p in self.parts.values()])
+
         
     # ---- Products -----------------------------------------------------------------------------------------
 
@@ -238,9 +316,13 @@ class SO3vecArr:
         assert isinstance(y, SO3vecArr)
         if maxl == None:
             maxl = -1
+        if self.is_packed() and y.is_packed():
+            return packed_CGproduct(self,y,maxl,False)
 
         xparts=list(self.parts.values())
         yparts=list(y.parts.values())
+        if ops.has_custom_ops:
+            return SO3vecArr(*ops.SO3vec_CGproduct(xparts,yparts,list(self.parts.keys()),list(y.parts.keys()),maxl,False))
         rparts =list(SO3vecArr_CGproductFn.apply(len(xparts), len(yparts), maxl,*(xparts+yparts)))
         return SO3vecArr(*rparts)
 
@@ -251,12 +333,63 @@ class SO3vecArr:
         assert isinstance(y, SO3vecArr)
         if maxl == None:
             maxl = -1
+        if self.is_packed() and y.is_packed():
+            return packed_CGproduct(self,y,maxl,True)
 
         xparts=list(self.parts.values())
         yparts=list(y.parts.values())
+        if ops.has_custom_ops:
+            return SO3vecArr(*ops.SO3vec_CGproduct(xparts,yparts,list(self.parts.keys()),list(y.parts.keys()),maxl,True))
         rparts =list(SO3vecArr_DiagCGproductFn.apply(len(xparts), len(yparts), maxl,*(xparts+yparts)))
         return SO3vecArr(*rparts)
 
+    def weighted_CGproduct(self, y, W):
+        """
+        Compute the fully connected weighted CG-product of this SO3vecArr with y, using the weights in the
+        SO3CGweights object W. The outer product channels of the CG-product are never formed.
+        """
+        return SO3vecArr(*[SO3partArr(p) for p in W.apply_to_parts(self.parts,y.parts)])
+
+    def weighted_DiagCGproduct(self, y, W):
+        """
+        Compute the diagonal CG-product of this SO3vecArr with y, with the channels of each path multiplied
+        by the corresponding weights in the SO3DiagCGweights object W.
+        """
+        return SO3vecArr(*[SO3partArr(p) for p in W.apply_to_parts(self.parts,y.parts)])
+
+    def symmetric_power(self, nu, maxl=-1):
+        """
+        Compute the symmetric power of order nu of this SO3vecArr, i.e., the iterated CG-product of nu copies of
+        it taken channel by channel, computed in a single step with the SO3CGpower plan for its type.
+        nu may also be a precomputed SO3CGpower object.
+        """
+        P=nu if isinstance(nu,SO3CGpower) else SO3CGpower.get(self.tau(),nu,maxl)
+        return SO3vecArr(*[SO3partArr(p) for p in P.apply_to_parts(self.parts)])
+
+    def gather_CGproduct(self, y, gmap, maxl=-1):
+        """
+        Compute the full CG-product of the gathered elements of this SO3vecArr with the elements of y,
+        i.e., CGproduct(self.gather(gmap),y), without forming the gathered SO3vecArr. The first array 
+        dimension of self must be gmap's input size, and that of y its output size. 
+        """
+        return self._gather_CGproduct(y,gmap,maxl,False)
+
+    def gather_DiagCGproduct(self, y, gmap, maxl=-1):
+        """
+        Compute the diagonal CG-product of the gathered elements of this SO3vecArr with the elements of y,
+        i.e., DiagCGproduct(self.gather(gmap),y), without forming the gathered SO3vecArr.
+        """
+        return self._gather_CGproduct(y,gmap,maxl,True)
+
+    def _gather_CGproduct(self, y, gmap, maxl, diag):
+        assert isinstance(y, SO3vecArr)
+        if maxl == None:
+            maxl = -1
+        xparts=list(self.parts.values())
+        yparts=list(y.parts.values())
+        rparts=SO3vecArr_GatherCGproductFn.apply(len(xparts),len(yparts),maxl,diag,gmap_backend(gmap),*(xparts+yparts))
+        return SO3vecArr(*[SO3partArr(p) for p in rparts])
+
 
     # ---- I/O ----------------------------------------------------------------------------------------------
 
@@ -328,17 +461,16 @@ class SO3vecArr_CGproductFn(torch.autograd.Function):
 
         k1 = ctx.k1
         k2 = ctx.k2
-        grads=[torch.zeros_like(x) for x in ctx.saved_tensors]
+        saved=ctx.saved_tensors
+        xgrads=zero_grads(ctx.needs_input_grad[3:3+k1],saved[0:k1])
+        ygrads=zero_grads(ctx.needs_input_grad[3+k1:3+k1+k2],saved[k1:k1+k2])
 
-        x=gb.SO3vec.view(ctx.saved_tensors[0:k1])
-        y=gb.SO3vec.view(ctx.saved_tensors[k1:k1+k2])
+        x=gb.SO3vec.view(saved[0:k1])
+        y=gb.SO3vec.view(saved[k1:k1+k2])
         g=gb.SO3vec.view(args)
-        xg=gb.SO3vec.view(grads[0:k1])
-        yg=gb.SO3vec.view(grads[k1:k1+k2])
-        xg.addCGproduct_back0(g,y)
-        yg.addCGproduct_back1(g,x)
+        g.addCGproduct_back01(gb.SO3vec.view(xgrads or []),gb.SO3vec.view(ygrads or []),x,y)
 
-        return tuple([None,None,None]+grads)
+        return tuple([None,None,None]+(xgrads or [None]*k1)+(ygrads or [None]*k2))
 
 
 class SO3vecArr_DiagCGproductFn(torch.autograd.Function):
@@ -368,17 +500,68 @@ class SO3vecArr_DiagCGproductFn(torch.autograd.Function):
 
         k1 = ctx.k1
         k2 = ctx.k2
-        grads=[torch.zeros_like(x) for x in ctx.saved_tensors]
+        saved=ctx.saved_tensors
+        xgrads=zero_grads(ctx.needs_input_grad[3:3+k1],saved[0:k1])
+        ygrads=zero_grads(ctx.needs_input_grad[3+k1:3+k1+k2],saved[k1:k1+k2])
 
-        x=gb.SO3vec.view(ctx.saved_tensors[0:k1])
-        y=gb.SO3vec.view(ctx.saved_tensors[k1:k1+k2])
+        x=gb.SO3vec.view(saved[0:k1])
+        y=gb.SO3vec.view(saved[k1:k1+k2])
         g=gb.SO3vec.view(args)
-        xg=gb.SO3vec.view(grads[0:k1])
-        yg=gb.SO3vec.view(grads[k1:k1+k2])
-        xg.addDiagCGproduct_back0(g,y)
-        yg.addDiagCGproduct_back1(g,x)
+        g.addDiagCGproduct_back01(gb.SO3vec.view(xgrads or []),gb.SO3vec.view(ygrads or []),x,y)
+
+        return tuple([None,None,None]+(xgrads or [None]*k1)+(ygrads or [None]*k2))
+
+
+class SO3vecArr_GatherCGproductFn(torch.autograd.Function):
+
+    @staticmethod
+    def forward(ctx, k1, k2, maxl, diag, gmap, *args):
+        ctx.k1 = k1
+        ctx.k2 = k2
+        ctx.diag = diag
+        ctx.gmap = gmap
+        ctx.save_for_backward(*args)
+
+        x=gb.SO3vec.view(args[0:k1])
+        y=gb.SO3vec.view(args[k1:k1+k2])
+        b=common_batch(args[0],args[k1])
+        adims=args[k1].get_adims()
+        tau=ops.CGproduct_type(x.get_tau().get_parts(),y.get_tau().get_parts(),maxl,diag)
+        rparts=MakeZeroSO3partArrs(b,adims,tau,args[0].device)
+        r=gb.SO3vec.view(rparts)
+        if diag:
+            r.addDiagCGproduct_gather(x,y,gmap)
+        else:
+            r.addCGproduct_gather(x,y,gmap)
+
+        return tuple(rparts)
+
+    @staticmethod
+    def backward(ctx, *args):
 
-        return tuple([None,None,None]+grads)
+        k1 = ctx.k1
+        k2 = ctx.k2
+        saved=ctx.saved_tensors
+        xgrads=zero_grads(ctx.needs_input_grad[5:5+k1],saved[0:k1])
+        ygrads=zero_grads(ctx.needs_input_grad[5+k1:5+k1+k2],saved[k1:k1+k2])
+
+        x=gb.SO3vec.view(saved[0:k1])
+        y=gb.SO3vec.view(saved[k1:k1+k2])
+        g=gb.SO3vec.view([p.contiguous() for p in args])
+        if xgrads is not None:
+            xg=gb.SO3vec.view(xgrads)
+            if ctx.diag:
+                xg.addDiagCGproduct_gather_back0(g,y,ctx.gmap)
+            else:
+                xg.addCGproduct_gather_back0(g,y,ctx.gmap)
+        if ygrads is not None:
+            yg=gb.SO3vec.view(ygrads)
+            if ctx.diag:
+                yg.addDiagCGproduct_gather_back1(g,x,ctx.gmap)
+            else:
+                yg.addCGproduct_gather_back1(g,x,ctx.gmap)
+
+        return tuple([None,None,None,None,None]+(xgrads or [None]*k1)+(ygrads or [None]*k2))
 
 
 class SO3vecArr_FproductFn(torch.autograd.Function):
@@ -0,0 +1,401 @@
+# This file is part of GElib, a C++/CUDA library for group
+# equivariant tensor operations.
+#
+# Copyright (c) 2025, Imre Risi Kondor
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import torch
+import gelib_base as gb
+from gelib.gelib_common import common_batch, zero_grads
+import gelib.ops as ops
+
+
+# ----------------------------------------------------------------------------------------------------------
+# ---- SO3weights ------------------------------------------------------------------------------------------
+# ----------------------------------------------------------------------------------------------------------
+
+
+class SO3weights:
+    """
+    The weights of an equivariant linear map between SO(3)-vectors: a complex matrix W_l of size
+    tau_in[l] x tau_out[l] for each l, which mixes the channels of part l. Applying the map to an
+    SO3vec or SO3vecArr multiplies each part by its weight matrix as one GEMM, with a single autograd
+    node for all the parts.
+    """
+
+    def __init__(self,*args):
+        self.parts={}
+        if not args:
+            return
+        if len(args)==1 and isinstance(args[0],dict):
+            for l,w in sorted(args[0].items()):
+                assert isinstance(w,torch.Tensor) and w.dim()==2
+                self.parts[l]=w
+            return
+        raise ValueError("SO3weights must be constructed from a dictionary of weight matrices.")
+
+
+    # ---- Static constructors ------------------------------------------------------------------------------
+
+
+    @classmethod
+    def zeros(self,tau_in,tau_out,device='cpu'):
+        "Weights mapping SO(3)-vectors of type tau_in to type tau_out, initialized to zero."
+        assert sorted(tau_in.keys())==sorted(tau_out.keys())
+        return SO3weights({l:torch.zeros([n,tau_out[l]],dtype=torch.complex64,device=device) for l,n in tau_in.items()})
+
+    @classmethod
+    def randn(self,tau_in,tau_out,device='cpu'):
+        "Weights mapping SO(3)-vectors of type tau_in to type tau_out, with random gaussian entries."
+        assert sorted(tau_in.keys())==sorted(tau_out.keys())
+        return SO3weights({l:torch.randn([n,tau_out[l]],dtype=torch.complex64,device=device) for l,n in tau_in.items()})
+
+
+    # ---- Access -------------------------------------------------------------------------------------------
+
+
+    def tau_in(self):
+        "The type of the SO(3)-vectors that the map can be applied to."
+        return {l:w.size(0) for l,w in self.parts.items()}
+
+    def tau_out(self):
+        "The type of the result of the map."
+        return {l:w.size(1) for l,w in self.parts.items()}
+
+    def parameters(self):
+        "The weight matrices, e.g., to register them with an optimizer or as the parameters of a module."
+        return list(self.parts.values())
+
+    def requires_grad_(self):
+        for w in self.parts.values():
+            w.requires_grad_()
+        return self
+
+    def get_grad(self):
+        return SO3weights({l:w.grad for l,w in self.parts.items()})
+
+
+    # ---- Operations ---------------------------------------------------------------------------------------
+
+
+    def __call__(self,x):
+        """
+        Apply the map to the SO3vec or SO3vecArr x, i.e., multiply the channel dimension of each
+        part of x by the corresponding weight matrix. The result has the same class as x.
+        """
+        return x.linear(self)
+
+    def apply_to_parts(self,parts):
+        "Apply the map to the dictionary of parts of an SO(3)-vector, returning the parts of the result in order of l."
+        ls=sorted(parts.keys())
+        if ls!=list(self.parts.keys()):
+            raise ValueError("the weights are for parts "+str(list(self.parts.keys()))+
+                             " but the vector has parts "+str(ls))
+        xparts=[parts[l] for l in ls]
+        wparts=[self.parts[l] for l in ls]
+        return list(SO3weights_LinearFn.apply(len(ls),*(xparts+wparts)))
+
+
+    # ---- I/O ----------------------------------------------------------------------------------------------
+
+
+    def __repr__(self):
+        return "<SO3weights tau_in="+str(self.tau_in())+" tau_out="+str(self.tau_out())+">"
+
+    def __str__(self):
+        return "\n".join(["Part l="+str(l)+":\n"+str(w)+"\n" for l,w in self.parts.items()])
+
+
+# ----------------------------------------------------------------------------------------------------------
+# ---- SO3CGweights ----------------------------------------------------------------------------------------
+# ----------------------------------------------------------------------------------------------------------
+
+
+class SO3CGweights:
+    """
+    The weights of a fully connected weighted CG-product of SO(3)-vectors of types tau_x and tau_y,
+    giving an SO(3)-vector of type tau. There is an (n1,n2,n_out) complex tensor W_p for each path
+    p=(l1,l2,l) with |l1-l2|<=l<=l1+l2, and channel w of part l of the result is the sum over the 
+    paths into l of sum_{u,v} W_p[u,v,w] times the (u,v) channel of the CG-product of x_l1 and y_l2. 
+    The n1*n2 channels of the plain CG-product are never formed, neither in the forward nor in the
+    backward pass.
+    """
+
+    def __init__(self,tau_x,tau_y,tau,weights=None):
+        self.tau_x=dict(sorted(tau_x.items()))
+        self.tau_y=dict(sorted(tau_y.items()))
+        self.tau=dict(sorted(tau.items()))
+        self.paths=SO3CGweights.get_paths(tau_x,tau_y,tau)
+        self.weights=[]
+        if weights is not None:
+            assert len(weights)==len(self.paths)
+            for (l1,l2,l),w in zip(self.paths,weights):
+                assert list(w.size())==[tau_x[l1],tau_y[l2],tau[l]]
+            self.weights=list(weights)
+
+
+    # ---- Static constructors ------------------------------------------------------------------------------
+
+
+    @classmethod
+    def zeros(self,tau_x,tau_y,tau,device='cpu'):
+        "Weights of the weighted CG-product of types tau_x and tau_y into type tau, initialized to zero."
+        return SO3CGweights(tau_x,tau_y,tau,[torch.zeros([tau_x[l1],tau_y[l2],tau[l]],dtype=torch.complex64,device=device)
+                                             for l1,l2,l in SO3CGweights.get_paths(tau_x,tau_y,tau)])
+
+    @classmethod
+    def randn(self,tau_x,tau_y,tau,device='cpu'):
+        "Weights of the weighted CG-product of types tau_x and tau_y into type tau, with random gaussian entries."
+        return SO3CGweights(tau_x,tau_y,tau,[torch.randn([tau_x[l1],tau_y[l2],tau[l]],dtype=torch.complex64,device=device)
+                                             for l1,l2,l in SO3CGweights.get_paths(tau_x,tau_y,tau)])
+
+    @staticmethod
+    def get_paths(tau_x,tau_y,tau):
+        "The paths (l1,l2,l) in the order in which the weight tensors are stored."
+        return [(l1,l2,l) for l1 in sorted(tau_x) for l2 in sorted(tau_y)
+                for l in range(abs(l1-l2),l1+l2+1) if l in tau]
+
+
+    # ---- Access -------------------------------------------------------------------------------------------
+
+
+    def parameters(self):
+        "The weight tensors, e.g., to register them with an optimizer or as the parameters of a module."
+        return list(self.weights)
+
+    def requires_grad_(self):
+        for w in self.weights:
+            w.requires_grad_()
+        return self
+
+    def get_grad(self):
+        return SO3CGweights(self.tau_x,self.tau_y,self.tau,[w.grad for w in self.weights])
+
+
+    # ---- Operations ---------------------------------------------------------------------------------------
+
+
+    def __call__(self,x,y):
+        "The weighted CG-product of the SO3vecs or SO3vecArrs x and y. The result has the same class as x."
+        return x.weighted_CGproduct(y,self)
+
+    def apply_to_parts(self,xparts,yparts):
+        "Compute the weighted CG-product of the parts of two SO(3)-vectors, returning the parts of the result in order of l."
+        xtau={l:p.size(-1) for l,p in sorted(xparts.items())}
+        ytau={l:p.size(-1) for l,p in sorted(yparts.items())}
+        if xtau!=self.tau_x or ytau!=self.tau_y:
+            raise ValueError("the weights are for types "+str(self.tau_x)+" and "+str(self.tau_y)+
+                             " but the vectors have types "+str(xtau)+" and "+str(ytau))
+        x=[xparts[l] for l in xtau]
+        y=[yparts[l] for l in ytau]
+        return list(SO3CGweights_CGproductFn.apply(len(x),len(y),self.tau,False,*(x+y+self.weights)))
+
+
+    # ---- I/O ----------------------------------------------------------------------------------------------
+
+
+    def __repr__(self):
+        return "<SO3CGweights tau_x="+str(self.tau_x)+" tau_y="+str(self.tau_y)+" tau="+str(self.tau)+\
+            " paths="+str(len(self.paths))+">"
+
+    def __str__(self):
+        return "\n".join(["Path "+str(p)+":\n"+str(w)+"\n" for p,w in zip(self.paths,self.weights)])
+
+
+# ----------------------------------------------------------------------------------------------------------
+# ---- SO3DiagCGweights ------------------------------------------------------------------------------------
+# ----------------------------------------------------------------------------------------------------------
+
+
+class SO3DiagCGweights:
+    """
+    Per-channel weights for the diagonal CG-product of SO(3)-vectors of types tau_x and tau_y: a complex
+    vector w_p of length tau_x[l1]=tau_y[l2] for each path p=(l1,l2,l) with l<=maxl. The channels that 
+    path p contributes to part l of the result are multiplied by w_p inside the kernel, and the gradient 
+    of the weights is computed in the same pass as those of x and y. 
+    """
+
+    def __init__(self,tau_x,tau_y,maxl=-1,weights=None):
+        self.tau_x=dict(sorted(tau_x.items()))
+        self.tau_y=dict(sorted(tau_y.items()))
+        self.maxl=maxl
+        self.paths=SO3DiagCGweights.get_paths(tau_x,tau_y,maxl)
+        for l1,l2,l in self.paths:
+            if tau_x[l1]!=tau_y[l2]:
+                raise ValueError("the diagonal CG-product requires the same number of channels in parts "+
+                                 str(l1)+" and "+str(l2))
+        self.weights=[]
+        if weights is not None:
+            assert len(weights)==len(self.paths)
+            for (l1,l2,l),w in zip(self.paths,weights):
+                assert list(w.size())==[tau_x[l1]]
+            self.weights=list(weights)
+
+
+    # ---- Static constructors ------------------------------------------------------------------------------
+
+
+    @classmethod
+    def zeros(self,tau_x,tau_y,maxl=-1,device='cpu'):
+        return SO3DiagCGweights(tau_x,tau_y,maxl,[torch.zeros([tau_x[l1]],dtype=torch.complex64,device=device)
+                                                  for l1,l2,l in SO3DiagCGweights.get_paths(tau_x,tau_y,maxl)])
+
+    @classmethod
+    def ones(self,tau_x,tau_y,maxl=-1,device='cpu'):
+        "Weights that reproduce the unweighted diagonal CG-product."
+        return SO3DiagCGweights(tau_x,tau_y,maxl,[torch.ones([tau_x[l1]],dtype=torch.complex64,device=device)
+                                                  for l1,l2,l in SO3DiagCGweights.get_paths(tau_x,tau_y,maxl)])
+
+    @classmethod
+    def randn(self,tau_x,tau_y,maxl=-1,device='cpu'):
+        return SO3DiagCGweights(tau_x,tau_y,maxl,[torch.randn([tau_x[l1]],dtype=torch.complex64,device=device)
+                                                  for l1,l2,l in SO3DiagCGweights.get_paths(tau_x,tau_y,maxl)])
+
+    @staticmethod
+    def get_paths(tau_x,tau_y,maxl=-1):
+        "The paths (l1,l2,l) in the order in which the weight vectors are stored."
+        return [(l1,l2,l) for l1 in sorted(tau_x) for l2 in sorted(tau_y)
+                for l in range(abs(l1-l2),l1+l2+1) if maxl<0 or l<=maxl]
+
+
+    # ---- Access -------------------------------------------------------------------------------------------
+
+
+    def tau(self):
+        "The type of the result of the weighted diagonal CG-product."
+        return ops.CGproduct_type(self.tau_x,self.tau_y,self.maxl,True)
+
+    def parameters(self):
+        return list(self.weights)
+
+    def requires_grad_(self):
+        for w in self.weights:
+            w.requires_grad_()
+        return self
+
+    def get_grad(self):
+        return SO3DiagCGweights(self.tau_x,self.tau_y,self.maxl,[w.grad for w in self.weights])
+
+
+    # ---- Operations ---------------------------------------------------------------------------------------
+
+
+    def __call__(self,x,y):
+        "The weighted diagonal CG-product of the SO3vecs or SO3vecArrs x and y."
+        return x.weighted_DiagCGproduct(y,self)
+
+    def apply_to_parts(self,xparts,yparts):
+        "Compute the weighted diagonal CG-product of the parts of two SO(3)-vectors, returning the parts of the result in order of l."
+        xtau={l:p.size(-1) for l,p in sorted(xparts.items())}
+        ytau={l:p.size(-1) for l,p in sorted(yparts.items())}
+        if xtau!=self.tau_x or ytau!=self.tau_y:
+            raise ValueError("the weights are for types "+str(self.tau_x)+" and "+str(self.tau_y)+
+                             " but the vectors have types "+str(xtau)+" and "+str(ytau))
+        x=[xparts[l] for l in xtau]
+        y=[yparts[l] for l in ytau]
+        return list(SO3CGweights_CGproductFn.apply(len(x),len(y),self.tau(),True,*(x+y+self.weights)))
+
+
+    # ---- I/O ----------------------------------------------------------------------------------------------
+
+
+    def __repr__(self):
+        return "<SO3DiagCGweights tau_x="+str(self.tau_x)+" tau_y="+str(self.tau_y)+" maxl="+str(self.maxl)+\
+            " paths="+str(len(self.paths))+">"
+
+    def __str__(self):
+        return "\n".join(["Path "+str(p)+":\n"+str(w)+"\n" for p,w in zip(self.paths,self.weights)])
+
+
+# ----------------------------------------------------------------------------------------------------------
+# ---- Autograd functions -----------------------------------------------------------------------------------
+# ----------------------------------------------------------------------------------------------------------
+
+
+class SO3weights_LinearFn(torch.autograd.Function):
+    """
+    Each part x_l is regarded as a (b*g1*...*gk*(2l+1),n_in) matrix. The products r_l=x_l*W_l of all the
+    parts are computed in one grouped GEMM call, and so are the input gradients g_l*W_l^H and the weight
+    gradients x_l^H*g_l.
+    """
+
+    @staticmethod
+    def forward(ctx, k, *args):
+        ctx.k=k
+        ctx.save_for_backward(*args)
+
+        x=args[0:k]
+        W=args[k:2*k]
+        for p,w in zip(x,W):
+            if p.size(-1)!=w.size(0):
+                raise ValueError("cannot map a part with "+str(p.size(-1))+" channels by a weight matrix of size "+str(list(w.size())))
+
+        return tuple(gb.linear_parts(list(x),list(W)))
+
+    @staticmethod
+    def backward(ctx, *args):
+
+        k=ctx.k
+        saved=ctx.saved_tensors
+        x=saved[0:k]
+        W=saved[k:2*k]
+        xneeded=ctx.needs_input_grad[1:1+k]
+        wneeded=ctx.needs_input_grad[1+k:1+2*k]
+
+        xgrads,wgrads=gb.linear_parts_back(list(args),list(x),list(W),any(xneeded),any(wneeded))
+        xgrads=[g if n else None for g,n in zip(xgrads,xneeded)] if any(xneeded) else [None]*k
+        wgrads=[g if n else None for g,n in zip(wgrads,wneeded)] if any(wneeded) else [None]*k
+
+        return tuple([None]+xgrads+wgrads)
+
+
+class SO3CGweights_CGproductFn(torch.autograd.Function):
+
+    @staticmethod
+    def forward(ctx, k1, k2, tau, diag, *args):
+        ctx.k1=k1
+        ctx.k2=k2
+        ctx.diag=diag
+        ctx.save_for_backward(*args)
+
+        x=args[0:k1]
+        y=args[k1:k1+k2]
+        W=list(args[k1+k2:])
+        b=common_batch(x[0],y[0])
+        adims=list(x[0].size()[1:-2]) if x[0].dim()>=y[0].dim() else list(y[0].size()[1:-2])
+        rparts=[torch.zeros([b]+adims+[2*l+1,n],dtype=torch.complex64,device=x[0].device) for l,n in tau.items()]
+        r=gb.SO3vec.view(rparts)
+        if diag:
+            r.addDiagCGproduct_weighted(gb.SO3vec.view(list(x)),gb.SO3vec.view(list(y)),W)
+        else:
+            r.addCGproduct_weighted(gb.SO3vec.view(list(x)),gb.SO3vec.view(list(y)),W)
+
+        return tuple(rparts)
+
+    @staticmethod
+    def backward(ctx, *args):
+
+        k1=ctx.k1
+        k2=ctx.k2
+        saved=ctx.saved_tensors
+        x=saved[0:k1]
+        y=saved[k1:k1+k2]
+        W=list(saved[k1+k2:])
+        xgrads=zero_grads(ctx.needs_input_grad[4:4+k1],x)
+        ygrads=zero_grads(ctx.needs_input_grad[4+k1:4+k1+k2],y)
+        wgrads=zero_grads(ctx.needs_input_grad[4+k1+k2:],W)
+
+        g=gb.SO3vec.view([p.contiguous() for p in args])
+        _xg=gb.SO3vec.view(xgrads or [])
+        _yg=gb.SO3vec.view(ygrads or [])
+        _x=gb.SO3vec.view(list(x))
+        _y=gb.SO3vec.view(list(y))
+        if ctx.diag:
+            g.addDiagCGproduct_weighted_back(_xg,_yg,wgrads or [],_x,_y,W)
+        else:
+            g.addCGproduct_weighted_back(_xg,_yg,wgrads or [],_x,_y,W)
+
+        return tuple([None,None,None,None]+(xgrads or [None]*k1)+(ygrads or [None]*k2)+(wgrads or [None]*len(W)))
@@ -4,24 +4,27 @@ import torch
 #from gelib_base import SO3element 
 #from gelib_base import SO3type 
 #from gelib_base import SO3bitype 
+from gelib_base import SO3radialBasis
 
 from gelib.gelib_common import *
-#from gelib.gather_map import *
-# Removed redundant import of gather_map
+from gelib.threads import *
+from gelib.gather_map import *
 
 from gelib.SO3element import *
 from gelib.SO3irrep import *
 from gelib.SO3part import *
+from gelib.SO3power import *
 from gelib.SO3vec import *
 
 from gelib.SO3type import *
-# from gelib.SO3weights import *
+from gelib.SO3weights import *
 # from gelib.SO3weightsArr import *
-# from gelib.SO3weights import *
 # from gelib.SO3mvec import *
 
 from gelib.SO3partArr import *
 from gelib.SO3vecArr import *
+from gelib.CGPlan import *
+from gelib.checkpointing import *
 
 #from gelib.SO3weightsArr import *
 #from gelib.Wigner import *
@@ -0,0 +1,150 @@
+# This file is part of GElib, a C++/CUDA library for group
+# equivariant tensor operations.
+#
+# Copyright (c) 2025, Imre Risi Kondor
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import torch
+import torch.utils.checkpoint
+
+
+# ----------------------------------------------------------------------------------------------------------
+# ---- Activation checkpointing ----------------------------------------------------------------------------
+# ----------------------------------------------------------------------------------------------------------
+
+
+def checkpoint(fn, *args, **kwargs):
+    """
+    Evaluate fn(*args,**kwargs) in recompute mode. The tensors that the operations inside fn would save
+    for the backward pass, such as the inputs of its CG-products and their outputs as seen by the layers
+    that follow, are not kept. Only the arguments are held on to, and fn is evaluated again when the
+    gradients are needed. The arguments and the result can be SO3vecs, SO3vecArrs or any other objects
+    holding tensors, and the result has the same parts as fn(*args,**kwargs).
+    >>> z = gelib.checkpoint(lambda x: W(gelib.DiagCGproduct(x,x)),x)
+    """
+    return torch.utils.checkpoint.checkpoint(fn,*args,use_reentrant=False,**kwargs)
+
+
+def checkpoint_chain(layers, x, checkpointed=None):
+    """
+    Apply the sequence of layers to x, evaluating those layers i for which checkpointed[i] is True in
+    recompute mode. By default every layer is checkpointed.
+    >>> z = gelib.checkpoint_chain(layers,x,gelib.checkpoint_policy(layers,x,2**30))
+    """
+    if checkpointed is None:
+        checkpointed=[True]*len(layers)
+    if len(checkpointed)!=len(layers):
+        raise ValueError("checkpoint_chain: the length of checkpointed must equal the number of layers.")
+    for f,c in zip(layers,checkpointed):
+        x=checkpoint(f,x) if c else f(x)
+    return x
+
+
+def checkpoint_policy(layers, x, budget):
+    """
+    Choose the layers of the chain layers(x) to checkpoint so that the tensors kept for the backward pass
+    take up at most budget bytes. Each layer is run once on x to measure the bytes that it saves and the
+    size of its input, which is all that a checkpointed layer keeps. The layers are then checkpointed in
+    decreasing order of the memory that this frees until the total fits into the budget. Returns the
+    list of flags to pass to checkpoint_chain.
+    """
+    saved=[]
+    kept=[]
+    for f in layers:
+        kept.append(_nbytes(x))
+        x,s=saved_tensor_bytes(f,x)
+        saved.append(s)
+
+    total=sum(saved)
+    checkpointed=[False]*len(layers)
+    for i in sorted(range(len(layers)),key=lambda i:kept[i]-saved[i]):
+        if total<=budget or saved[i]<=kept[i]:
+            break
+        checkpointed[i]=True
+        total-=saved[i]-kept[i]
+    if total>budget:
+        raise ValueError("checkpoint_policy: the chain needs at least "+str(total)+" bytes for the backward pass.")
+    return checkpointed
+
+
+def saved_tensor_bytes(fn, *args):
+    """
+    Evaluate fn(*args) and return the result together with the number of bytes of the tensors that it
+    saves for the backward pass, counting each storage only once. The saved tensors are released when
+    this function returns, so the result cannot be backpropagated through.
+    """
+    storages={}
+    def pack(t):
+        s=t.untyped_storage()
+        storages[s.data_ptr()]=s
+        return None
+    with torch.autograd.graph.saved_tensors_hooks(pack,lambda t: t):
+        r=fn(*args)
+    return r,sum([s.nbytes() for s in storages.values()])
+
+
+def _nbytes(x):
+    "Total bytes of the tensors held by x, which can be a tensor, an SO3vec or SO3vecArr, or a list of these."
+    if isinstance(x,torch.Tensor):
+        return x.untyped_storage().nbytes()
+    if hasattr(x,'parts'):
+        return _nbytes(list(x.parts.values()))
+    if isinstance(x,(list,tuple)):
+        return sum([_nbytes(p) for p in x])
+    return 0
+
+
+# ----------------------------------------------------------------------------------------------------------
+# ---- Reduced precision saved tensors ---------------------------------------------------------------------
+# ----------------------------------------------------------------------------------------------------------
+
+
+class saved_precision:
+    """
+    Context manager that stores the complex tensors saved for the backward pass by the operations in its
+    scope, e.g., the inputs of CG-products, as pairs of real and imaginary parts of type dtype (bfloat16
+    or float16). This halves the activation memory. The tensors are converted back to complex64 when the
+    backward pass uses them, so the kernels still accumulate in float32, and only the stored values are
+    rounded. Leaf tensors such as weights and inputs, broadcast tensors and tensors with fewer than
+    min_numel elements are saved as they are, since compressing them would not save memory.
+    >>> with gelib.saved_precision(torch.bfloat16):
+    ...     z=gelib.CGproduct(x,y)
+    """
+
+    def __init__(self, dtype=torch.bfloat16, min_numel=0):
+        if dtype not in (torch.bfloat16,torch.float16):
+            raise ValueError("saved_precision: dtype must be torch.bfloat16 or torch.float16.")
+        self.dtype=dtype
+        self.min_numel=min_numel
+        self.hooks=None
+
+    def pack(self, t):
+        if t.dtype!=torch.complex64 or t.is_leaf or t.numel()<self.min_numel:
+            return t
+        if t.numel()*t.element_size()>t.untyped_storage().nbytes():
+            return t
+        return _Compressed(torch.view_as_real(t).to(self.dtype))
+
+    def unpack(self, p):
+        if isinstance(p,_Compressed):
+            return torch.view_as_complex(p.data.float())
+        return p
+
+    def __enter__(self):
+        self.hooks=torch.autograd.graph.saved_tensors_hooks(self.pack,self.unpack)
+        self.hooks.__enter__()
+        return self
+
+    def __exit__(self,*args):
+        self.hooks.__exit__(*args)
+        return False
+
+
+class _Compressed:
+    "A saved tensor stored in reduced precision by saved_precision."
+
+    def __init__(self, data):
+        self.data=data
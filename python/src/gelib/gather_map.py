@@ -9,8 +9,13 @@
 # or modified form) must retain this copyright notice and must be 
 # accompanied by a verbatim copy of the license. 
 
+import weakref
 import torch
-from . import gelib_base as gb
+import gelib_base as gb
+
+# Maps built by gather_map.from_edge_index(...,cache=True), keyed by the id of the edge_index tensor 
+_edge_index_cache={}
+
 
 class gather_map:
 
@@ -23,13 +28,79 @@ class gather_map:
         assert isinstance(M,torch.Tensor)
         assert isinstance(n_in,int)
         assert isinstance(n_out,int)
-        return gather_map(gb.gather_map.from_matrix(x.int(),n_in,n_out))
+        return gather_map(gb.gather_map.from_matrix(M.int(),n_in,n_out))
+
+    @classmethod
+    def from_edge_index(self,edge_index,n_in=-1,n_out=-1,cache=False):
+        """
+        The gather map in which each target edge_index[1,i] collects the sources edge_index[0,i]. 
+        The [2,E] int64 tensor is read in place. If cache is set, the map is kept for as long as 
+        edge_index is alive and is returned again for the same, unmodified tensor, so graphs whose 
+        topology does not change between steps only build their map once.
+        """
+        assert isinstance(edge_index,torch.Tensor)
+        assert edge_index.dim()==2 and edge_index.size(0)==2
+        key=(n_in,n_out)
+        if cache:
+            entry=_edge_index_cache.get(id(edge_index))
+            if entry is not None and entry[0]() is edge_index and entry[1]==edge_index._version and key in entry[2]:
+                return entry[2][key]
+        r=gather_map(gb.gather_map.from_edge_index(edge_index.long().cpu(),n_in,n_out))
+        if cache:
+            entry=_edge_index_cache.get(id(edge_index))
+            if entry is None or entry[0]() is not edge_index or entry[1]!=edge_index._version:
+                i=id(edge_index)
+                entry=(weakref.ref(edge_index,lambda _: _edge_index_cache.pop(i,None)),edge_index._version,{})
+                _edge_index_cache[i]=entry
+            entry[2][key]=r
+        return r
+
+    @classmethod
+    def radius_graph(self,positions,cutoff,batch=None,max_neighbors=None):
+        """
+        Neighbor lists of a point cloud. Returns the gather map in which each point collects the other 
+        points of the same batch within distance cutoff of it (at most max_neighbors of the nearest ones, 
+        if given), its edges as a [2,E] tensor of (source,target) pairs in list order, and the displacement 
+        vectors positions[source]-positions[target] of the edges as an [E,3] tensor, which is 
+        differentiable with respect to positions. 
+        """
+        assert isinstance(positions,torch.Tensor)
+        assert positions.dim()==2 and positions.size(1)==3
+        pos=positions.detach().float().cpu().contiguous()
+        if batch is None:
+            b=torch.zeros(0,dtype=torch.int32)
+        else:
+            b=batch.int().cpu().contiguous()
+        r=gather_map(gb.gather_map.radius_graph(pos,float(cutoff),b,-1 if max_neighbors is None else max_neighbors))
+        edge_index=r.edges().long().to(positions.device)
+        return r,edge_index,positions[edge_index[0]]-positions[edge_index[1]]
+
+    def edges(self):
+        """
+        The (source,target) pairs of the map in list order, as the columns of a [2,E] tensor.
+        """
+        return self.obj.edges()
 
     @classmethod
     def random(self,n_in,n_out,p):
         return gather_map(gb.gather_map.random(n_in,n_out,p))
 
 
+    @property
+    def n_in(self):
+        return self.obj.n_in
+
+    @property
+    def n_out(self):
+        return self.obj.n_out
+
+    def inv(self):
+        """
+        The inverse map. It is computed on first use and cached.
+        """
+        return gather_map(self.obj.inv())
+
+
 
     # ---- I/O ----------------------------------------------------------------------------------------------
 
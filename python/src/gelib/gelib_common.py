@@ -19,3 +19,41 @@ def common_batch(x,y):
         assert(x.size(0)==y.size(0))
     return max(x.size(0),y.size(0))
 
+
+def packed_size(tau):
+    "Size of the last dimension of the packed buffer holding an SO(3)-vector of type tau."
+    return sum([(2*l+1)*n for l,n in tau.items()])
+
+
+def packed_views(buf,tau):
+    """
+    Zero-copy views of the consecutive blocks of the last dimension of buf as the parts of an
+    SO(3)-vector of type tau. Part l takes up (2l+1)*tau[l] columns stored m-major.
+    """
+    assert buf.size(-1)==packed_size(tau)
+    R={}
+    offs=0
+    for l,n in sorted(tau.items()):
+        R[l]=buf.narrow(-1,offs,(2*l+1)*n).unflatten(-1,(2*l+1,n))
+        offs+=(2*l+1)*n
+    return R
+
+
+def pack_parts(parts):
+    "Copy the parts of an SO(3)-vector into a single packed buffer."
+    return torch.cat([p.flatten(-2) for l,p in sorted(parts.items())],-1)
+
+
+def gmap_backend(gmap):
+    "The C++ gather map underlying gmap, which can be a gelib.gather_map or a gelib_base.gather_map."
+    return gmap.obj if hasattr(gmap,'obj') else gmap
+
+
+def zero_grads(needed, tensors):
+    """
+    Zero initialized gradient buffers for a group of tensors whose gradients are computed by the same
+    backward kernel, or None if none of them needs a gradient, in which case the kernel can be skipped.
+    """
+    if not any(needed):
+        return None
+    return [torch.zeros_like(x) for x in tensors]
@@ -0,0 +1,179 @@
+# This file is part of GElib, a C++/CUDA library for group
+# equivariant tensor operations.
+#
+# Copyright (c) 2024, Imre Risi Kondor
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# The CG-products registered as torch.library custom ops. The ops take and return plain complex
+# tensors, have fake implementations for shape inference and registered backward formulas, so
+# that torch.compile can trace through them without graph breaks.
+
+from typing import List, Tuple
+import torch
+import gelib_base as gb
+
+
+has_custom_ops=hasattr(torch,'library') and hasattr(torch.library,'custom_op')
+
+
+def CGproduct_type(tau_x, tau_y, maxl=-1, diag=False):
+    "The type of the (full or diagonal) CG-product of SO(3)-vectors of types tau_x and tau_y."
+    r={}
+    for l1,n1 in tau_x.items():
+        for l2,n2 in tau_y.items():
+            for l in range(abs(l1-l2),l1+l2+1):
+                if maxl>=0 and l>maxl:
+                    break
+                r[l]=r.get(l,0)+(n1 if diag else n1*n2)
+    return dict(sorted(r.items()))
+
+
+def _type_of(ls, parts):
+    # The degrees are passed in explicitly so that they stay static ints when the sizes are symbolic
+    return {l:p.size(-1) for l,p in zip(ls,parts)}
+
+def _batch_and_adims(x, y):
+    b=max(x.size(0),y.size(0))
+    adims=list(x.size()[1:-2]) if x.dim()>=y.dim() else list(y.size()[1:-2])
+    return b,adims
+
+def _part_shape(x, y, l, diag):
+    b,adims=_batch_and_adims(x,y)
+    n=x.size(-1) if diag else x.size(-1)*y.size(-1)
+    return [b]+adims+[2*l+1,n]
+
+def _vec_shapes(x, y, lx, ly, maxl, diag):
+    b,adims=_batch_and_adims(x[0],y[0])
+    tau=CGproduct_type(_type_of(lx,x),_type_of(ly,y),maxl,diag)
+    return [[b]+adims+[2*l+1,n] for l,n in tau.items()]
+
+
+if has_custom_ops:
+
+
+    # ---- SO3part ------------------------------------------------------------------------------------------
+
+
+    @torch.library.custom_op("gelib::SO3part_CGproduct", mutates_args=())
+    def SO3part_CGproduct(x: torch.Tensor, y: torch.Tensor, l: int, diag: bool=False) -> torch.Tensor:
+        r=torch.zeros(_part_shape(x,y,l,diag),dtype=torch.complex64,device=x.device)
+        if diag:
+            gb.SO3part.view(r).add_DiagCGproduct(gb.SO3part.view(x),gb.SO3part.view(y))
+        else:
+            gb.SO3part.view(r).add_CGproduct(gb.SO3part.view(x),gb.SO3part.view(y))
+        return r
+
+    @SO3part_CGproduct.register_fake
+    def _(x, y, l, diag=False):
+        return x.new_empty(_part_shape(x,y,l,diag))
+
+
+    # The gradients that are not needed are returned as empty tensors, and their kernels are skipped
+
+    @torch.library.custom_op("gelib::SO3part_CGproduct_backward", mutates_args=())
+    def SO3part_CGproduct_backward(g: torch.Tensor, x: torch.Tensor, y: torch.Tensor, diag: bool=False,
+                                   need_x: bool=True, need_y: bool=True) -> Tuple[torch.Tensor,torch.Tensor]:
+        xg=torch.zeros_like(x) if need_x else x.new_empty(0)
+        yg=torch.zeros_like(y) if need_y else y.new_empty(0)
+        _g=gb.SO3part.view(g)
+        if need_x and need_y:
+            if diag:
+                _g.add_DiagCGproduct_back01(gb.SO3part.view(xg),gb.SO3part.view(yg),gb.SO3part.view(x),gb.SO3part.view(y))
+            else:
+                _g.add_CGproduct_back01(gb.SO3part.view(xg),gb.SO3part.view(yg),gb.SO3part.view(x),gb.SO3part.view(y))
+        elif need_x:
+            if diag:
+                gb.SO3part.view(xg).add_DiagCGproduct_back0(_g,gb.SO3part.view(y))
+            else:
+                gb.SO3part.view(xg).add_CGproduct_back0(_g,gb.SO3part.view(y))
+        elif need_y:
+            if diag:
+                gb.SO3part.view(yg).add_DiagCGproduct_back1(_g,gb.SO3part.view(x))
+            else:
+                gb.SO3part.view(yg).add_CGproduct_back1(_g,gb.SO3part.view(x))
+        return xg,yg
+
+    @SO3part_CGproduct_backward.register_fake
+    def _(g, x, y, diag=False, need_x=True, need_y=True):
+        return (torch.empty_like(x) if need_x else x.new_empty(0)),(torch.empty_like(y) if need_y else y.new_empty(0))
+
+
+    def _SO3part_setup_context(ctx, inputs, output):
+        x,y,l,diag=inputs
+        ctx.diag=diag
+        ctx.save_for_backward(x,y)
+
+    def _SO3part_backward(ctx, g):
+        x,y=ctx.saved_tensors
+        need_x,need_y=ctx.needs_input_grad[0:2]
+        xg,yg=SO3part_CGproduct_backward(g.contiguous(),x,y,ctx.diag,need_x,need_y)
+        return (xg if need_x else None),(yg if need_y else None),None,None
+
+    SO3part_CGproduct.register_autograd(_SO3part_backward, setup_context=_SO3part_setup_context)
+
+
+    # ---- SO3vec -------------------------------------------------------------------------------------------
+
+
+    @torch.library.custom_op("gelib::SO3vec_CGproduct", mutates_args=())
+    def SO3vec_CGproduct(x: List[torch.Tensor], y: List[torch.Tensor], lx: List[int], ly: List[int],
+                         maxl: int=-1, diag: bool=False) -> List[torch.Tensor]:
+        rparts=[torch.zeros(s,dtype=torch.complex64,device=x[0].device) for s in _vec_shapes(x,y,lx,ly,maxl,diag)]
+        r=gb.SO3vec.view(rparts)
+        if diag:
+            r.addDiagCGproduct(gb.SO3vec.view(x),gb.SO3vec.view(y))
+        else:
+            r.addCGproduct(gb.SO3vec.view(x),gb.SO3vec.view(y))
+        return rparts
+
+    @SO3vec_CGproduct.register_fake
+    def _(x, y, lx, ly, maxl=-1, diag=False):
+        return [x[0].new_empty(s) for s in _vec_shapes(x,y,lx,ly,maxl,diag)]
+
+
+    # Returns the gradients of the parts of x followed by those of y, omitting those that are not needed
+
+    @torch.library.custom_op("gelib::SO3vec_CGproduct_backward", mutates_args=())
+    def SO3vec_CGproduct_backward(g: List[torch.Tensor], x: List[torch.Tensor], y: List[torch.Tensor], diag: bool=False,
+                                  need_x: bool=True, need_y: bool=True) -> List[torch.Tensor]:
+        xg=[torch.zeros_like(p) for p in x] if need_x else []
+        yg=[torch.zeros_like(p) for p in y] if need_y else []
+        _g=gb.SO3vec.view(g)
+        if diag:
+            _g.addDiagCGproduct_back01(gb.SO3vec.view(xg),gb.SO3vec.view(yg),gb.SO3vec.view(x),gb.SO3vec.view(y))
+        else:
+            _g.addCGproduct_back01(gb.SO3vec.view(xg),gb.SO3vec.view(yg),gb.SO3vec.view(x),gb.SO3vec.view(y))
+        return xg+yg
+
+    @SO3vec_CGproduct_backward.register_fake
+    def _(g, x, y, diag=False, need_x=True, need_y=True):
+        return ([torch.empty_like(p) for p in x] if need_x else [])+([torch.empty_like(p) for p in y] if need_y else [])
+
+
+    def _SO3vec_setup_context(ctx, inputs, output):
+        x,y,lx,ly,maxl,diag=inputs
+        ctx.lx=lx
+        ctx.ly=ly
+        ctx.maxl=maxl
+        ctx.diag=diag
+        ctx.k1=len(x)
+        ctx.save_for_backward(*(list(x)+list(y)))
+
+    def _SO3vec_backward(ctx, g):
+        saved=ctx.saved_tensors
+        x=list(saved[:ctx.k1])
+        y=list(saved[ctx.k1:])
+        shapes=_vec_shapes(x,y,ctx.lx,ctx.ly,ctx.maxl,ctx.diag)
+        g=[q.contiguous() if q is not None else x[0].new_zeros(s) for q,s in zip(g,shapes)]
+        # for list inputs needs_input_grad holds a flag for each of their elements
+        need_x=any(ctx.needs_input_grad[0])
+        need_y=any(ctx.needs_input_grad[1])
+        grads=SO3vec_CGproduct_backward(g,x,y,ctx.diag,need_x,need_y)
+        xg=grads[:ctx.k1] if need_x else [None]*len(x)
+        yg=grads[ctx.k1 if need_x else 0:] if need_y else [None]*len(y)
+        return xg,yg,None,None,None,None
+
+    SO3vec_CGproduct.register_autograd(_SO3vec_backward, setup_context=_SO3vec_setup_context)
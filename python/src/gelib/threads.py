@@ -0,0 +1,48 @@
+# This file is part of GElib, a C++/CUDA library for group
+# equivariant tensor operations.
+#
+# Copyright (c) 2024, Imre Risi Kondor
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import gelib_base as gb
+
+
+def set_num_threads(n):
+    """
+    Set the number of CPU threads that GElib's kernels may use. The work is split over the
+    batch and grid cells, the (l1,l2,l) paths of a CG-product and, if need be, over tiles of channels.
+    """
+    if n<1:
+        raise ValueError("The number of threads must be at least 1.")
+    gb.set_num_threads(int(n))
+
+
+def get_num_threads():
+    """
+    Return the number of CPU threads that GElib's kernels may use.
+    """
+    return gb.get_num_threads()
+
+
+class num_threads:
+    """
+    Context manager that temporarily sets the number of CPU threads used by GElib.
+    >>> with gelib.num_threads(8):
+    ...     z=gelib.CGproduct(x,y)
+    """
+
+    def __init__(self,n):
+        self.n=n
+        self.prev=None
+
+    def __enter__(self):
+        self.prev=get_num_threads()
+        set_num_threads(self.n)
+        return self
+
+    def __exit__(self,*args):
+        set_num_threads(self.prev)
+        return False
@@ -0,0 +1,52 @@
+import torch
+import gelib as G
+import pytest
+
+class TestCGPlan(object):
+
+    @pytest.mark.parametrize('b', [1, 2])
+    @pytest.mark.parametrize('nc', [1, 3])
+    @pytest.mark.parametrize('maxl', [2, 4])
+    @pytest.mark.parametrize('diag', [False, True])
+    def test_SO3vec(self,b,nc,maxl,diag):
+        tau={l:nc for l in range(3)}
+        x = G.SO3vec.randn(b,tau)
+        y = G.SO3vec.randn(b,tau)
+        plan=G.CGPlan(tau,tau,maxl=maxl,diag=diag)
+        fn=G.DiagCGproduct if diag else G.CGproduct
+        for i in range(2):
+            z=plan(x,y)
+            zr=fn(x,y,maxl=maxl)
+            for l in zr.parts:
+                assert torch.allclose(z.parts[l],zr.parts[l])
+
+    @pytest.mark.parametrize('b', [1, 2])
+    @pytest.mark.parametrize('a', [2])
+    @pytest.mark.parametrize('nc', [1, 2])
+    def test_SO3vecArr_backprop(self,b,a,nc):
+        tau={l:nc for l in range(3)}
+        plan=G.CGPlan(tau,tau)
+        x = G.SO3vecArr.randn(b,[a,a],tau)
+        y = G.SO3vecArr.randn(b,[a,a],tau)
+        x.requires_grad_()
+        y.requires_grad_()
+        z=plan(x,y)
+
+        test_vec=G.SO3vecArr.randn_like(z)
+        loss=z.odot(test_vec)
+        loss.backward(torch.tensor(1.0))
+        xgrad=x.get_grad()
+        ygrad=y.get_grad()
+
+        xeps=G.SO3vecArr.randn_like(x)
+        xloss=plan(x+xeps,y).odot(test_vec)
+        assert(torch.allclose(xloss-loss,xeps.odot(xgrad),rtol=1e-3, atol=1e-4))
+
+        yeps=G.SO3vecArr.randn_like(y)
+        yloss=plan(x,y+yeps).odot(test_vec)
+        assert(torch.allclose(yloss-loss,yeps.odot(ygrad),rtol=1e-3, atol=1e-4))
+
+    def test_type_mismatch(self):
+        plan=G.CGPlan({0:1,1:1},{0:1,1:1})
+        with pytest.raises(ValueError):
+            plan(G.SO3vec.randn(1,{0:2,1:1}),G.SO3vec.randn(1,{0:1,1:1}))
@@ -0,0 +1,42 @@
+import torch
+import gelib as G
+import gelib_base as gb
+import pytest
+from math import factorial, sqrt, cos, sin, pi
+
+
+def littled_sum(l,m1,m2,beta):
+    x=0
+    for s in range(max(0,m1-m2),min(l+m1,l-m2)+1):
+        pref=1.0/(factorial(l+m1-s)*factorial(s)*factorial(m2-m1+s)*factorial(l-m2-s))
+        if (m2-m1+s)%2:
+            pref=-pref
+        x+=pref*cos(beta/2)**(2*l+m1-m2-2*s)*sin(beta/2)**(m2-m1+2*s)
+    return sqrt(factorial(l+m1)*factorial(l-m1)*factorial(l+m2)*factorial(l-m2))*x
+
+
+class TestSO3irrep(object):
+
+    @pytest.mark.parametrize('l', [0, 1, 3, 6])
+    @pytest.mark.parametrize('beta', [0.0, 0.4, pi/2, 2.9, pi])
+    def test_littled(self,l,beta):
+        rho=gb.SO3irrep(l)
+        for m1 in range(-l,l+1):
+            for m2 in range(-l,l+1):
+                assert abs(rho.littled(m1,m2,beta)-littled_sum(l,m1,m2,beta))<1e-5
+
+    def test_littled_all_orthogonal(self):
+        L=100
+        d=G.SO3irrep.littled_all(L,torch.tensor([1e-3,0.7,pi/2,3.0]))
+        for l in [0,1,10,L]:
+            D=d[l].double()
+            assert not torch.isnan(D).any()
+            assert torch.allclose(D@D.transpose(1,2),torch.eye(2*l+1,dtype=torch.float64).expand(4,-1,-1),atol=1e-5)
+
+    @pytest.mark.parametrize('b', [1, 3])
+    def test_matrices_all(self,b):
+        R=G.SO3element.random_batch(b)
+        D=G.SO3irrep.matrices_all(4,R)
+        for l in range(5):
+            assert torch.allclose(D[l],G.SO3irrep(l).matrices(R))
+            assert torch.allclose(D[l][0],G.SO3irrep(l).matrix(G.SO3element(R[0])),atol=1e-5)
@@ -86,6 +86,16 @@ class TestSO3part(object):
         assert torch.allclose(rz,zr,rtol=1e-3, atol=1e-5)
 
 
+    @pytest.mark.parametrize('b', [1, 3])    
+    @pytest.mark.parametrize('l', [0, 1, 4])
+    def test_apply_batched(self,b,l):
+        x=G.SO3part.randn(b,l,3)
+        R=G.SO3element.random_batch(b)
+        xr=x.apply(R)
+        for i in range(b):
+            assert torch.allclose(xr[i],x[i:i+1].apply(G.SO3element(R[i]))[0],rtol=1e-3, atol=1e-5)
+
+
     @pytest.mark.parametrize('b', [1, 2])    
     @pytest.mark.parametrize('l', [1, 2, 4])
     @pytest.mark.parametrize('n', [1, 2, 4, 8])
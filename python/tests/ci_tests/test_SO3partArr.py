@@ -1,5 +1,6 @@
 import torch
 import gelib as G
+import gelib_base as gb
 import pytest
 
 class TestSO3partArr(object):
@@ -112,5 +113,82 @@ class TestSO3partArr(object):
         self.part_part_backprop_bcast(b,[a,a],l,n,G.CGproduct,l)
 
 
+    @pytest.mark.parametrize('b', [1, 3])    
+    @pytest.mark.parametrize('l', [1, 2])
+    def test_apply_batched(self,b,l):
+        x=G.SO3partArr.randn(b,[2,2],l,3)
+        R=G.SO3element.random_batch(b)
+        xr=x.apply(R)
+        for i in range(b):
+            assert torch.allclose(xr[i],x[i:i+1].apply(G.SO3element(R[i]))[0],rtol=1e-3, atol=1e-5)
+
+
+    @pytest.mark.parametrize('b', [1, 2])
+    @pytest.mark.parametrize('l', [1, 3])
+    def test_spharm_backprop(self,b,l):
+        X=torch.randn(b,2,3,5,requires_grad=True)
+        Y=G.SO3partArr.spharm(l,X)
+        test_vec=G.SO3partArr.randn_like(Y)
+        loss=Y.odot(test_vec)
+        loss.backward(torch.tensor(1.0))
+
+        eps=1e-3*torch.randn_like(X)
+        xloss=G.SO3partArr.spharm(l,X.detach()+eps).odot(test_vec)
+        assert(torch.allclose(xloss-loss,torch.sum(eps*X.grad),rtol=2e-2, atol=2e-4))
 
 
+
+    @pytest.mark.parametrize('l', [0, 2])
+    @pytest.mark.parametrize('diag', [False, True])
+    def test_gather_CGproduct_backprop(self,l,diag):
+        N,E=4,10
+        src=torch.randint(0,N,(E,))
+        gmap=gb.gather_map.from_matrix(torch.stack([src,torch.arange(E)],1).int(),N,E)
+        x=G.SO3partArr.randn(2,[N],1,3)
+        y=G.SO3partArr.randn(2,[E],2,3)
+        x.requires_grad_()
+        y.requires_grad_()
+        z=x.gather_DiagCGproduct(y,gmap,l) if diag else x.gather_CGproduct(y,gmap,l)
+        test_vec=G.SO3partArr.randn_like(z)
+        loss=z.odot(test_vec)
+        loss.backward(torch.tensor(1.0))
+
+        xeps=G.SO3partArr.randn_like(x)
+        fn=G.SO3partArr.gather_DiagCGproduct if diag else G.SO3partArr.gather_CGproduct
+        xloss=fn(x+xeps,y,gmap,l).odot(test_vec)
+        assert(torch.allclose(xloss-loss,xeps.odot(x.grad),rtol=1e-3, atol=1e-4))
+        yeps=G.SO3partArr.randn_like(y)
+        yloss=fn(x,y+yeps,gmap,l).odot(test_vec)
+        assert(torch.allclose(yloss-loss,yeps.odot(y.grad),rtol=1e-3, atol=1e-4))
+
+
+    @pytest.mark.parametrize('dim', [0, 1])
+    @pytest.mark.parametrize('reduce', ['sum', 'mean', 'max_norm'])
+    def test_scatter_reduce(self,dim,reduce):
+        N,E=4,11
+        dst=torch.randint(0,N,(E,))
+        gmap=gb.gather_map.from_matrix(torch.stack([torch.arange(E),dst],1).int(),E,N)
+        x=G.SO3partArr.randn(2,[E,3] if dim==0 else [3,E],2,3)
+        x.requires_grad_()
+        z=x.scatter_reduce(gmap,dim,reduce)
+
+        xd=x.movedim(dim+1,1)
+        r=torch.zeros([2,N]+list(xd.size()[2:]),dtype=x.dtype)
+        if reduce=='max_norm':
+            norms=(xd.abs()**2).sum(-2,keepdim=True).expand_as(xd)
+            for t in range(N):
+                ix=(dst==t).nonzero()[:,0]
+                if len(ix)>0:
+                    r[:,t]=torch.gather(xd[:,ix],1,norms[:,ix].argmax(1,keepdim=True))[:,0]
+        else:
+            r=r.index_add(1,dst,xd)
+            if reduce=='mean':
+                r=r/torch.bincount(dst,minlength=N).clamp(min=1).view([1,N]+[1]*(xd.dim()-2))
+        r=G.SO3partArr(r.movedim(1,dim+1))
+        assert torch.allclose(z,r,atol=1e-5)
+
+        test_vec=torch.randn_like(z)
+        xgrad=torch.autograd.grad(z.odot(test_vec),x)[0]
+        rgrad=torch.autograd.grad(r.odot(test_vec),x)[0]
+        assert torch.allclose(xgrad,rgrad,atol=1e-5)
+        assert gmap.inv().n_out==E
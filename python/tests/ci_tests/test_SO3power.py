@@ -0,0 +1,85 @@
+import torch
+import gelib as G
+import pytest
+
+
+class TestSO3CGpower(object):
+
+    def reference(self,x,P):
+        r={}
+        for ls,Ls in P.get_paths():
+            z=x.parts[ls[0]]
+            for k in range(1,len(ls)):
+                z=type(x.parts[ls[0]])(z).DiagCGproduct(x.parts[ls[k]],Ls[k-1])
+            l=Ls[-1] if len(Ls)>0 else ls[0]
+            r[l]=torch.cat([r[l],z],-1) if l in r else z
+        return r
+
+    @pytest.mark.parametrize('nu', [1, 2, 3, 4])
+    @pytest.mark.parametrize('maxl', [0, 2])
+    def test_symmetric_power(self,nu,maxl):
+        tau={0:3,1:3,2:3}
+        x=G.SO3vec.randn(2,tau)
+        P=G.SO3CGpower(tau,nu,maxl)
+        z=x.symmetric_power(nu,maxl)
+        r=self.reference(x,P)
+        assert z.tau()==P.tau
+        for l in r:
+            assert torch.allclose(z.parts[l],r[l],rtol=1e-3,atol=1e-4)
+
+    def test_symmetric_power_paths(self):
+        P=G.SO3CGpower({1:2},2)
+        assert P.get_paths()==[((1,1),(0,)),((1,1),(2,))]
+        assert P.tau=={0:2,2:2}
+
+    def test_symmetric_power_arr(self):
+        tau={0:2,1:2}
+        x=G.SO3vecArr.randn(2,[2,3],tau)
+        P=G.SO3CGpower.get(tau,3)
+        z=P(x)
+        r=self.reference(x,P)
+        for l in r:
+            assert torch.allclose(z.parts[l],r[l],rtol=1e-3,atol=1e-4)
+
+    def test_symmetric_power_equivariance(self):
+        tau={0:2,1:2,2:2}
+        x=G.SO3vec.randn(1,tau)
+        R=G.SO3element.random()
+        z0=x.apply(R).symmetric_power(3,2)
+        z1=x.symmetric_power(3,2).apply(R)
+        for l in z0.parts:
+            assert torch.allclose(z0.parts[l],z1.parts[l],rtol=1e-3,atol=1e-4)
+
+    @pytest.mark.parametrize('nu', [2, 3])
+    def test_symmetric_power_backprop(self,nu):
+        tau={0:2,1:2,2:2}
+        x=G.SO3vec.randn(2,tau)
+        x.requires_grad_()
+        P=G.SO3CGpower(tau,nu,2)
+        z=P(x)
+        test_vec=G.SO3vec.randn_like(z)
+        loss=z.odot(test_vec)
+        loss.backward(torch.tensor(1.0))
+
+        xr=G.SO3vec(*[p.detach().clone().requires_grad_() for p in x.parts.values()])
+        r=self.reference(xr,P)
+        lossr=sum([torch.sum(torch.view_as_real(r[l])*torch.view_as_real(test_vec.parts[l])) for l in r])
+        lossr.backward()
+        for p,q in zip(x.parts.values(),xr.parts.values()):
+            assert torch.allclose(p.grad,q.grad,rtol=1e-3,atol=1e-4)
+
+    def test_symmetric_power_partial_backprop(self):
+        tau={0:2,1:2,2:2}
+        x=G.SO3vec.randn(2,tau)
+        x.parts[1].requires_grad_()
+        P=G.SO3CGpower(tau,3,2)
+        z=P(x)
+        test_vec=G.SO3vec.randn_like(z)
+        z.odot(test_vec).backward(torch.tensor(1.0))
+
+        xr=G.SO3vec(*[p.detach().clone().requires_grad_() for p in x.parts.values()])
+        r=self.reference(xr,P)
+        lossr=sum([torch.sum(torch.view_as_real(r[l])*torch.view_as_real(test_vec.parts[l])) for l in r])
+        lossr.backward()
+        assert x.parts[0].grad is None and x.parts[2].grad is None
+        assert torch.allclose(x.parts[1].grad,xr.parts[1].grad,rtol=1e-3,atol=1e-4)
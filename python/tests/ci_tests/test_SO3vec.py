@@ -1,3 +1,4 @@
+import math
 import torch
 import gelib as G
 import pytest
@@ -73,6 +74,19 @@ class TestSO3vec(object):
             assert (torch.allclose(rz.parts[i] , zr.parts[i], rtol=1e-3, atol=1e-4))
 
 
+    @pytest.mark.parametrize('b', [1, 3])    
+    @pytest.mark.parametrize('maxl',[2])
+    def test_CGproduct_batched_rotation(self,b,maxl):
+        tau={l:2 for l in range(maxl+1)}
+        x = G.SO3vec.randn(b,tau)
+        y = G.SO3vec.randn(b,tau)
+        R = G.SO3element.random_batch(b)
+        z=G.CGproduct(x,y,maxl=maxl).apply(R)
+        zr=G.CGproduct(x.apply(R),y.apply(R),maxl=maxl)
+        for l in range(maxl+1):
+            assert (torch.allclose(z.parts[l], zr.parts[l], rtol=1e-3, atol=1e-4))
+
+
     @pytest.mark.parametrize('b', [1, 3])    
     @pytest.mark.parametrize('maxl',[2,4])
     @pytest.mark.parametrize('nc', [1, 2, 4])
@@ -116,3 +130,53 @@ class TestSO3vec(object):
         self.vec_vec_backprop(b,tau,G.CGproduct)
         return
 
+    @pytest.mark.parametrize('fn', [G.CGproduct, G.DiagCGproduct])
+    @pytest.mark.parametrize('frozen', [0, 1])
+    def test_CGproduct_backprop_frozen(self,fn,frozen):
+        tau={0:2,1:2,2:2}
+        x=G.SO3vec.randn(2,tau)
+        y=G.SO3vec.randn(2,tau)
+        test_vec=G.SO3vec.randn_like(fn(x,y))
+        args=[x,y]
+        args[1-frozen].requires_grad_()
+        fn(x,y).odot(test_vec).backward(torch.tensor(1.0))
+        xr=G.SO3vec(*[p.detach().clone().requires_grad_() for p in x.parts.values()])
+        yr=G.SO3vec(*[p.detach().clone().requires_grad_() for p in y.parts.values()])
+        fn(xr,yr).odot(test_vec).backward(torch.tensor(1.0))
+        for l in tau:
+            assert args[frozen].parts[l].grad is None
+            assert torch.allclose(args[1-frozen].parts[l].grad,[xr,yr][1-frozen].parts[l].grad,rtol=1e-4,atol=1e-5)
+
+
+    @pytest.mark.parametrize('b', [1, 3])
+    @pytest.mark.parametrize('L', [0, 3, 6])
+    def test_spharm(self,b,L):
+        X=torch.randn(b,3,5)
+        X[0,:,0]=torch.tensor([0.,0.,-2.])
+        Y=G.SO3vec.spharm(L,X)
+        assert Y.tau()=={l:5 for l in range(L+1)}
+        for l in range(L+1):
+            assert torch.allclose(Y.parts[l],G.SO3part.spharm(l,X))
+        if L>0:
+            x,y,z=X[:,0],X[:,1],X[:,2]
+            r=torch.sqrt(x*x+y*y+z*z)
+            c=math.sqrt(3/(4*math.pi))
+            assert torch.allclose(Y.parts[1][:,1],(c*z/r).to(torch.complex64),atol=1e-5)
+            assert torch.allclose(Y.parts[1][:,2],(-c/math.sqrt(2)*torch.complex(x,y)/r),atol=1e-5)
+
+
+    @pytest.mark.parametrize('b', [1, 2])
+    @pytest.mark.parametrize('L', [1, 4])
+    def test_spharm_backprop(self,b,L):
+        X=torch.randn(b,3,6)
+        X[0,:,0]=torch.tensor([0.,0.,1.5])
+        X.requires_grad_()
+        Y=G.SO3vec.spharm(L,X)
+        test_vec=G.SO3vec.randn_like(Y)
+        loss=Y.odot(test_vec)
+        loss.backward(torch.tensor(1.0))
+
+        eps=1e-3*torch.randn_like(X)
+        xloss=G.SO3vec.spharm(L,X.detach()+eps).odot(test_vec)
+        assert(torch.allclose(xloss-loss,torch.sum(eps*X.grad),rtol=2e-2, atol=2e-4))
+
@@ -1,5 +1,6 @@
 import torch
 import gelib as G
+import gelib_base as gb
 import pytest
 
 class TestSO3vecArr(object):
@@ -120,3 +121,127 @@ class TestSO3vecArr(object):
         self.vec_vec_backprop_bcast(b,[a,a],tau,G.CGproduct)
         return
 
+    @pytest.mark.parametrize('fn', [G.CGproduct, G.DiagCGproduct])
+    @pytest.mark.parametrize('nthreads', [1, 3])
+    def test_CGproduct_backprop_fused(self,fn,nthreads):
+        tau={0:3,1:3,2:3}
+        x=G.SO3vecArr.randn(1,[4,5],tau)
+        y=G.SO3vecArr.randn(3,[4,5],tau)
+        test_vec=G.SO3vecArr.randn_like(fn(x,y))
+        with G.num_threads(nthreads):
+            x.requires_grad_()
+            y.requires_grad_()
+            fn(x,y).odot(test_vec).backward(torch.tensor(1.0))
+            xr=G.SO3vecArr(*[p.detach().clone().requires_grad_() for p in x.parts.values()])
+            yr=G.SO3vecArr(*[p.detach().clone().requires_grad_() for p in y.parts.values()])
+            fn(xr,G.SO3vecArr(*[p.detach() for p in y.parts.values()])).odot(test_vec).backward(torch.tensor(1.0))
+            fn(G.SO3vecArr(*[p.detach() for p in x.parts.values()]),yr).odot(test_vec).backward(torch.tensor(1.0))
+        for l in tau:
+            assert torch.allclose(x.parts[l].grad,xr.parts[l].grad,rtol=1e-4,atol=1e-4)
+            assert torch.allclose(y.parts[l].grad,yr.parts[l].grad,rtol=1e-4,atol=1e-4)
+
+
+    @pytest.mark.parametrize('bx,by', [(1,3),(3,1),(2,2)])
+    @pytest.mark.parametrize('xgrid', [True, False])
+    @pytest.mark.parametrize('diag', [False, True])
+    def test_CGproduct_paths_promotion(self,bx,by,xgrid,diag):
+        tau_x={0:2,1:2,2:2}
+        tau_y={0:2,1:2,2:2} if diag else {0:1,1:3}
+        gdims=[2,3]
+        x=list((G.SO3vecArr.randn(bx,gdims,tau_x) if xgrid else G.SO3vec.randn(bx,tau_x)).parts.values())
+        y=list(G.SO3vecArr.randn(by,gdims,tau_y).parts.values())
+        b=max(bx,by)
+        paths=[(l1,l2,l) for l1 in tau_x for l2 in tau_y for l in range(abs(l1-l2),l1+l2+1)]
+        tau={}
+        for l1,l2,l in paths:
+            tau[l]=tau.get(l,0)+(tau_x[l1] if diag else tau_x[l1]*tau_y[l2])
+
+        # fused products over all paths, with x promoted to the batch and grid of y or vice versa
+        r=[torch.zeros([b]+gdims+[2*l+1,n],dtype=torch.cfloat) for l,n in sorted(tau.items())]
+        g=[torch.randn_like(p) for p in r]
+        xg=[torch.zeros_like(p) for p in x]
+        yg=[torch.zeros_like(p) for p in y]
+        _x,_y,_g=gb.SO3vec.view(x),gb.SO3vec.view(y),gb.SO3vec.view(g)
+        if diag:
+            gb.SO3vec.view(r).addDiagCGproduct(_x,_y)
+            gb.SO3vec.view(xg).addDiagCGproduct_back0(_g,_y)
+            gb.SO3vec.view(yg).addDiagCGproduct_back1(_g,_x)
+        else:
+            gb.SO3vec.view(r).addCGproduct(_x,_y)
+            gb.SO3vec.view(xg).addCGproduct_back0(_g,_y)
+            gb.SO3vec.view(yg).addCGproduct_back1(_g,_x)
+
+        # per path products of explicitly broadcast copies
+        xr=[p.detach().clone().requires_grad_() for p in x]
+        yr=[p.detach().clone().requires_grad_() for p in y]
+        zr={}
+        for l1,l2,l in paths:
+            u=xr[l1] if xgrid else xr[l1].unsqueeze(1).unsqueeze(1)
+            u=G.SO3partArr(u.expand([b]+gdims+list(u.shape[-2:])).contiguous())
+            v=yr[l2].expand([b]+gdims+list(yr[l2].shape[-2:])).contiguous()
+            z=u.DiagCGproduct(v,l) if diag else u.CGproduct(v,l)
+            zr[l]=torch.cat([zr[l],z],-1) if l in zr else z
+        loss=sum([torch.sum(torch.view_as_real(zr[l])*torch.view_as_real(g[i])) for i,l in enumerate(sorted(zr))])
+        loss.backward()
+
+        for i,l in enumerate(sorted(zr)):
+            assert torch.allclose(r[i],zr[l],rtol=1e-4,atol=1e-5)
+        for p,q in zip(xg+yg,xr+yr):
+            assert torch.allclose(p,q.grad,rtol=1e-4,atol=1e-4)
+
+
+    @pytest.mark.parametrize('b', [1, 2])
+    def test_spharm(self,b):
+        X=torch.randn(b,2,3,3,4)
+        Y=G.SO3vecArr.spharm(3,X)
+        assert Y.tau()=={l:4 for l in range(4)}
+        for l in range(4):
+            assert torch.allclose(Y.parts[l],G.SO3partArr.spharm(l,X))
+
+
+
+    @pytest.mark.parametrize('b', [1, 2])
+    @pytest.mark.parametrize('diag', [False, True])
+    def test_gather_CGproduct(self,b,diag):
+        N,E=5,12
+        src=torch.randint(0,N,(E,))
+        gmap=gb.gather_map.from_matrix(torch.stack([src,torch.arange(E)],1).int(),N,E)
+        tau={l:2 for l in range(3)}
+        x=G.SO3vecArr.randn(b,[N],tau)
+        y=G.SO3vecArr.randn(b,[E],tau)
+        x.requires_grad_()
+        y.requires_grad_()
+        z=x.gather_DiagCGproduct(y,gmap,3) if diag else x.gather_CGproduct(y,gmap,3)
+        xs=G.SO3vecArr(*[G.SO3partArr(p[:,src]) for p in x.parts.values()])
+        zr=G.DiagCGproduct(xs,y,3) if diag else G.CGproduct(xs,y,3)
+        assert z.tau()==zr.tau()
+        for l in zr.parts:
+            assert torch.allclose(z.parts[l],zr.parts[l],rtol=1e-4,atol=1e-5)
+
+        test_vec=G.SO3vecArr.randn_like(z)
+        inputs=list(x.parts.values())+list(y.parts.values())
+        grads=torch.autograd.grad(z.odot(test_vec),inputs)
+        rgrads=torch.autograd.grad(zr.odot(test_vec),inputs)
+        for g,rg in zip(grads,rgrads):
+            assert torch.allclose(g,rg,rtol=1e-4,atol=1e-4)
+
+
+    @pytest.mark.parametrize('basis', ['bessel', 'gaussian'])
+    @pytest.mark.parametrize('envelope', ['none', 'cosine', 'polynomial'])
+    def test_edge_embedding(self,basis,envelope):
+        radial=G.SO3radialBasis(basis,4,3.0,envelope)
+        X=1.5*torch.randn(2,6,3)
+        Z=G.SO3vecArr.edge_embedding(2,X,radial)
+        assert Z.tau()=={0:4,1:4,2:4}
+        Y=G.SO3vecArr.spharm(2,X.unsqueeze(-1))
+        R=torch.tensor([radial(r)[0] for r in X.norm(dim=-1).flatten().tolist()]).view(2,6,1,4)
+        for l in range(3):
+            assert torch.allclose(Z.parts[l],Y.parts[l]*R,rtol=1e-4,atol=1e-5)
+
+        X.requires_grad_()
+        test_vec=G.SO3vecArr.randn_like(Z)
+        loss=G.SO3vecArr.edge_embedding(2,X,radial).odot(test_vec)
+        loss.backward(torch.tensor(1.0))
+        eps=1e-3*torch.randn_like(X)
+        xloss=G.SO3vecArr.edge_embedding(2,X.detach()+eps,radial).odot(test_vec)
+        assert(torch.allclose(xloss-loss,torch.sum(eps*X.grad),rtol=2e-2, atol=2e-4))
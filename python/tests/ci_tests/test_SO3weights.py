@@ -0,0 +1,200 @@
+import torch
+import gelib as G
+import pytest
+
+
+class TestSO3weights(object):
+
+    @pytest.mark.parametrize('b', [1, 3])
+    @pytest.mark.parametrize('L', [0, 2, 6])
+    def test_linear(self,b,L):
+        tau_in={l:l+2 for l in range(L+1)}
+        tau_out={l:3 for l in range(L+1)}
+        x=G.SO3vec.randn(b,tau_in)
+        W=G.SO3weights.randn(tau_in,tau_out)
+        z=x.linear(W)
+        assert z.tau()==tau_out
+        for l in range(L+1):
+            assert torch.allclose(z.parts[l],torch.matmul(x.parts[l],W.parts[l]),rtol=1e-4,atol=1e-5)
+
+    @pytest.mark.parametrize('L', [1, 3])
+    def test_linear_arr(self,L):
+        tau_in={l:4 for l in range(L+1)}
+        tau_out={l:2*l+1 for l in range(L+1)}
+        x=G.SO3vecArr.randn(2,[3,2],tau_in)
+        W=G.SO3weights.randn(tau_in,tau_out)
+        z=W(x)
+        for l in range(L+1):
+            assert torch.allclose(z.parts[l],torch.matmul(x.parts[l],W.parts[l]),rtol=1e-4,atol=1e-5)
+
+    def test_linear_packed(self):
+        tau={0:3,1:2,2:4}
+        x=G.SO3vec.randn(2,tau).pack()
+        W=G.SO3weights.randn(tau,tau)
+        z=x.linear(W)
+        for l in tau:
+            assert torch.allclose(z.parts[l],torch.matmul(x.parts[l],W.parts[l]),rtol=1e-4,atol=1e-5)
+
+    def test_linear_equivariance(self):
+        tau={0:2,1:3,2:2}
+        x=G.SO3vec.randn(1,tau)
+        W=G.SO3weights.randn(tau,{0:1,1:4,2:3})
+        R=G.SO3element.random()
+        assert torch.allclose(W(x.apply(R)).parts[2],W(x).apply(R).parts[2],rtol=1e-3,atol=1e-4)
+
+    @pytest.mark.parametrize('L', [0, 2])
+    def test_linear_backprop(self,L):
+        tau_in={l:3 for l in range(L+1)}
+        tau_out={l:l+1 for l in range(L+1)}
+        x=G.SO3vec.randn(2,tau_in)
+        W=G.SO3weights.randn(tau_in,tau_out)
+        x.requires_grad_()
+        W.requires_grad_()
+        z=x.linear(W)
+        test_vec=G.SO3vec.randn_like(z)
+        loss=z.odot(test_vec)
+        loss.backward(torch.tensor(1.0))
+
+        xr=[p.detach().clone().requires_grad_() for p in x.parts.values()]
+        wr=[w.detach().clone().requires_grad_() for w in W.parts.values()]
+        lossr=sum([torch.sum(torch.view_as_real(torch.matmul(p,w))*torch.view_as_real(t))
+                   for p,w,t in zip(xr,wr,test_vec.parts.values())])
+        lossr.backward()
+        for p,q in zip(x.parts.values(),xr):
+            assert torch.allclose(p.grad,q.grad,rtol=1e-4,atol=1e-5)
+        for w,q in zip(W.parts.values(),wr):
+            assert torch.allclose(w.grad,q.grad,rtol=1e-4,atol=1e-5)
+
+    def test_linear_strided(self):
+        tau={0:3,1:2,2:4}
+        x=G.SO3vecArr.randn(2,[3],tau).pack()
+        W=G.SO3weights({l:torch.randn([5,n],dtype=torch.cfloat).t().conj().requires_grad_() for l,n in tau.items()})
+        z=W(x)
+        test_vec=G.SO3vecArr.randn_like(z)
+        z.odot(test_vec).backward(torch.tensor(1.0))
+        wr=[w.detach().clone().requires_grad_() for w in W.parts.values()]
+        lossr=sum([torch.sum(torch.view_as_real(torch.matmul(p,w))*torch.view_as_real(t))
+                   for p,w,t in zip(x.parts.values(),wr,test_vec.parts.values())])
+        lossr.backward()
+        for l,w in zip(tau,wr):
+            assert torch.allclose(z.parts[l],torch.matmul(x.parts[l],w.detach()),rtol=1e-4,atol=1e-5)
+            assert torch.allclose(W.parts[l].grad,w.grad,rtol=1e-4,atol=1e-5)
+        assert all([p.grad is None for p in x.parts.values()])
+
+
+class TestSO3CGweights(object):
+
+    def reference(self,x,y,W):
+        r={l:0 for l in W.tau}
+        for (l1,l2,l),w in zip(W.paths,W.weights):
+            z=x.parts[l1].CGproduct(y.parts[l2],l)
+            z=z.reshape(list(z.size()[:-1])+[w.size(0),w.size(1)])
+            r[l]=r[l]+torch.einsum('...muv,uvw->...mw',z,w)
+        return r
+
+    @pytest.mark.parametrize('b', [1, 2])
+    @pytest.mark.parametrize('maxl', [1, 3])
+    def test_weighted_CGproduct(self,b,maxl):
+        tau_x={0:2,1:3,2:2}
+        tau_y={0:1,1:2}
+        tau={l:4 for l in range(maxl+1)}
+        x=G.SO3vec.randn(b,tau_x)
+        y=G.SO3vec.randn(b,tau_y)
+        W=G.SO3CGweights.randn(tau_x,tau_y,tau)
+        z=x.weighted_CGproduct(y,W)
+        r=self.reference(x,y,W)
+        assert z.tau()==tau
+        for l in tau:
+            assert torch.allclose(z.parts[l],r[l],rtol=1e-3,atol=1e-4)
+
+    def test_weighted_CGproduct_arr(self):
+        tau_x={0:2,1:2}
+        tau_y={1:3}
+        tau={0:2,1:3,2:1}
+        x=G.SO3vecArr.randn(2,[3],tau_x)
+        y=G.SO3vecArr.randn(2,[3],tau_y)
+        W=G.SO3CGweights.randn(tau_x,tau_y,tau)
+        z=W(x,y)
+        r=self.reference(x,y,W)
+        for l in tau:
+            assert torch.allclose(z.parts[l],r[l],rtol=1e-3,atol=1e-4)
+
+    def test_weighted_CGproduct_backprop(self):
+        tau_x={0:2,1:3}
+        tau_y={1:2,2:1}
+        tau={0:3,1:2,2:2,3:1}
+        x=G.SO3vec.randn(2,tau_x)
+        y=G.SO3vec.randn(2,tau_y)
+        W=G.SO3CGweights.randn(tau_x,tau_y,tau)
+        x.requires_grad_()
+        y.requires_grad_()
+        W.requires_grad_()
+        z=x.weighted_CGproduct(y,W)
+        test_vec=G.SO3vec.randn_like(z)
+        loss=z.odot(test_vec)
+        loss.backward(torch.tensor(1.0))
+
+        xr=G.SO3vec(*[p.detach().clone().requires_grad_() for p in x.parts.values()])
+        yr=G.SO3vec(*[p.detach().clone().requires_grad_() for p in y.parts.values()])
+        Wr=G.SO3CGweights(tau_x,tau_y,tau,[w.detach().clone().requires_grad_() for w in W.weights])
+        r=self.reference(xr,yr,Wr)
+        lossr=sum([torch.sum(torch.view_as_real(r[l])*torch.view_as_real(test_vec.parts[l])) for l in tau])
+        lossr.backward()
+        for p,q in zip(list(x.parts.values())+list(y.parts.values())+W.weights,
+                       list(xr.parts.values())+list(yr.parts.values())+Wr.weights):
+            assert torch.allclose(p.grad,q.grad,rtol=1e-3,atol=1e-4)
+
+
+class TestSO3DiagCGweights(object):
+
+    def reference(self,x,y,W):
+        r={}
+        for (l1,l2,l),w in zip(W.paths,W.weights):
+            z=x.parts[l1].DiagCGproduct(y.parts[l2],l)*w
+            r[l]=torch.cat([r[l],z],-1) if l in r else z
+        return r
+
+    @pytest.mark.parametrize('b', [1, 2])
+    @pytest.mark.parametrize('maxl', [-1, 2])
+    def test_weighted_DiagCGproduct(self,b,maxl):
+        tau={0:3,1:3,2:3}
+        x=G.SO3vec.randn(b,tau)
+        y=G.SO3vec.randn(b,tau)
+        W=G.SO3DiagCGweights.randn(tau,tau,maxl)
+        z=x.weighted_DiagCGproduct(y,W)
+        r=self.reference(x,y,W)
+        assert z.tau()==W.tau()
+        for l in r:
+            assert torch.allclose(z.parts[l],r[l],rtol=1e-3,atol=1e-4)
+
+    def test_weighted_DiagCGproduct_ones(self):
+        tau={0:4,1:4}
+        x=G.SO3vecArr.randn(2,[3],tau)
+        y=G.SO3vecArr.randn(2,[3],tau)
+        z=G.SO3DiagCGweights.ones(tau,tau)(x,y)
+        zr=x.DiagCGproduct(y)
+        for l in zr.parts:
+            assert torch.allclose(z.parts[l],zr.parts[l],rtol=1e-3,atol=1e-4)
+
+    def test_weighted_DiagCGproduct_backprop(self):
+        tau={0:2,1:2,2:2}
+        x=G.SO3vec.randn(2,tau)
+        y=G.SO3vec.randn(2,tau)
+        W=G.SO3DiagCGweights.randn(tau,tau,2)
+        x.requires_grad_()
+        y.requires_grad_()
+        W.requires_grad_()
+        z=x.weighted_DiagCGproduct(y,W)
+        test_vec=G.SO3vec.randn_like(z)
+        loss=z.odot(test_vec)
+        loss.backward(torch.tensor(1.0))
+
+        xr=G.SO3vec(*[p.detach().clone().requires_grad_() for p in x.parts.values()])
+        yr=G.SO3vec(*[p.detach().clone().requires_grad_() for p in y.parts.values()])
+        Wr=G.SO3DiagCGweights(tau,tau,2,[w.detach().clone().requires_grad_() for w in W.weights])
+        r=self.reference(xr,yr,Wr)
+        lossr=sum([torch.sum(torch.view_as_real(r[l])*torch.view_as_real(test_vec.parts[l])) for l in r])
+        lossr.backward()
+        for p,q in zip(list(x.parts.values())+list(y.parts.values())+W.weights,
+                       list(xr.parts.values())+list(yr.parts.values())+Wr.weights):
+            assert torch.allclose(p.grad,q.grad,rtol=1e-3,atol=1e-4)
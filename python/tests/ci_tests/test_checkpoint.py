@@ -0,0 +1,97 @@
+import torch
+import gelib as G
+import pytest
+
+
+class TestCheckpoint(object):
+
+    def make_layers(self,x,nlayers):
+        tau=x.tau()
+        W=G.SO3weights.randn(G.DiagCGproduct(x,x,maxl=2).tau(),tau)
+        for w in W.parts.values():
+            w.data*=0.1
+        W.requires_grad_()
+        return W,[lambda v: W(G.DiagCGproduct(v,v,maxl=2))]*nlayers
+
+    def grads(self,layers,x,W,checkpointed):
+        params=list(x.parts.values())+list(W.parts.values())
+        for p in params:
+            p.grad=None
+        z=G.checkpoint_chain(layers,x,checkpointed)
+        z.odot(z).backward(torch.tensor(1.0))
+        return z,[p.grad.clone() for p in params]
+
+    @pytest.mark.parametrize('arr', [False, True])
+    @pytest.mark.parametrize('checkpointed', [None, [True,False,True]])
+    def test_checkpoint_chain(self,arr,checkpointed):
+        tau={0:4,1:4,2:4}
+        x=G.SO3vecArr.randn(2,[3,3],tau) if arr else G.SO3vec.randn(3,tau)
+        x.requires_grad_()
+        W,layers=self.make_layers(x,3)
+        z0,g0=self.grads(layers,x,W,[False]*3)
+        z1,g1=self.grads(layers,x,W,checkpointed)
+        assert type(z1)==type(x)
+        assert list(z1.parts.keys())==list(z0.parts.keys())
+        for l in z0.parts:
+            assert torch.equal(z0.parts[l],z1.parts[l])
+        for a,b in zip(g0,g1):
+            assert torch.allclose(a,b,rtol=1e-4,atol=1e-5)
+
+    def test_checkpoint_CGproduct(self):
+        tau={0:2,1:3}
+        x=G.SO3vec.randn(2,tau)
+        y=G.SO3vec.randn(2,tau)
+        x.requires_grad_()
+        y.requires_grad_()
+        z=G.checkpoint(G.CGproduct,x,y,2)
+        test_vec=G.SO3vec.randn_like(z)
+        z.odot(test_vec).backward(torch.tensor(1.0))
+
+        xr=G.SO3vec(*[p.detach().clone().requires_grad_() for p in x.parts.values()])
+        yr=G.SO3vec(*[p.detach().clone().requires_grad_() for p in y.parts.values()])
+        G.CGproduct(xr,yr,2).odot(test_vec).backward(torch.tensor(1.0))
+        for p,q in zip(list(x.parts.values())+list(y.parts.values()),list(xr.parts.values())+list(yr.parts.values())):
+            assert torch.allclose(p.grad,q.grad,rtol=1e-4,atol=1e-5)
+
+    def test_checkpoint_policy(self):
+        tau={0:4,1:4,2:4}
+        x=G.SO3vecArr.randn(1,[4,4],tau)
+        x.requires_grad_()
+        W,layers=self.make_layers(x,3)
+        _,saved=G.saved_tensor_bytes(layers[0],x)
+        kept=sum([p.untyped_storage().nbytes() for p in x.parts.values()])
+        assert saved>kept
+
+        assert G.checkpoint_policy(layers,x,10**9)==[False]*3
+        assert sum(G.checkpoint_policy(layers,x,3*saved-(saved-kept)))==1
+        assert G.checkpoint_policy(layers,x,3*kept)==[True]*3
+        with pytest.raises(ValueError):
+            G.checkpoint_policy(layers,x,kept)
+
+
+class TestSavedPrecision(object):
+
+    @pytest.mark.parametrize('dtype', [torch.bfloat16, torch.float16])
+    @pytest.mark.parametrize('ckpt', [False, True])
+    def test_saved_precision(self,dtype,ckpt):
+        tau={0:4,1:4,2:4}
+        x=G.SO3vecArr.randn(2,[3,3],tau)
+        x.requires_grad_()
+        W,layers=TestCheckpoint().make_layers(x,2)
+        _,g0=TestCheckpoint().grads(layers,x,W,[False]*2)
+        with G.saved_precision(dtype):
+            _,g1=TestCheckpoint().grads(layers,x,W,[ckpt]*2)
+        for a,b in zip(g0,g1):
+            assert torch.allclose(a,b,rtol=1e-2,atol=1e-2*a.abs().max().item())
+
+    def test_saved_precision_storage(self):
+        P=G.saved_precision(torch.bfloat16)
+        x=torch.randn(2,5,3,dtype=torch.cfloat,requires_grad=True)
+        t=x*2
+        p=P.pack(t)
+        assert p.data.dtype==torch.bfloat16
+        assert p.data.untyped_storage().nbytes()*2==t.untyped_storage().nbytes()
+        assert torch.allclose(P.unpack(p),t,rtol=1e-2,atol=1e-2)
+        assert P.pack(x) is x
+        with pytest.raises(ValueError):
+            G.saved_precision(torch.float32)
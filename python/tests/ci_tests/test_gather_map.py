@@ -0,0 +1,60 @@
+import torch
+import gelib as G
+import gelib_base as gb
+import pytest
+
+
+class TestGatherMap(object):
+
+    @pytest.mark.parametrize('nthreads', [1, 3])
+    def test_from_edge_index(self,nthreads):
+        nt=gb.get_num_threads()
+        gb.set_num_threads(nthreads)
+        N,E=50,20000
+        edge_index=torch.randint(0,N,(2,E))
+        gmap=G.gather_map.from_edge_index(edge_index,N,N)
+        gb.set_num_threads(nt)
+        assert gmap.n_in==N and gmap.n_out==N
+        x=G.SO3partArr.randn(1,[N],1,2)
+        r=torch.zeros_like(x).index_add(1,edge_index[1],x[:,edge_index[0]])
+        assert torch.allclose(x.scatter_reduce(gmap),r,rtol=1e-4,atol=1e-4)
+        y=G.SO3partArr.randn(1,[N],1,2)
+        r=torch.zeros_like(y).index_add(1,edge_index[0],y[:,edge_index[1]])
+        assert torch.allclose(y.scatter_reduce(gmap.inv()),r,rtol=1e-4,atol=1e-4)
+
+    def test_from_edge_index_sizes(self):
+        edge_index=torch.tensor([[0,1,2,2],[1,1,0,3]])
+        gmap=G.gather_map.from_edge_index(edge_index)
+        assert gmap.n_in==3 and gmap.n_out==4
+        with pytest.raises(RuntimeError):
+            G.gather_map.from_edge_index(edge_index,2,4)
+
+    def test_cache(self):
+        edge_index=torch.randint(0,10,(2,30))
+        gmap=G.gather_map.from_edge_index(edge_index,10,10,cache=True)
+        assert G.gather_map.from_edge_index(edge_index,10,10,cache=True) is gmap
+        assert G.gather_map.from_edge_index(edge_index.clone(),10,10,cache=True) is not gmap
+        edge_index[0,0]=(edge_index[0,0]+1)%10
+        assert G.gather_map.from_edge_index(edge_index,10,10,cache=True) is not gmap
+
+    @pytest.mark.parametrize('batched', [False, True])
+    @pytest.mark.parametrize('max_neighbors', [None, 4])
+    def test_radius_graph(self,batched,max_neighbors):
+        N,cutoff=200,1.5
+        pos=3*torch.randn(N,3)
+        batch=torch.randint(0,3,(N,)) if batched else None
+        gmap,edge_index,vec=G.gather_map.radius_graph(pos,cutoff,batch,max_neighbors)
+
+        D=torch.cdist(pos.double(),pos.double())
+        adj=(D<=cutoff)&~torch.eye(N,dtype=torch.bool)
+        if batched:
+            adj&=batch[:,None]==batch[None,:]
+        edges=[]
+        for t in range(N):
+            s=adj[t].nonzero()[:,0]
+            if max_neighbors is not None and len(s)>max_neighbors:
+                s=s[D[t,s].argsort(stable=True)[:max_neighbors]].sort().values
+            edges+=[(j,t) for j in s.tolist()]
+        assert torch.equal(edge_index,torch.tensor(edges).t())
+        assert torch.allclose(vec,pos[edge_index[0]]-pos[edge_index[1]])
+        assert gmap.n_in==N and gmap.n_out==N
@@ -0,0 +1,57 @@
+import torch
+import gelib as G
+import gelib.ops as ops
+import pytest
+
+pytestmark = pytest.mark.skipif(not ops.has_custom_ops, reason="torch.library.custom_op is not available")
+
+
+def randn_parts(b,tau):
+    return [torch.randn(b,2*l+1,n,dtype=torch.complex64,requires_grad=True) for l,n in tau.items()]
+
+
+class TestOps(object):
+
+    @pytest.mark.parametrize('diag', [False, True])
+    def test_SO3part_opcheck(self,diag):
+        x=torch.randn(2,5,3,dtype=torch.complex64,requires_grad=True)
+        y=torch.randn(2,3,3,dtype=torch.complex64,requires_grad=True)
+        torch.library.opcheck(ops.SO3part_CGproduct,(x,y,2,diag))
+
+    @pytest.mark.parametrize('diag', [False, True])
+    def test_SO3part_opcheck_frozen(self,diag):
+        x=torch.randn(2,5,3,dtype=torch.complex64)
+        y=torch.randn(2,3,3,dtype=torch.complex64,requires_grad=True)
+        torch.library.opcheck(ops.SO3part_CGproduct,(x,y,2,diag))
+        torch.library.opcheck(ops.SO3part_CGproduct_backward,(torch.randn(2,5,3 if diag else 9,dtype=torch.complex64),x,y.detach(),diag,False,True))
+
+    def test_SO3vec_opcheck_frozen(self):
+        tau={0:2,1:2}
+        x=randn_parts(2,tau)
+        y=[p.detach() for p in randn_parts(2,tau)]
+        torch.library.opcheck(ops.SO3vec_CGproduct,(x,y,[0,1],[0,1],-1,False))
+
+    @pytest.mark.parametrize('maxl', [-1, 2])
+    @pytest.mark.parametrize('diag', [False, True])
+    def test_SO3vec_opcheck(self,maxl,diag):
+        tau={0:2,1:2,2:2}
+        x=randn_parts(2,tau)
+        y=randn_parts(2,tau)
+        torch.library.opcheck(ops.SO3vec_CGproduct,(x,y,[0,1,2],[0,1,2],maxl,diag))
+
+    def test_SO3vec_matches_type(self):
+        tau={0:1,1:2,2:1}
+        x=G.SO3vec.randn(1,tau)
+        y=G.SO3vec.randn(1,tau)
+        z=G.CGproduct(x,y,maxl=3)
+        assert z.tau()==ops.CGproduct_type(tau,tau,3)
+
+    def test_compile(self):
+        tau={0:2,1:2}
+        x=randn_parts(2,tau)
+        y=randn_parts(2,tau)
+        def f(x,y):
+            z=ops.SO3vec_CGproduct(x,y,[0,1],[0,1],2,False)
+            return sum([torch.view_as_real(p).pow(2).sum() for p in z])
+        cf=torch.compile(f,fullgraph=True,backend="aot_eager")
+        assert torch.allclose(f(x,y),cf(x,y))
@@ -0,0 +1,53 @@
+import torch
+import gelib as G
+import pytest
+
+class TestPacked(object):
+
+    def test_zero_copy(self):
+        x = G.SO3vec.randn(2,{0:2,1:3,2:1}).pack()
+        assert x.is_packed()
+        assert x.pack() is x
+        x.parts[1][0,0,0]=7.0
+        assert x.buffer[0,2]==7.0
+        y = G.SO3vec.from_packed(x.buffer,x.tau())
+        for l in x.parts:
+            assert y.parts[l].data_ptr()==x.parts[l].data_ptr()
+
+    @pytest.mark.parametrize('b', [1, 2])
+    @pytest.mark.parametrize('diag', [False, True])
+    def test_SO3vec_CGproduct(self,b,diag):
+        tau={0:2,1:2,2:2}
+        x = G.SO3vec.randn(b,tau)
+        y = G.SO3vec.randn(b,tau)
+        fn=G.DiagCGproduct if diag else G.CGproduct
+        z=fn(x,y,maxl=3)
+        zp=fn(x.pack(),y.pack(),maxl=3)
+        assert zp.is_packed()
+        for l in z.parts:
+            assert torch.allclose(z.parts[l],zp.parts[l])
+
+    @pytest.mark.parametrize('b', [1, 2])
+    @pytest.mark.parametrize('a', [2])
+    @pytest.mark.parametrize('nc', [1, 2])
+    def test_SO3vecArr_backprop(self,b,a,nc):
+        tau={l:nc for l in range(3)}
+        x = G.SO3vecArr.randn(b,[a,a],tau).pack()
+        y = G.SO3vecArr.randn(b,[a,a],tau).pack()
+        x.requires_grad_()
+        y.requires_grad_()
+        z=G.CGproduct(x,y)
+
+        test_vec=G.SO3vecArr.randn_like(z).pack()
+        loss=z.odot(test_vec)
+        loss.backward(torch.tensor(1.0))
+        xgrad=x.get_grad()
+        ygrad=y.get_grad()
+
+        xeps=G.SO3vecArr.randn_like(x).pack()
+        xloss=G.CGproduct(x+xeps,y).odot(test_vec)
+        assert(torch.allclose(xloss-loss,xeps.odot(xgrad),rtol=1e-3, atol=1e-4))
+
+        yeps=G.SO3vecArr.randn_like(y).pack()
+        yloss=G.CGproduct(x,y+yeps).odot(test_vec)
+        assert(torch.allclose(yloss-loss,yeps.odot(ygrad),rtol=1e-3, atol=1e-4))
@@ -0,0 +1,86 @@
+import torch
+import gelib as G
+import pytest
+
+class TestThreads(object):
+
+    def test_num_threads(self):
+        n=G.get_num_threads()
+        with G.num_threads(3):
+            assert G.get_num_threads()==3
+        assert G.get_num_threads()==n
+
+    @pytest.mark.parametrize('b', [1, 2])
+    @pytest.mark.parametrize('nthreads', [2, 5])
+    def test_CGproduct_backprop(self,b,nthreads):
+        tau={0:3,1:4,2:2}
+
+        def run():
+            torch.manual_seed(0)
+            x = G.SO3vecArr.randn(1,[3,2],tau)
+            y = G.SO3vecArr.randn(b,[3,2],tau)
+            x.requires_grad_()
+            y.requires_grad_()
+            z=G.CGproduct(x,y,maxl=2)
+            loss=z.odot(G.SO3vecArr.randn_like(z))
+            loss.backward(torch.tensor(1.0))
+            return z,x.get_grad(),y.get_grad()
+
+        with G.num_threads(1):
+            r1=run()
+        with G.num_threads(nthreads):
+            r2=run()
+        for u,v in zip(r1,r2):
+            for l in u.parts:
+                assert torch.equal(u.parts[l],v.parts[l])
+
+    @pytest.mark.parametrize('fn', [G.CGproduct, G.DiagCGproduct])
+    @pytest.mark.parametrize('frozen', [0, 1])
+    @pytest.mark.parametrize('bx', [1, 3])
+    def test_CGproduct_backprop_reproducible(self,fn,frozen,bx):
+        tau={0:40,1:40}
+
+        def run(fused=False):
+            torch.manual_seed(0)
+            x = G.SO3vecArr.randn(bx,[2,2],tau)
+            y = G.SO3vecArr.randn(3,[2,2],tau)
+            [x,y][1-frozen].requires_grad_()
+            if fused:
+                [x,y][frozen].requires_grad_()
+            z=fn(x,y,maxl=1)
+            z.odot(G.SO3vecArr.randn_like(z)).backward(torch.tensor(1.0))
+            return [x,y][1-frozen].get_grad()
+
+        with G.num_threads(1):
+            r1=run()
+        with G.num_threads(4):
+            r2=run()
+        r3=run(fused=True)
+        for l in tau:
+            assert torch.equal(r1.parts[l],r2.parts[l])
+            assert torch.allclose(r1.parts[l],r3.parts[l],rtol=1e-4,atol=1e-3)
+
+    @pytest.mark.parametrize('diag', [False, True])
+    @pytest.mark.parametrize('bx', [1, 3])
+    def test_weighted_CGproduct_backprop_reproducible(self,diag,bx):
+        tau={0:6,1:6,2:6}
+
+        def run():
+            torch.manual_seed(0)
+            x = G.SO3vecArr.randn(bx,[3,3],tau)
+            y = G.SO3vecArr.randn(3,[3,3],tau)
+            W = G.SO3DiagCGweights.randn(tau,tau,2) if diag else G.SO3CGweights.randn(tau,tau,tau)
+            x.requires_grad_()
+            y.requires_grad_()
+            W.requires_grad_()
+            z=W(x,y)
+            z.odot(G.SO3vecArr.randn_like(z)).backward(torch.tensor(1.0))
+            return [x.get_grad().parts[l] for l in tau]+[y.get_grad().parts[l] for l in tau]+[w.grad for w in W.weights]
+
+        with G.num_threads(1):
+            r1=run()
+        for n in [3, 4]:
+            with G.num_threads(n):
+                r2=run()
+            for u,v in zip(r1,r2):
+                assert torch.equal(u,v)
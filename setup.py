@@ -101,6 +101,9 @@ def main():
     if compile_with_cuda:
         _cxx_compile_args.extend(['-D_WITH_CUDA', '-D_WITH_CUBLAS'])
 
+    if torch.backends.mkl.is_available():
+        _cxx_compile_args.extend(['-D_WITH_MKL'])
+
     _depends = ['setup.py',
                 'src/gelib.cpp',
                 'bindings/*.cpp'